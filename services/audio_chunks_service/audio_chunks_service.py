@@ -4,9 +4,11 @@ import json
 import os
 import sys
 import logging
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
 import io
+import subprocess
 from pydub import AudioSegment
 from nats.js.api import ObjectMeta
 
@@ -17,19 +19,423 @@ if (parent_dir not in sys.path):
 from common.nats_client import NATSClient
 from common.edgedb_client import EdgedbClient
 from common.token_utils import TokenValidator
+from common.queries.audio_chunks.audio_chunk_upsert_many_async_edgeql import audio_chunk_upsert_many
+from chunk_index import AudioChunk, ChunkIndex, TimelineSegment
+
+
+class ChunkStore:
+    """
+    Reads, writes and deletes chunk files on a thread pool so disk I/O never
+    blocks the event loop. Writes submitted while a batch is being written are
+    collected into the next batch. A batch is spread over the pool by path, so
+    writes to one file keep their order. With fsync a chunk is only reported as
+    written once it is on disk. Where os.posix_fadvise exists, reads hint the
+    kernel that files are read sequentially.
+    """
+
+    def __init__(self, max_workers: int = 4, max_batch_size: int = 64, fsync: bool = False):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.max_workers = max_workers
+        self.max_batch_size = max_batch_size
+        self.fsync = fsync
+        self.fadvise = hasattr(os, 'posix_fadvise')
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chunk-io')
+        self.pending: List[Tuple[str, bytes, asyncio.Future]] = []
+        self.writer: Optional[asyncio.Task] = None
+        self.writes = 0
+        self.batches = 0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def write(self, path: str, data: bytes):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((path, data, future))
+        if self.writer is None:
+            self.writer = asyncio.create_task(self._write_pending())
+        await future
+
+    async def _write_pending(self):
+        try:
+            while self.pending:
+                batch, self.pending = self.pending[:self.max_batch_size], self.pending[self.max_batch_size:]
+                partitions: Dict[int, List[Tuple[str, bytes, asyncio.Future]]] = {}
+                for write in batch:
+                    partitions.setdefault(hash(write[0]) % self.max_workers, []).append(write)
+                results = await asyncio.gather(
+                    *(self._run(self._write_files, [(path, data) for path, data, _ in writes])
+                      for writes in partitions.values()),
+                    return_exceptions=True)
+                for writes, result in zip(partitions.values(), results):
+                    for _, _, future in writes:
+                        if future.done():
+                            continue
+                        if isinstance(result, BaseException):
+                            future.set_exception(result)
+                        else:
+                            future.set_result(None)
+                self.writes += len(batch)
+                self.batches += 1
+        finally:
+            self.writer = None
+
+    def _write_files(self, writes: List[Tuple[str, bytes]]):
+        for path, data in writes:
+            with open(path, 'wb') as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def _read_range(self, path: str, offset: int, size: int) -> bytes:
+        with open(path, 'rb') as f:
+            if self.fadvise:
+                os.posix_fadvise(f.fileno(), offset, 0, os.POSIX_FADV_SEQUENTIAL)
+            return os.pread(f.fileno(), size, offset)
+
+    async def read_range(self, path: str, offset: int, size: int) -> bytes:
+        return await self._run(self._read_range, path, offset, size)
+
+    async def sizes(self, paths: List[str]) -> List[int]:
+        return await self._run(lambda: [os.path.getsize(path) for path in paths])
+
+    async def existing(self, paths: List[str]) -> List[str]:
+        return await self._run(lambda: [path for path in paths if os.path.exists(path)])
+
+    def _delete_files(self, paths: List[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                self.logger.error(f"Error deleting chunk file {path}: {e}")
+
+    async def delete_many(self, paths: List[str]):
+        await self._run(self._delete_files, paths)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class ChunkMetadataWriter:
+    """
+    Write-behind buffer for AudioChunk rows. Chunk changes are collected per
+    recording and upserted in one statement, every flush_interval_s or as soon
+    as a recording has flush_size changed chunks. Only the latest state of a
+    chunk is kept, so a chunk changed twice between flushes is written once.
+    Rows of a recording discarded while they were being written are dropped
+    rather than retried.
+    """
+
+    def __init__(self, client, flush_interval_s: float = 0.5, flush_size: int = 100):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.client = client
+        self.flush_interval_s = flush_interval_s
+        self.flush_size = flush_size
+        # recording id -> chunk id -> row
+        self.pending: Dict[str, Dict[str, dict]] = {}
+        # Created on first use so it binds to the running loop
+        self.lock: Optional[asyncio.Lock] = None
+        self.task: Optional[asyncio.Task] = None
+        # Size-triggered flushes, kept so they are not garbage collected mid-write
+        self.flush_tasks: Set[asyncio.Task] = set()
+        # Recordings in the batch being written and those discarded meanwhile
+        self.writing: Set[str] = set()
+        self.discarded: Set[str] = set()
+        self.flushes = 0
+        self.rows = 0
+
+    def submit(self, chunk: AudioChunk):
+        rows = self.pending.setdefault(chunk.recording_id, {})
+        rows[chunk.chunk_id] = asdict(chunk)
+        if len(rows) >= self.flush_size:
+            task = asyncio.create_task(self.flush(chunk.recording_id))
+            self.flush_tasks.add(task)
+            task.add_done_callback(self.flush_tasks.discard)
+
+    def discard(self, recording_id: str):
+        self.pending.pop(recording_id, None)
+        if recording_id in self.writing:
+            self.discarded.add(recording_id)
+
+    async def flush(self, recording_id: Optional[str] = None):
+        """Write the pending chunks of one recording, or of all of them."""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        # One flush at a time keeps the writes of a chunk in order
+        async with self.lock:
+            recording_ids = [recording_id] if recording_id is not None else list(self.pending)
+            batch = {rid: self.pending.pop(rid) for rid in recording_ids if self.pending.get(rid)}
+            if not batch:
+                return
+            rows = [row for chunks in batch.values() for row in chunks.values()]
+            self.writing = set(batch)
+            try:
+                await audio_chunk_upsert_many(self.client, chunks=json.dumps(rows))
+                self.flushes += 1
+                self.rows += len(rows)
+            except Exception as e:
+                self.logger.error(f"Error writing metadata of {len(rows)} chunks, retrying on next flush: {e}")
+                # Put them back unless a newer state was submitted or the recording was discarded meanwhile
+                for rid, chunks in batch.items():
+                    if rid in self.discarded:
+                        continue
+                    pending = self.pending.setdefault(rid, {})
+                    for chunk_id, row in chunks.items():
+                        pending.setdefault(chunk_id, row)
+            finally:
+                self.writing, self.discarded = set(), set()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval_s)
+            await self.flush()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.flush_tasks:
+            await asyncio.gather(*self.flush_tasks, return_exceptions=True)
+        await self.flush()
+
+
+class ChunkStream:
+    """
+    Streams chunk files to a client's inbox as raw message payloads, at most
+    payload_size bytes each, with the position in the 'Chunk-Index' and
+    'Offset' headers. The client grants credits, one per message, by
+    publishing {"credits": n} to credit_subject, or {"cancel": true} to stop.
+    Sending pauses while no credits are left, and the stream is abandoned
+    once the client has granted none for idle_timeout_s. The end of the
+    stream is an empty message with a 'Stream-End' header.
+    """
+
+    def __init__(self, nats_client, chunk_store: 'ChunkStore', inbox: str, paths: List[str], sizes: List[int],
+                 credits: int, payload_size: int, idle_timeout_s: float):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.nc = nats_client.nc
+        self.chunk_store = chunk_store
+        self.inbox = inbox
+        self.paths = paths
+        self.sizes = sizes
+        self.credits = credits
+        self.payload_size = payload_size
+        self.idle_timeout_s = idle_timeout_s
+        self.credit_subject = self.nc.new_inbox()
+        self.credited = asyncio.Event()
+        self.cancelled = False
+        self.subscription = None
+
+    async def open(self):
+        """Start taking credits, before the client learns the credit subject."""
+        self.subscription = await self.nc.subscribe(self.credit_subject, cb=self.handle_credit)
+
+    async def handle_credit(self, msg):
+        try:
+            data = json.loads(msg.data.decode())
+            self.credits += int(data.get('credits', 0))
+            self.cancelled = self.cancelled or bool(data.get('cancel'))
+            self.credited.set()
+        except Exception as e:
+            self.logger.error(f"Invalid credit message: {e}")
+
+    async def _take_credit(self) -> bool:
+        while self.credits <= 0 and not self.cancelled:
+            self.credited.clear()
+            try:
+                await asyncio.wait_for(self.credited.wait(), self.idle_timeout_s)
+            except asyncio.TimeoutError:
+                return False
+        self.credits -= 1
+        return not self.cancelled
+
+    async def run(self, start_index: int = 0, start_offset: int = 0):
+        try:
+            for index in range(start_index, len(self.paths)):
+                offset = start_offset if index == start_index else 0
+                while True:
+                    if not await self._take_credit():
+                        self.logger.info(f"Stream to {self.inbox} stopped at chunk {index}, offset {offset}")
+                        return
+                    data = await self.chunk_store.read_range(self.paths[index], offset, self.payload_size)
+                    await self.nc.publish(self.inbox, data, headers={
+                        'Chunk-Index': str(index),
+                        'Offset': str(offset),
+                    })
+                    offset += len(data)
+                    if not data or offset >= self.sizes[index]:
+                        break
+            await self.nc.publish(self.inbox, b'', headers={'Stream-End': 'true'})
+        except Exception as e:
+            self.logger.error(f"Error streaming chunks to {self.inbox}: {e}")
+            try:
+                await self.nc.publish(self.inbox, b'', headers={'Stream-End': 'true', 'Error': str(e)})
+            except Exception as e:
+                self.logger.error(f"Error ending stream to {self.inbox}: {e}")
+        finally:
+            await self.subscription.unsubscribe()
+
+
+class ConcatFileReader(io.RawIOBase):
+    """Reads a list of files back to back as one stream, one file open at a time."""
+
+    def __init__(self, paths: List[str]):
+        super().__init__()
+        self._paths = list(paths)
+        self._current = None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self._current is not None or self._paths:
+            if self._current is None:
+                self._current = open(self._paths.pop(0), 'rb')
+            n = self._current.readinto(buffer)
+            if n:
+                return n
+            self._current.close()
+            self._current = None
+        return 0
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+        super().close()
+
+
+class ProgressiveEncoder:
+    """
+    Encodes every chunk to an MP3 segment next to its .webm file as soon as it
+    arrives, so once all segments exist a combine is a plain copy into the
+    Object Store instead of a re-encode.
+
+    Copied segments are not gapless. Every segment starts with the encoder delay
+    of libmp3lame (1105 samples) and its end is padded to a whole frame (up to
+    1151 samples), so each one plays about 23-47 ms longer than its chunk at
+    48 kHz, and a recording of 100 chunks drifts by 2-5 s against the
+    re-encoded one, with a short silence at every chunk boundary. The segments
+    are CBR, so segments_for measures that drift from their sizes and returns
+    None, falling back to the re-encode, once it exceeds max_drift_s.
+    """
+
+    def __init__(self, bitrate: str, max_concurrent: int = 2, max_drift_s: float = 0.25):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.bitrate = bitrate
+        self.bits_per_second = int(bitrate.rstrip('k')) * 1000 if bitrate.endswith('k') else int(bitrate)
+        self.max_concurrent = max_concurrent
+        self.max_drift_s = max_drift_s
+        # Created on first use so it binds to the running loop (python 3.9 binds at construction)
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.tasks: Dict[str, Dict[str, asyncio.Task]] = {}
+
+    @staticmethod
+    def segment_path(chunk_path: str) -> str:
+        return os.path.splitext(chunk_path)[0] + '.mp3'
+
+    def submit(self, chunk: 'AudioChunk'):
+        tasks = self.tasks.setdefault(chunk.recording_id, {})
+        previous = tasks.get(chunk.chunk_id)
+        if previous and not previous.done():
+            previous.cancel()
+        tasks[chunk.chunk_id] = asyncio.create_task(self.encode(chunk.data_path))
+
+    async def encode(self, chunk_path: str) -> bool:
+        segment_path = self.segment_path(chunk_path)
+        partial_path = segment_path + '.part'
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        async with self.semaphore:
+            process = await asyncio.create_subprocess_exec(
+                'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+                '-i', chunk_path,
+                '-vn', '-codec:a', 'libmp3lame', '-b:a', self.bitrate,
+                '-write_xing', '0', '-id3v2_version', '0',
+                '-f', 'mp3', partial_path,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                _, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                # Replaced or discarded, don't leave ffmpeg or its partial segment behind
+                if process.returncode is None:
+                    process.kill()
+                await process.wait()
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise
+
+        if process.returncode != 0:
+            self.logger.error(f"Error encoding segment for {chunk_path}: {stderr.decode(errors='replace')}")
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            return False
+
+        os.replace(partial_path, segment_path)
+        return True
+
+    def duration(self, paths: List[str]) -> Optional[float]:
+        """Seconds of audio in the CBR segments, None if any is missing."""
+        try:
+            return sum(os.path.getsize(path) for path in paths) * 8 / self.bits_per_second
+        except FileNotFoundError:
+            return None
+
+    async def segments_for(self, recording_id: str, chunks: List['AudioChunk']) -> Optional[List[str]]:
+        """
+        Wait for outstanding encodes and return the segment paths, or None if any
+        is missing or the segments drift too far from the chunks' timing.
+        """
+        tasks = list(self.tasks.get(recording_id, {}).values())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        paths = [self.segment_path(chunk.data_path) for chunk in chunks]
+        duration = await asyncio.to_thread(self.duration, paths)
+        if duration is None:
+            return None
+        drift = duration - sum(chunk.end_time - chunk.start_time for chunk in chunks)
+        if abs(drift) > self.max_drift_s:
+            self.logger.info(f"Progressive segments of recording {recording_id} drift by {drift:.3f}s")
+            return None
+        return paths
+
+    def discard(self, recording_id: str):
+        for task in self.tasks.pop(recording_id, {}).values():
+            if not task.done():
+                task.cancel()
 
-@dataclass
-class AudioChunk:
-    chunk_id: str
-    recording_id: str
-    start_time: float
-    end_time: float
-    status: str
-    data_path: str
 
 class AudioChunkManager:
     CHUNKS_PATH = 'audio_chunks'
     OBJECT_STORE_NAME = 'audio-recordings'
+    # 'stream' pipes the chunks through a single ffmpeg process straight into the
+    # object store, 'pydub' keeps the old decode-everything-in-memory behaviour.
+    COMBINE_MODE = os.environ.get('AUDIO_COMBINE_MODE', 'stream')
+    COMBINE_BITRATE = '192k'
+    # Encode chunks while the recording is still running so combine only has to finalize
+    PROGRESSIVE_COMBINE = os.environ.get('AUDIO_PROGRESSIVE_COMBINE', 'true') == 'true'
+    # Copied segments run longer than their chunks, past this a combine re-encodes instead
+    PROGRESSIVE_MAX_DRIFT_S = float(os.environ.get('AUDIO_PROGRESSIVE_MAX_DRIFT_MS', 250)) / 1000
+    IO_WORKERS = int(os.environ.get('AUDIO_CHUNK_IO_WORKERS', 4))
+    WRITE_BATCH_SIZE = int(os.environ.get('AUDIO_CHUNK_WRITE_BATCH_SIZE', 64))
+    # Only acknowledge a chunk once it is on disk
+    FSYNC_CHUNKS = os.environ.get('AUDIO_CHUNK_FSYNC', 'false') == 'true'
+    METADATA_FLUSH_INTERVAL_S = float(os.environ.get('AUDIO_CHUNK_METADATA_FLUSH_MS', 500)) / 1000
+    METADATA_FLUSH_SIZE = int(os.environ.get('AUDIO_CHUNK_METADATA_FLUSH_SIZE', 100))
+    # Messages a client may have outstanding unless it asks for another window
+    STREAM_WINDOW = int(os.environ.get('AUDIO_CHUNK_STREAM_WINDOW', 16))
+    STREAM_IDLE_TIMEOUT_S = float(os.environ.get('AUDIO_CHUNK_STREAM_IDLE_TIMEOUT_S', 30))
+    # Left over in every message for the headers
+    STREAM_HEADER_ROOM = 1024
     
     def __init__(self):
         self.logger = logging.getLogger(self.__class__.__name__)
@@ -37,14 +443,20 @@ class AudioChunkManager:
         self.db = EdgedbClient()
         self.client = self.db.client
         self.token_validator = TokenValidator()
-        self.chunks: Dict[str, List[AudioChunk]] = {}
         self.object_store = None
+        self.progressive_encoder = ProgressiveEncoder(self.COMBINE_BITRATE, max_drift_s=self.PROGRESSIVE_MAX_DRIFT_S)
+        self.chunk_store = ChunkStore(self.IO_WORKERS, self.WRITE_BATCH_SIZE, self.FSYNC_CHUNKS)
+        self.metadata_writer = ChunkMetadataWriter(self.client, self.METADATA_FLUSH_INTERVAL_S, self.METADATA_FLUSH_SIZE)
+        self.streams: Set[asyncio.Task] = set()
         
         if not os.path.exists(self.CHUNKS_PATH):
             os.makedirs(self.CHUNKS_PATH)
+        self.chunk_index = ChunkIndex(self.CHUNKS_PATH)
 
     async def connect(self):
         await self.nats_client.connect()
+        await self.nats_client.create_pipeline_stream()
+        await self.token_validator.subscribe_revocations(self.nats_client)
         
         # Initialize Object Store only
         js = self.nats_client.nc.jetstream()
@@ -53,16 +465,16 @@ class AudioChunkManager:
         except:
             self.object_store = await js.create_object_store(self.OBJECT_STORE_NAME)
         
+        self.metadata_writer.start()
         await self.nats_client.subscribe('audio.chunks', self.handle_chunk)
         await self.nats_client.subscribe('audio.chunks.get', self.handle_get_chunks)
         await self.nats_client.subscribe('audio.chunks.edit', self.handle_edit_chunks)
         await self.nats_client.subscribe('audio.chunks.delete', self.handle_delete_all_chunks)
         await self.nats_client.subscribe('audio.chunks.combine', self.handle_combine_chunks)
 
-    def save_chunk(self, recording_id: str, chunk_id: str, data: bytes) -> str:
+    async def save_chunk(self, recording_id: str, chunk_id: str, data: bytes) -> str:
         chunk_path = os.path.join(self.CHUNKS_PATH, f"{recording_id}_{chunk_id}.webm")
-        with open(chunk_path, 'wb') as f:
-            f.write(data)
+        await self.chunk_store.write(chunk_path, data)
         return chunk_path
 
     def delete_chunk(self, chunk: AudioChunk) -> bool:
@@ -76,15 +488,17 @@ class AudioChunkManager:
             return False
 
     async def delete_all_chunks(self, recording_id: str):
-        chunks = self.get_chunks_from_directory(recording_id)
+        await self.chunk_index.open(recording_id, index_files=True)
+        chunks = self.chunk_index.get(recording_id)
+        self.progressive_encoder.discard(recording_id)
         
-        # Delete individual chunk files
-        for chunk in chunks:
-            try:
-                if os.path.exists(chunk.data_path):
-                    os.remove(chunk.data_path)
-            except Exception as e:
-                self.logger.error(f"Error deleting chunk file {chunk.data_path}: {e}")
+        # Delete individual chunk files and their encoded segments
+        await self.chunk_store.delete_many([
+            path for chunk in chunks
+            for path in (chunk.data_path, ProgressiveEncoder.segment_path(chunk.data_path))
+        ])
+        self.chunk_index.discard(recording_id)
+        self.metadata_writer.discard(recording_id)
         
         try:
             # Only delete from Object Store
@@ -103,7 +517,7 @@ class AudioChunkManager:
                 return
 
             # Save chunk data
-            data_path = self.save_chunk(recording_id, chunk_id, msg.data)
+            data_path = await self.save_chunk(recording_id, chunk_id, msg.data)
             
             # Parse metadata
             metadata = json.loads(msg.headers.get('Metadata', '{}'))
@@ -117,39 +531,71 @@ class AudioChunkManager:
                 data_path=data_path
             )
 
-            if recording_id not in self.chunks:
-                self.chunks[recording_id] = []
-            self.chunks[recording_id].append(chunk)
-
-            await self.update_chunk_metadata(chunk)
+            # A recording getting live chunks always has a manifest, its files are never scanned
+            await self.chunk_index.open(recording_id)
+            self.chunk_index.record(chunk)
+            self.encode_progressively(chunk)
+            self.metadata_writer.submit(chunk)
+            self.mark_removed(self.chunk_index.timeline(recording_id).add(chunk), 'replaced')
 
         except Exception as e:
             self.logger.error(f"Error handling chunk: {e}")
 
     async def handle_get_chunks(self, msg):
+        """
+        Reply with the manifest of a recording's playable audio and stream the
+        chunk files it lists to the client's inbox, see ChunkStream. The request
+        names the 'inbox', optionally a 'window' of initial credits, and
+        'resume_index'/'resume_offset' to continue an interrupted stream.
+        """
         try:
             data = json.loads(msg.data.decode())
             access_token = data.get('access_token')
             recording_id = data.get('recording_id')
+            inbox = data.get('inbox', '')
 
             payload = await self.token_validator.validate_access_token(access_token)
             user_id = payload['user']['id']
 
-            chunks = self.chunks.get(recording_id, [])
-            response = []
-            
-            for chunk in chunks:
-                if chunk.status == 'active':
-                    with open(chunk.data_path, 'rb') as f:
-                        chunk_data = f.read()
-                    response.append({
-                        'id': chunk.chunk_id,
-                        'start_time': chunk.start_time,
-                        'end_time': chunk.end_time,
-                        'data': chunk_data
-                    })
+            if not inbox.startswith('_INBOX.'):
+                raise ValueError("A stream needs an '_INBOX.' subject to send the chunks to")
+
+            await self.chunk_index.open(recording_id, index_files=True)
+            segments = self.chunk_index.timeline(recording_id).segments
+            chunks: List[AudioChunk] = []
+            chunk_indexes: Dict[str, int] = {}
+            for segment in segments:
+                if segment.chunk.chunk_id not in chunk_indexes:
+                    chunk_indexes[segment.chunk.chunk_id] = len(chunks)
+                    chunks.append(segment.chunk)
+            paths = [chunk.data_path for chunk in chunks]
+            sizes = await self.chunk_store.sizes(paths)
+
+            stream = ChunkStream(
+                self.nats_client, self.chunk_store, inbox, paths, sizes,
+                credits=int(data.get('window', self.STREAM_WINDOW)),
+                payload_size=self.nats_client.nc.max_payload - self.STREAM_HEADER_ROOM,
+                idle_timeout_s=self.STREAM_IDLE_TIMEOUT_S,
+            )
+            await stream.open()
+            await msg.respond(json.dumps({
+                'recording_id': recording_id,
+                'credit_subject': stream.credit_subject,
+                'payload_size': stream.payload_size,
+                'chunks': [{'id': chunk.chunk_id, 'size': size} for chunk, size in zip(chunks, sizes)],
+                # Playback order, each plays its chunk from inpoint to outpoint
+                'segments': [{
+                    'chunk': chunk_indexes[segment.chunk.chunk_id],
+                    'start_time': segment.start,
+                    'end_time': segment.end,
+                    'inpoint': segment.inpoint,
+                    'outpoint': segment.outpoint,
+                } for segment in segments],
+            }).encode())
 
-            await msg.respond(json.dumps(response).encode())
+            task = asyncio.create_task(stream.run(int(data.get('resume_index', 0)), int(data.get('resume_offset', 0))))
+            self.streams.add(task)
+            task.add_done_callback(self.streams.discard)
 
         except Exception as e:
             self.logger.error(f"Error getting chunks: {e}")
@@ -165,6 +611,7 @@ class AudioChunkManager:
             payload = await self.token_validator.validate_access_token(access_token)
             user_id = payload['user']['id']
 
+            await self.chunk_index.open(recording_id, index_files=True)
             if edit['type'] == 'replace':
                 await self.handle_replace(recording_id, edit)
             elif edit['type'] == 'insert':
@@ -178,17 +625,15 @@ class AudioChunkManager:
             self.logger.error(f"Error handling edit: {e}")
             await msg.respond(json.dumps({'error': str(e)}).encode())
 
-    async def handle_replace(self, recording_id: str, edit: dict):
-        affected_chunks = [
-            chunk for chunk in self.chunks[recording_id]
-            if chunk.start_time >= edit['start_time'] and chunk.end_time <= edit['end_time']
-        ]
-        
-        for chunk in affected_chunks:
-            chunk.status = 'replaced'
-            await self.update_chunk_metadata(chunk)
+    def mark_removed(self, chunks: List[AudioChunk], status: str):
+        """Record the chunks an edit took out of the timeline completely."""
+        for chunk in chunks:
+            chunk.status = status
+            self.chunk_index.record(chunk)
+            self.metadata_writer.submit(chunk)
 
-        new_chunk_path = self.save_chunk(recording_id, edit['chunk_id'], edit['data'])
+    async def handle_replace(self, recording_id: str, edit: dict):
+        new_chunk_path = await self.save_chunk(recording_id, edit['chunk_id'], edit['data'])
         new_chunk = AudioChunk(
             chunk_id=edit['chunk_id'],
             recording_id=recording_id,
@@ -198,11 +643,15 @@ class AudioChunkManager:
             data_path=new_chunk_path
         )
         
-        self.chunks[recording_id].append(new_chunk)
-        await self.update_chunk_metadata(new_chunk)
+        self.chunk_index.record(new_chunk)
+        self.encode_progressively(new_chunk)
+        self.metadata_writer.submit(new_chunk)
+        timeline = self.chunk_index.timeline(recording_id)
+        self.mark_removed(timeline.replace(edit['start_time'], edit['end_time'], new_chunk), 'replaced')
+        self.chunk_index.record_timeline(recording_id)
 
     async def handle_insert(self, recording_id: str, edit: dict):
-        new_chunk_path = self.save_chunk(recording_id, edit['chunk_id'], edit['data'])
+        new_chunk_path = await self.save_chunk(recording_id, edit['chunk_id'], edit['data'])
         new_chunk = AudioChunk(
             chunk_id=edit['chunk_id'],
             recording_id=recording_id,
@@ -212,18 +661,16 @@ class AudioChunkManager:
             data_path=new_chunk_path
         )
         
-        self.chunks[recording_id].append(new_chunk)
-        await self.update_chunk_metadata(new_chunk)
+        self.chunk_index.record(new_chunk)
+        self.encode_progressively(new_chunk)
+        self.metadata_writer.submit(new_chunk)
+        self.chunk_index.timeline(recording_id).insert(edit['start_time'], new_chunk)
+        self.chunk_index.record_timeline(recording_id)
 
     async def handle_delete(self, recording_id: str, edit: dict):
-        affected_chunks = [
-            chunk for chunk in self.chunks[recording_id]
-            if chunk.start_time >= edit['start_time'] and chunk.end_time <= edit['end_time']
-        ]
-        
-        for chunk in affected_chunks:
-            chunk.status = 'deleted'
-            await self.update_chunk_metadata(chunk)
+        timeline = self.chunk_index.timeline(recording_id)
+        self.mark_removed(timeline.delete(edit['start_time'], edit['end_time']), 'deleted')
+        self.chunk_index.record_timeline(recording_id)
 
     async def handle_delete_all_chunks(self, msg):
         try:
@@ -241,69 +688,141 @@ class AudioChunkManager:
             self.logger.error(f"Error deleting all chunks: {e}")
             await msg.respond(json.dumps({'error': str(e)}).encode())
 
-    def get_chunks_from_directory(self, recording_id: str) -> List[AudioChunk]:
-        """Get all chunks for a recording from the filesystem."""
-        chunks = []
-        pattern = f"{recording_id}_*.webm"
-        chunk_files = [f for f in os.listdir(self.CHUNKS_PATH) if f.startswith(recording_id)]
-        
-        for filename in chunk_files:
-            chunk_id = filename.replace(f"{recording_id}_", "").replace(".webm", "")
-            filepath = os.path.join(self.CHUNKS_PATH, filename)
-            
-            # Extract metadata from filename or use defaults
-            chunks.append(AudioChunk(
-                chunk_id=chunk_id,
-                recording_id=recording_id,
-                start_time=0.0,  # These could be stored in a metadata file if needed
-                end_time=0.0,
-                status='active',
-                data_path=filepath
-            ))
-        
-        return sorted(chunks, key=lambda x: x.chunk_id)
-
-    async def combine_chunks(self, recording_id: str) -> bytes:
-        chunks = self.get_chunks_from_directory(recording_id)
-        if not chunks:
+    async def combine_chunks(self, recording_id: str):
+        await self.chunk_index.open(recording_id, index_files=True)
+        timeline = self.chunk_index.timeline(recording_id)
+        existing = set(await self.chunk_store.existing([segment.chunk.data_path for segment in timeline.segments]))
+        segments = [segment for segment in timeline.segments if segment.chunk.data_path in existing]
+        if not segments:
             raise ValueError(f"No chunks found for recording {recording_id}")
-        
-        print(f"Found {len(chunks)} chunks for recording {recording_id}")
-        
+
+        self.logger.info(f"Found {len(segments)} segments for recording {recording_id}")
+
+        # Encoded segments hold whole chunks, trimmed ones have to be re-encoded
+        if self.PROGRESSIVE_COMBINE and not timeline.trimmed:
+            segment_paths = await self.progressive_encoder.segments_for(
+                recording_id, [segment.chunk for segment in segments])
+            if segment_paths:
+                return await self.combine_segments(recording_id, segment_paths)
+            self.logger.info(f"Progressive segments unusable for recording {recording_id}, re-encoding")
+
+        if self.COMBINE_MODE == 'pydub':
+            return await self.combine_chunks_in_memory(recording_id, segments)
+        return await self.combine_chunks_streaming(recording_id, segments)
+
+    def encode_progressively(self, chunk: AudioChunk):
+        if self.PROGRESSIVE_COMBINE:
+            self.progressive_encoder.submit(chunk)
+
+    async def combine_segments(self, recording_id: str, segment_paths: List[str]):
+        """Finalize a progressively encoded recording by copying its MP3 segments into the Object Store."""
+        reader = io.BufferedReader(ConcatFileReader(segment_paths))
+        try:
+            info = await self.object_store.put(
+                f"{recording_id}/combined.mp3",
+                reader,
+                meta=ObjectMeta(description=f"Combined audio for recording {recording_id}")
+            )
+        finally:
+            reader.close()
+        self.progressive_encoder.discard(recording_id)
+        self.logger.info(f"Stored progressively combined audio in Object Store ({info.size} bytes)")
+        return info
+
+    def build_concat_list(self, segments: List[TimelineSegment]) -> bytes:
+        """Build an ffmpeg concat demuxer script for the given segments."""
+        lines = []
+        for segment in segments:
+            path = os.path.abspath(segment.chunk.data_path).replace("'", "'\\''")
+            lines.append(f"file '{path}'")
+            if segment.trimmed:
+                lines.append(f"inpoint {segment.inpoint:.3f}")
+                lines.append(f"outpoint {segment.outpoint:.3f}")
+        return ("\n".join(lines) + "\n").encode()
+
+    async def combine_chunks_streaming(self, recording_id: str, segments: List[TimelineSegment]):
+        """
+        Concatenate the segments with one ffmpeg process and stream the encoded MP3
+        into the Object Store. Only a single object store chunk is held in memory
+        at a time, regardless of the recording length.
+        """
+        command = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-f', 'concat', '-safe', '0', '-protocol_whitelist', 'file,pipe',
+            '-i', 'pipe:0',
+            '-vn', '-codec:a', 'libmp3lame', '-b:a', self.COMBINE_BITRATE,
+            '-write_xing', '0',
+            '-f', 'mp3', 'pipe:1'
+        ]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        loop = asyncio.get_running_loop()
+        object_name = f"{recording_id}/combined.mp3"
+        try:
+            await loop.run_in_executor(None, self._write_and_close, process.stdin, self.build_concat_list(segments))
+            # The object store reads the pipe in a worker thread, chunk by chunk
+            info = await self.object_store.put(
+                object_name,
+                process.stdout,
+                meta=ObjectMeta(description=f"Combined audio for recording {recording_id}")
+            )
+            return_code = await loop.run_in_executor(None, process.wait)
+            if return_code != 0:
+                error = process.stderr.read().decode(errors='replace')
+                await self.object_store.delete(object_name)
+                raise RuntimeError(f"ffmpeg failed to combine recording {recording_id}: {error}")
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            process.stderr.close()
+
+        self.logger.info(f"Stored combined audio in Object Store ({info.size} bytes)")
+        return info
+
+    @staticmethod
+    def _write_and_close(stream, data: bytes):
+        try:
+            stream.write(data)
+        finally:
+            stream.close()
+
+    async def combine_chunks_in_memory(self, recording_id: str, segments: List[TimelineSegment]):
         # Combine WebM chunks
         combined = AudioSegment.empty()
-        for chunk in chunks:
-            if os.path.exists(chunk.data_path):
-                segment = AudioSegment.from_file(chunk.data_path, format="webm")
-                combined += segment
-                print(f"Added chunk {chunk.chunk_id}, duration: {segment.duration_seconds}")
+        for timeline_segment in segments:
+            chunk = timeline_segment.chunk
+            segment = AudioSegment.from_file(chunk.data_path, format="webm")
+            if timeline_segment.trimmed:
+                segment = segment[int(timeline_segment.inpoint * 1000):int(timeline_segment.outpoint * 1000)]
+            combined += segment
+            print(f"Added chunk {chunk.chunk_id}, duration: {segment.duration_seconds}")
         
         print(f"Combined audio duration: {combined.duration_seconds}")
         
         # Export as MP3
         mp3_buffer = io.BytesIO()
-        combined.export(mp3_buffer, format="mp3", bitrate="192k")
-        mp3_data = mp3_buffer.getvalue()
+        combined.export(mp3_buffer, format="mp3", bitrate=self.COMBINE_BITRATE)
+        mp3_buffer.seek(0)
         print(f"mp3_data combined audio to MP3")
         # Store in Object Store only
         object_name = f"{recording_id}/combined.mp3"
-        await self.object_store.put(
+        info = await self.object_store.put(
             object_name,
-            io.BytesIO(mp3_data),
+            mp3_buffer,
             meta=ObjectMeta(description=f"Combined audio for recording {recording_id}")
         )
         print(f"Stored combined audio in Object Store")
         
-        return mp3_data
+        return info
 
     async def get_combined_audio(self, recording_id: str) -> Optional[dict]:
         try:
-            # Get directly from Object Store
-            result = await self.object_store.get(f"{recording_id}/combined.mp3")
+            # Only fetch the object info, the audio itself can be hours long
+            info = await self.object_store.get_info(f"{recording_id}/combined.mp3")
             return {
                 "status": "completed",
-                "object_name": f"{recording_id}/combined.mp3",
-                "data": result.data
+                "object_name": info.name,
+                "size": info.size
             }
         except Exception as e:
             self.logger.error(f"Error getting combined audio: {e}")
@@ -319,14 +838,14 @@ class AudioChunkManager:
             user_id = payload['user']['id']
 
             # Combine chunks
-            combined_audio = await self.combine_chunks(recording_id)
+            await self.metadata_writer.flush(recording_id)
+            await self.combine_chunks(recording_id)
             print(f"Combined audio for recording {recording_id}")
             metadata = await self.get_combined_audio(recording_id)
             if not metadata:
                 raise ValueError(f"Combined audio not found for recording {recording_id}")
             print(f"Combined audio metadata: {metadata}")
             
-            # Remove binary data from response
             response_metadata = {
                 'status': metadata['status'],
                 'object_name': metadata['object_name']
@@ -337,32 +856,16 @@ class AudioChunkManager:
                 'data': response_metadata
             }).encode())
             
-            # Use str.encode() directly on the JSON string
-            message = json.dumps({'transcription_id': recording_id})
+            # The chunk count lets live transcription check it has seen the whole recording
+            chunk_count = len(self.chunk_index.get(recording_id))
+            message = json.dumps({'transcription_id': recording_id, 'chunks': chunk_count})
             #  await msg.respond(json.dumps(response, cls=DataclassEncoder).encode('utf-8'))
-            await self.nats_client.publish('recording.completed', message)
+            await self.nats_client.js_publish('recording.completed', message)
                 
         except Exception as e:
             self.logger.error(f"Error combining chunks: {e}")
             await msg.respond(json.dumps({'error': str(e)}).encode())
 
-    async def update_chunk_metadata(self, chunk: AudioChunk):
-        # Update the chunk metadata in the database
-        await self.client.execute("""
-            UPDATE AudioChunk 
-            FILTER .chunk_id = <str>$chunk_id
-            SET {
-                status := <str>$status,
-                start_time := <float64>$start_time,
-                end_time := <float64>$end_time
-            }
-        """, 
-        chunk_id=chunk.chunk_id,
-        status=chunk.status,
-        start_time=chunk.start_time,
-        end_time=chunk.end_time
-        )
-
     async def run(self):
         await self.connect()
         try:
@@ -372,7 +875,15 @@ class AudioChunkManager:
             await self.cleanup()
 
     async def cleanup(self):
+        # Streams read through the chunk store's pool and publish on the connection, stop them first
+        for task in self.streams:
+            task.cancel()
+        await asyncio.gather(*self.streams, return_exceptions=True)
+        await self.metadata_writer.stop()
         await self.nats_client.close()
+        self.chunk_store.shutdown()
+        # Waits for the last manifest writes
+        await asyncio.to_thread(self.chunk_index.shutdown)
 
 if __name__ == '__main__':
     manager = AudioChunkManager()
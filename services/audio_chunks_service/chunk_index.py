@@ -0,0 +1,349 @@
+# services/audio_chunks_service/chunk_index.py
+import asyncio
+import bisect
+import json
+import logging
+import os
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Tuple
+
+
+@dataclass
+class AudioChunk:
+    chunk_id: str
+    recording_id: str
+    start_time: float
+    end_time: float
+    status: str
+    data_path: str
+
+def chunk_sort_key(chunk_id: str):
+    """Order chunk ids by their numbers, so '2' comes before '10'."""
+    return [(0, int(part), '') if part.isdigit() else (1, 0, part)
+            for part in re.split(r'(\d+)', chunk_id) if part]
+
+
+@dataclass
+class TimelineSegment:
+    """The part of a chunk from inpoint on that plays from start to end of the edited recording."""
+    start: float
+    end: float
+    chunk: AudioChunk
+    inpoint: float = 0.0
+
+    @property
+    def outpoint(self) -> float:
+        return self.inpoint + self.end - self.start
+
+    @property
+    def trimmed(self) -> bool:
+        return self.inpoint > 0 or self.end - self.start < self.chunk.end_time - self.chunk.start_time
+
+
+class ChunkTimeline:
+    """
+    The playable segments of a recording, ordered by start and never
+    overlapping. Edits find the segments they touch by bisecting the starts,
+    in O(log n + k), and split segments that only partly overlap the edited
+    range. Inserting or deleting a range moves the segments after it.
+    Recorded chunks carry times of the raw recording, after an edit they are
+    moved by offset, the distance between the raw and the edited end.
+    """
+
+    def __init__(self, offset: float = 0.0):
+        self.starts: List[float] = []
+        self.segments: List[TimelineSegment] = []
+        # chunk id -> number of segments playing from it
+        self.references: Dict[str, int] = {}
+        self.offset = offset
+        self.raw_end = 0.0
+
+    @property
+    def end(self) -> float:
+        return self.segments[-1].end if self.segments else 0.0
+
+    def _insert(self, segment: TimelineSegment):
+        i = bisect.bisect_right(self.starts, segment.start)
+        self.starts.insert(i, segment.start)
+        self.segments.insert(i, segment)
+        self.references[segment.chunk.chunk_id] = self.references.get(segment.chunk.chunk_id, 0) + 1
+
+    def _cut(self, start: float, end: float) -> List[AudioChunk]:
+        """Remove [start, end) and return the chunks that lost a segment."""
+        i = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        while i < len(self.segments) and self.segments[i].end <= start:
+            i += 1
+        j = i
+        while j < len(self.segments) and self.segments[j].start < end:
+            j += 1
+
+        cut, kept = self.segments[i:j], []
+        for segment in cut:
+            if segment.start < start:
+                kept.append(TimelineSegment(segment.start, start, segment.chunk, segment.inpoint))
+            if segment.end > end:
+                kept.append(TimelineSegment(end, segment.end, segment.chunk,
+                                            segment.inpoint + end - segment.start))
+            self.references[segment.chunk.chunk_id] -= 1
+        del self.starts[i:j]
+        del self.segments[i:j]
+        for segment in kept:
+            self._insert(segment)
+        return [segment.chunk for segment in cut]
+
+    def _shift(self, after: float, offset: float):
+        for i in range(bisect.bisect_left(self.starts, after), len(self.segments)):
+            segment = self.segments[i]
+            segment.start += offset
+            segment.end += offset
+            self.starts[i] = segment.start
+
+    def _removed(self, chunks: List[AudioChunk]) -> List[AudioChunk]:
+        removed = {}
+        for chunk in chunks:
+            if not self.references.get(chunk.chunk_id):
+                self.references.pop(chunk.chunk_id, None)
+                removed[chunk.chunk_id] = chunk
+        return list(removed.values())
+
+    def _edited(self):
+        # Recording continues from the raw end, which now plays at the edited end
+        self.offset = self.end - self.raw_end
+
+    def add(self, chunk: AudioChunk) -> List[AudioChunk]:
+        """
+        Place a recorded chunk at its own times moved by the offset, over whatever
+        played there. A chunk without timing is appended at the end. Returns the
+        chunks no longer played.
+        """
+        if chunk.end_time <= chunk.start_time:
+            self._insert(TimelineSegment(self.end, self.end, chunk))
+            return []
+        self.raw_end = max(self.raw_end, chunk.end_time)
+        start, end = chunk.start_time + self.offset, chunk.end_time + self.offset
+        cut = self._cut(start, end)
+        self._insert(TimelineSegment(start, end, chunk))
+        return self._removed(cut)
+
+    def replace(self, start: float, end: float, chunk: AudioChunk) -> List[AudioChunk]:
+        cut = self._cut(start, end)
+        self._insert(TimelineSegment(start, end, chunk))
+        self._edited()
+        return self._removed(cut)
+
+    def insert(self, at: float, chunk: AudioChunk):
+        length = chunk.end_time - chunk.start_time
+        # Cutting nothing at 'at' splits the segment playing there, so its second half moves along
+        self._cut(at, at)
+        self._shift(at, length)
+        self._insert(TimelineSegment(at, at + length, chunk))
+        self._edited()
+
+    def delete(self, start: float, end: float) -> List[AudioChunk]:
+        cut = self._cut(start, end)
+        self._shift(end, start - end)
+        self._edited()
+        return self._removed(cut)
+
+    @property
+    def trimmed(self) -> bool:
+        return any(segment.trimmed for segment in self.segments)
+
+    def snapshot(self) -> List[list]:
+        return [[segment.start, segment.end, segment.chunk.chunk_id, segment.inpoint] for segment in self.segments]
+
+    @classmethod
+    def from_snapshot(cls, snapshot: List[list], chunks: Dict[str, AudioChunk],
+                      offset: float = 0.0, raw_end: float = 0.0) -> 'ChunkTimeline':
+        timeline = cls(offset)
+        timeline.raw_end = raw_end
+        for start, end, chunk_id, inpoint in snapshot:
+            if chunk_id in chunks:
+                timeline._insert(TimelineSegment(start, end, chunks[chunk_id], inpoint))
+        return timeline
+
+
+class ChunkIndex:
+    """
+    Chunks of every recording, backed by an append-only manifest per recording
+    ('<recording_id>.manifest.jsonl' next to the chunk files). Every change to a
+    chunk appends its full state and the last line of a chunk wins, so the index
+    survives restarts and loading a recording only reads that recording's lines.
+    After an edit the recording's timeline is appended as a snapshot, chunks
+    recorded after it are placed by the timeline's offset when loading. Once
+    MAX_SNAPSHOTS snapshots were appended the manifest is compacted, so it does
+    not grow with every edit.
+
+    The index itself is kept on the event loop, manifest reads and writes run on
+    a single thread of their own, so they never block the loop and a recording's
+    appends, rewrites and reads happen in the order they were made. Recordings
+    are opened on first use. Recordings stored before manifests existed are
+    indexed once from their chunk files, when opened with index_files.
+    """
+    MAX_SNAPSHOTS = 8
+
+    def __init__(self, path: str):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        self.recordings: Dict[str, Dict[str, AudioChunk]] = {}
+        self.timelines: Dict[str, ChunkTimeline] = {}
+        # recording id -> snapshots appended since the manifest was last compacted
+        self.snapshots: Dict[str, int] = {}
+        # recording id -> manifest being read
+        self.opening: Dict[str, asyncio.Task] = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chunk-index')
+
+    def manifest_path(self, recording_id: str) -> str:
+        return os.path.join(self.path, f"{recording_id}.manifest.jsonl")
+
+    async def open(self, recording_id: str, index_files: bool = False):
+        """Load a recording's manifest off the event loop, if it is not loaded yet."""
+        if recording_id in self.recordings:
+            return
+        task = self.opening.get(recording_id)
+        if task is None:
+            task = self.opening[recording_id] = asyncio.create_task(self._open(recording_id, index_files))
+        await asyncio.shield(task)
+
+    async def _open(self, recording_id: str, index_files: bool):
+        try:
+            loaded = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._read, recording_id, index_files)
+            if recording_id not in self.recordings:
+                self._install(recording_id, *loaded)
+        finally:
+            self.opening.pop(recording_id, None)
+
+    def load(self, recording_id: str) -> Dict[str, AudioChunk]:
+        """The recording's chunks by id, read in place when it was not opened before."""
+        chunks = self.recordings.get(recording_id)
+        if chunks is not None:
+            return chunks
+        self._install(recording_id, *self.executor.submit(self._read, recording_id, False).result())
+        return self.recordings[recording_id]
+
+    def _read(self, recording_id: str, index_files: bool) -> Tuple[Dict[str, AudioChunk], ChunkTimeline, int, bool]:
+        chunks, timeline, lines, snapshots = {}, ChunkTimeline(), 0, 0
+        try:
+            with open(self.manifest_path(recording_id)) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        if 'timeline' in record:
+                            timeline = ChunkTimeline.from_snapshot(record['timeline'], chunks,
+                                                                   record.get('offset', 0.0),
+                                                                   record.get('raw_end', timeline.raw_end))
+                            snapshots += 1
+                        else:
+                            chunk = AudioChunk(**record)
+                            chunks[chunk.chunk_id] = chunk
+                            if chunk.status == 'active' and chunk.chunk_id not in timeline.references:
+                                timeline.add(chunk)
+                    except (ValueError, TypeError) as e:
+                        # A torn last line from a crash mid-append
+                        self.logger.error(f"Skipping bad manifest line for recording {recording_id}: {e}")
+                        continue
+                    lines += 1
+        except FileNotFoundError:
+            if index_files:
+                for chunk in self.scan(recording_id):
+                    chunks[chunk.chunk_id] = chunk
+                    timeline.add(chunk)
+                # Store what the scan found, so it only runs once
+                return chunks, timeline, 0, bool(chunks)
+
+        compact = lines > 2 * len(chunks) or snapshots > self.MAX_SNAPSHOTS
+        return chunks, timeline, snapshots, compact
+
+    def _install(self, recording_id: str, chunks: Dict[str, AudioChunk], timeline: ChunkTimeline,
+                 snapshots: int, compact: bool):
+        self.recordings[recording_id] = chunks
+        self.timelines[recording_id] = timeline
+        self.snapshots[recording_id] = snapshots
+        if compact:
+            self.compact(recording_id)
+
+    def scan(self, recording_id: str) -> List[AudioChunk]:
+        """Chunks of a recording stored before it had a manifest, in chunk id order and without timing."""
+        prefix = f"{recording_id}_"
+        chunks = [AudioChunk(chunk_id=name[len(prefix):-len('.webm')], recording_id=recording_id,
+                             start_time=0.0, end_time=0.0, status='active',
+                             data_path=os.path.join(self.path, name))
+                  for name in os.listdir(self.path) if name.startswith(prefix) and name.endswith('.webm')]
+        if chunks:
+            self.logger.info(f"Indexed {len(chunks)} chunk files of recording {recording_id} without a manifest")
+        return sorted(chunks, key=lambda chunk: chunk_sort_key(chunk.chunk_id))
+
+    def get(self, recording_id: str) -> List[AudioChunk]:
+        """All chunks of the recording, whatever their status, ordered by chunk id."""
+        return sorted(self.load(recording_id).values(), key=lambda chunk: chunk_sort_key(chunk.chunk_id))
+
+    def timeline(self, recording_id: str) -> ChunkTimeline:
+        self.load(recording_id)
+        return self.timelines[recording_id]
+
+    def _submit(self, func, *args):
+        def done(future: Future):
+            if future.exception() is not None:
+                self.logger.error(f"Error writing chunk manifest: {future.exception()}")
+
+        self.executor.submit(func, *args).add_done_callback(done)
+
+    @staticmethod
+    def _append(path: str, line: str):
+        with open(path, 'a') as f:
+            f.write(line)
+
+    @staticmethod
+    def _rewrite(path: str, lines: List[str]):
+        with open(path + '.tmp', 'w') as f:
+            f.writelines(lines)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _timeline_line(self, recording_id: str) -> str:
+        timeline = self.timelines[recording_id]
+        return json.dumps({'timeline': timeline.snapshot(), 'offset': timeline.offset,
+                           'raw_end': timeline.raw_end}) + "\n"
+
+    def record_timeline(self, recording_id: str):
+        """Store the recording's timeline after an edit."""
+        self.load(recording_id)
+        if self.snapshots[recording_id] >= self.MAX_SNAPSHOTS:
+            self.compact(recording_id)
+            return
+        self._submit(self._append, self.manifest_path(recording_id), self._timeline_line(recording_id))
+        self.snapshots[recording_id] += 1
+
+    def record(self, chunk: AudioChunk):
+        """Add a chunk or store its changed state."""
+        self.load(chunk.recording_id)[chunk.chunk_id] = chunk
+        self._submit(self._append, self.manifest_path(chunk.recording_id), json.dumps(asdict(chunk)) + "\n")
+
+    def compact(self, recording_id: str):
+        """Rewrite the manifest with only the latest state of every chunk."""
+        lines = [json.dumps(asdict(chunk)) + "\n" for chunk in self.get(recording_id)]
+        lines.append(self._timeline_line(recording_id))
+        self._submit(self._rewrite, self.manifest_path(recording_id), lines)
+        self.snapshots[recording_id] = 1
+
+    def discard(self, recording_id: str):
+        self.recordings.pop(recording_id, None)
+        self.timelines.pop(recording_id, None)
+        self.snapshots.pop(recording_id, None)
+        self._submit(self._remove, self.manifest_path(recording_id))
+
+    def flush(self):
+        """Wait until every manifest change made so far is written."""
+        self.executor.submit(lambda: None).result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,146 @@
+# services/audio_chunks_service/tests/test_chunk_index.py
+import asyncio
+import dataclasses
+import json
+import os
+import sys
+
+service_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_dir not in sys.path:
+    sys.path.insert(0, service_dir)
+
+from chunk_index import AudioChunk, ChunkIndex
+
+
+def make_chunk(path, chunk_id: str, start: float, end: float) -> AudioChunk:
+    return AudioChunk(chunk_id=chunk_id, recording_id='rec', start_time=start, end_time=end,
+                      status='active', data_path=os.path.join(str(path), f'rec_{chunk_id}.webm'))
+
+
+def layout(index: ChunkIndex, recording_id: str = 'rec'):
+    return [(segment.start, segment.end, segment.chunk.chunk_id)
+            for segment in index.timeline(recording_id).segments]
+
+
+def record(index: ChunkIndex, chunk: AudioChunk):
+    index.record(chunk)
+    index.timeline(chunk.recording_id).add(chunk)
+
+
+def restart(index: ChunkIndex) -> ChunkIndex:
+    index.flush()
+    return ChunkIndex(index.path)
+
+
+def manifest_lines(index: ChunkIndex, recording_id: str = 'rec'):
+    index.flush()
+    with open(index.manifest_path(recording_id)) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_replay_keeps_the_last_state_of_every_chunk(tmp_path):
+    index = ChunkIndex(str(tmp_path))
+    for i in range(3):
+        record(index, make_chunk(tmp_path, str(i), i * 10, (i + 1) * 10))
+    for chunk in index.timeline('rec').delete(10, 20):
+        index.record(dataclasses.replace(chunk, status='deleted'))
+    index.record_timeline('rec')
+
+    restored = restart(index)
+    assert {chunk.chunk_id: chunk.status for chunk in restored.get('rec')} == \
+        {'0': 'active', '1': 'deleted', '2': 'active'}
+    assert layout(restored) == [(0, 10, '0'), (10, 20, '2')]
+
+
+def test_replay_restores_edits_and_chunks_recorded_after_them(tmp_path):
+    index = ChunkIndex(str(tmp_path))
+    for i in range(3):
+        record(index, make_chunk(tmp_path, str(i), i * 10, (i + 1) * 10))
+    index.timeline('rec').delete(5, 15)
+    index.record_timeline('rec')
+    record(index, make_chunk(tmp_path, '3', 30, 40))
+
+    restored = restart(index)
+    assert layout(restored) == layout(index) == [(0, 5, '0'), (5, 10, '1'), (10, 20, '2'), (20, 30, '3')]
+
+
+def test_replay_skips_a_torn_last_line(tmp_path):
+    index = ChunkIndex(str(tmp_path))
+    record(index, make_chunk(tmp_path, '0', 0, 10))
+    index.flush()
+    with open(index.manifest_path('rec'), 'a') as f:
+        f.write('{"chunk_id": "1", "recor')
+
+    restored = restart(index)
+    assert [chunk.chunk_id for chunk in restored.get('rec')] == ['0']
+
+
+def test_snapshots_are_compacted(tmp_path):
+    index = ChunkIndex(str(tmp_path))
+    for i in range(3):
+        record(index, make_chunk(tmp_path, str(i), i * 10, (i + 1) * 10))
+    for _ in range(ChunkIndex.MAX_SNAPSHOTS * 3):
+        index.timeline('rec').delete(0, 0.5)
+        index.record_timeline('rec')
+
+    snapshots = [line for line in manifest_lines(index) if 'timeline' in line]
+    assert len(snapshots) <= ChunkIndex.MAX_SNAPSHOTS
+    assert layout(restart(index)) == layout(index)
+
+
+def test_recording_without_manifest_is_indexed_from_its_files(tmp_path):
+    for name in ['rec_1.webm', 'rec_10.webm', 'rec_2.webm', 'rec_2.mp3', 'rec2_1.webm', 'other_1.webm']:
+        (tmp_path / name).write_bytes(b'')
+
+    index = ChunkIndex(str(tmp_path))
+    asyncio.run(index.open('rec', index_files=True))
+    assert [chunk.chunk_id for chunk in index.get('rec')] == ['1', '2', '10']
+    assert [segment.chunk.chunk_id for segment in index.timeline('rec').segments] == ['1', '2', '10']
+    index.flush()
+    assert os.path.exists(index.manifest_path('rec'))
+
+    # The manifest written by the scan is used from now on
+    (tmp_path / 'rec_11.webm').write_bytes(b'')
+    restored = ChunkIndex(str(tmp_path))
+    asyncio.run(restored.open('rec', index_files=True))
+    assert [chunk.chunk_id for chunk in restored.get('rec')] == ['1', '2', '10']
+
+
+def test_chunk_files_are_only_indexed_when_asked_for(tmp_path):
+    (tmp_path / 'rec_1.webm').write_bytes(b'')
+    index = ChunkIndex(str(tmp_path))
+    asyncio.run(index.open('rec'))
+    assert index.get('rec') == []
+    assert ChunkIndex(str(tmp_path)).get('rec') == []
+
+
+def test_live_chunk_written_before_it_is_recorded(tmp_path):
+    index = ChunkIndex(str(tmp_path))
+    for i in range(1, 3):
+        chunk = make_chunk(tmp_path, str(i), (i - 1) * 10, i * 10)
+        # The chunk file is saved before the chunk is recorded
+        (tmp_path / f'rec_{i}.webm').write_bytes(b'')
+        asyncio.run(index.open('rec'))
+        record(index, chunk)
+
+    assert layout(index) == [(0, 10, '1'), (10, 20, '2')]
+    restored = restart(index)
+    asyncio.run(restored.open('rec', index_files=True))
+    assert layout(restored) == [(0, 10, '1'), (10, 20, '2')]
+
+
+def test_new_recording_gets_no_manifest_until_a_chunk_is_recorded(tmp_path):
+    index = ChunkIndex(str(tmp_path))
+    asyncio.run(index.open('new', index_files=True))
+    assert index.get('new') == []
+    index.flush()
+    assert not os.path.exists(index.manifest_path('new'))
+
+
+def test_discard_removes_the_manifest(tmp_path):
+    index = ChunkIndex(str(tmp_path))
+    record(index, make_chunk(tmp_path, '0', 0, 10))
+    index.discard('rec')
+    index.flush()
+    assert not os.path.exists(index.manifest_path('rec'))
+    assert ChunkIndex(str(tmp_path)).get('rec') == []
@@ -0,0 +1,100 @@
+# services/audio_chunks_service/tests/test_chunk_timeline.py
+import os
+import sys
+
+service_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_dir not in sys.path:
+    sys.path.insert(0, service_dir)
+
+from chunk_index import AudioChunk, ChunkTimeline, chunk_sort_key
+
+
+def make_chunk(chunk_id: str, start: float, end: float) -> AudioChunk:
+    return AudioChunk(chunk_id=chunk_id, recording_id='rec', start_time=start, end_time=end,
+                      status='active', data_path=f'rec_{chunk_id}.webm')
+
+
+def layout(timeline: ChunkTimeline):
+    return [(segment.start, segment.end, segment.chunk.chunk_id, segment.inpoint) for segment in timeline.segments]
+
+
+def recorded(count: int, length: float = 10) -> ChunkTimeline:
+    timeline = ChunkTimeline()
+    for i in range(count):
+        timeline.add(make_chunk(str(i), i * length, (i + 1) * length))
+    return timeline
+
+
+def test_chunk_sort_key_orders_numbers():
+    assert sorted(['10', '2', '1', 'b', 'a2', 'a10'], key=chunk_sort_key) == ['1', '2', '10', 'a2', 'a10', 'b']
+
+
+def test_add_places_chunks_at_their_times():
+    timeline = recorded(3)
+    assert layout(timeline) == [(0, 10, '0', 0), (10, 20, '1', 0), (20, 30, '2', 0)]
+    assert timeline.end == 30
+    assert not timeline.trimmed
+
+
+def test_add_over_a_chunk_returns_the_replaced_chunk():
+    timeline = recorded(2)
+    removed = timeline.add(make_chunk('again', 10, 20))
+    assert [chunk.chunk_id for chunk in removed] == ['1']
+    assert layout(timeline) == [(0, 10, '0', 0), (10, 20, 'again', 0)]
+
+
+def test_add_without_timing_appends():
+    timeline = recorded(1)
+    timeline.add(make_chunk('untimed', 0, 0))
+    assert layout(timeline)[-1] == (10, 10, 'untimed', 0)
+
+
+def test_replace_splits_partly_covered_chunks():
+    timeline = recorded(2)
+    removed = timeline.replace(5, 15, make_chunk('new', 5, 15))
+    assert removed == []
+    assert layout(timeline) == [(0, 5, '0', 0), (5, 15, 'new', 0), (15, 20, '1', 5)]
+    assert timeline.trimmed
+
+
+def test_delete_moves_later_segments_back():
+    timeline = recorded(3)
+    removed = timeline.delete(10, 20)
+    assert [chunk.chunk_id for chunk in removed] == ['1']
+    assert layout(timeline) == [(0, 10, '0', 0), (10, 20, '2', 0)]
+
+
+def test_insert_splits_the_segment_playing_there():
+    timeline = recorded(2)
+    timeline.insert(5, make_chunk('new', 0, 3))
+    assert layout(timeline) == [(0, 5, '0', 0), (5, 8, 'new', 0), (8, 13, '0', 5), (13, 23, '1', 0)]
+    assert timeline.references['0'] == 2
+
+
+def test_chunks_recorded_after_a_delete_follow_the_edited_end():
+    timeline = recorded(3)
+    timeline.delete(5, 15)
+    assert timeline.offset == -10
+
+    removed = timeline.add(make_chunk('3', 30, 40))
+    assert removed == []
+    assert layout(timeline)[-2:] == [(10, 20, '2', 0), (20, 30, '3', 0)]
+
+
+def test_chunks_recorded_after_an_insert_follow_the_edited_end():
+    timeline = recorded(2)
+    timeline.insert(0, make_chunk('intro', 0, 4))
+    timeline.add(make_chunk('2', 20, 30))
+    assert layout(timeline)[-2:] == [(14, 24, '1', 0), (24, 34, '2', 0)]
+
+
+def test_snapshot_round_trip():
+    timeline = recorded(3)
+    timeline.delete(5, 15)
+    chunks = {segment.chunk.chunk_id: segment.chunk for segment in timeline.segments}
+
+    restored = ChunkTimeline.from_snapshot(timeline.snapshot(), chunks, timeline.offset, timeline.raw_end)
+    assert layout(restored) == layout(timeline)
+    assert restored.references == timeline.references
+    restored.add(make_chunk('3', 30, 40))
+    assert layout(restored)[-1] == (20, 30, '3', 0)
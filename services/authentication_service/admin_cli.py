@@ -1,6 +1,10 @@
+import argparse
 import asyncio
+import csv
+import json
 import os
 import bcrypt
+from typing import List, Optional, Tuple
 
 import edgedb
 from rich.console import Console
@@ -15,7 +19,8 @@ if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
 from common.edgedb_client import EdgedbClient
-from common.queries.user import user_create_async_edgeql, user_delete_async_edgeql, user_read_async_edgeql, user_update_async_edgeql, user_read_all_async_edgeql
+from common.password_hasher import PasswordHasher
+from common.queries.user import user_create_async_edgeql, user_create_many_async_edgeql, user_delete_async_edgeql, user_read_async_edgeql, user_update_async_edgeql, user_read_all_async_edgeql
 
 # only in dev
 from dotenv import load_dotenv
@@ -217,6 +222,113 @@ class Admin:
         except Exception as e:
             self.console.print(f"\n[bold red]✗ Error modifying user category: {str(e)}[/bold red]")
 
+    def read_users_file(self, path: str) -> List[dict]:
+        """Read users from a CSV file with a header row or a JSONL file, one object per line"""
+        if path.endswith('.jsonl') or path.endswith('.ndjson'):
+            with open(path, encoding='utf-8') as file:
+                return [json.loads(line) for line in file if line.strip()]
+        with open(path, newline='', encoding='utf-8-sig') as file:
+            return list(csv.DictReader(file))
+
+    def parse_user_row(self, row: dict) -> Tuple[Optional[dict], Optional[str]]:
+        """Normalize an imported row, returns (user, None) or (None, reason)"""
+        user_name = (row.get('user_name') or row.get('username') or '').strip()
+        password = row.get('password') or row.get('login_pass') or ''
+        if not user_name:
+            return None, 'missing user_name'
+        if not password:
+            return None, 'missing password'
+
+        is_admin = row.get('is_admin')
+        if isinstance(is_admin, str):
+            is_admin = is_admin.strip().lower() in ('1', 'true', 'yes', 'admin')
+        category = (row.get('category') or 'others').strip()
+        if category not in ('physician', 'others'):
+            return None, f"unknown category '{category}'"
+
+        return {
+            'user_name': user_name,
+            'password': password,
+            'first_name': row.get('first_name') or None,
+            'last_name': row.get('last_name') or None,
+            'email': row.get('email') or None,
+            'is_admin': bool(is_admin),
+            'category': category,
+        }, None
+
+    async def insert_users_batch(self, batch: List[Tuple[int, dict]], failures: List[Tuple[int, str, str]]) -> int:
+        """
+        Insert a batch in one statement. If the statement fails, the batch is retried
+        row by row so only the offending rows are reported.
+        """
+        try:
+            created = await user_create_many_async_edgeql.user_create_many(
+                self.client, users=json.dumps([{key: value for key, value in user.items() if value is not None}
+                                               for _, user in batch]))
+            created_names = {user.user_name for user in created}
+            for line, user in batch:
+                if user['user_name'] not in created_names:
+                    failures.append((line, user['user_name'], 'already exists'))
+            return len(created)
+        except Exception as e:
+            self.console.print(f"[yellow]Batch insert failed ({e}), inserting its {len(batch)} rows one by one[/yellow]")
+
+        created = 0
+        for line, user in batch:
+            try:
+                await user_create_async_edgeql.user_create(self.client, **user)
+                created += 1
+            except edgedb.errors.ConstraintViolationError:
+                failures.append((line, user['user_name'], 'already exists'))
+            except Exception as e:
+                failures.append((line, user['user_name'], str(e)))
+        return created
+
+    async def import_users(self, path: str, batch_size: int = 100, workers: Optional[int] = None):
+        """Create users from a CSV or JSONL file, without prompts"""
+        self.console.print(f"\n[bold blue]Import Users from {path}[/bold blue]")
+        rows = self.read_users_file(path)
+
+        failures: List[Tuple[int, str, str]] = []
+        users: List[Tuple[int, dict]] = []
+        seen = set()
+        # Line numbers count the CSV header as line 1
+        first_line = 1 if path.endswith('.jsonl') or path.endswith('.ndjson') else 2
+        for line, row in enumerate(rows, start=first_line):
+            user, reason = self.parse_user_row(row)
+            if user is None:
+                failures.append((line, row.get('user_name') or row.get('username') or '', reason))
+            elif user['user_name'] in seen:
+                failures.append((line, user['user_name'], 'duplicate in file'))
+            else:
+                seen.add(user['user_name'])
+                users.append((line, user))
+
+        # bcrypt releases the GIL, so the hashes run in parallel on all cores
+        hasher = PasswordHasher(max_workers=workers)
+        self.console.print(f"Hashing {len(users)} passwords on {hasher.max_workers} threads...")
+        hashes = await asyncio.gather(*(hasher.hash(user.pop('password')) for _, user in users))
+        hasher.shutdown()
+        for (_, user), login_pass in zip(users, hashes):
+            user['login_pass'] = login_pass
+
+        created = 0
+        for start in range(0, len(users), batch_size):
+            created += await self.insert_users_batch(users[start:start + batch_size], failures)
+            self.console.print(f"Inserted {min(start + batch_size, len(users))}/{len(users)}")
+
+        if failures:
+            table = Table(show_header=True, header_style="bold magenta")
+            table.add_column("Line")
+            table.add_column("Username")
+            table.add_column("Reason")
+            for line, user_name, reason in sorted(failures):
+                table.add_row(str(line), user_name, reason)
+            self.console.print(table)
+
+        self.console.print(f"\n[bold green]✓ {created} users created[/bold green], "
+                           f"[bold red]{len(failures)} rows not imported[/bold red]")
+
     async def run_cli(self):
         """Run the admin CLI interface"""
         while True:
@@ -250,8 +362,19 @@ class Admin:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precepto user administration. Interactive without a command.")
+    commands = parser.add_subparsers(dest="command")
+    import_parser = commands.add_parser("import", help="Create users from a CSV (with header) or JSONL file")
+    import_parser.add_argument("path", help="Columns/keys: user_name, password, first_name, last_name, email, is_admin, category")
+    import_parser.add_argument("--batch-size", type=int, default=100, help="Users inserted per statement")
+    import_parser.add_argument("--workers", type=int, default=None, help="Password hashing threads, defaults to the number of cores")
+    args = parser.parse_args()
+
     # Initialize the admin class
     admin = Admin()
-    
-    # Run the CLI
-    asyncio.run(admin.run_cli())
\ No newline at end of file
+
+    if args.command == "import":
+        asyncio.run(admin.import_users(args.path, batch_size=args.batch_size, workers=args.workers))
+    else:
+        # Run the CLI
+        asyncio.run(admin.run_cli())
\ No newline at end of file
@@ -1,10 +1,10 @@
 import asyncio
 import sys
-import bcrypt
 import jwt
 import json
 import logging
 import os
+import time
 from datetime import datetime, timedelta, timezone
 
 from edgedb import errors
@@ -17,12 +17,16 @@ if parent_dir not in sys.path:
 from common.nats_client import NATSClient
 
 from common.edgedb_client import EdgedbClient
+from common.metrics import Metrics
+from common.password_hasher import PasswordHasher
+from common.token_utils import TokenValidator
 from common.queries.user.user_read_async_edgeql import UserReadResult as User 
-from common.queries.user.user_read_by_username_async_edgeql import user_read_by_username
 from common.queries.user.user_update_async_edgeql import user_update
 from common.queries.user.user_create_async_edgeql import user_create
-from common.queries.auth.auth_token_read_async_edgeql import auth_token_read
-from common.queries.auth.auth_token_create_async_edgeql import auth_token_create
+from common.queries.user.user_read_for_login_async_edgeql import user_read_for_login
+from common.queries.auth.auth_login_async_edgeql import auth_login
+from common.queries.auth.auth_token_rotate_async_edgeql import auth_token_rotate
+from common.queries.auth.auth_token_delete_expired_async_edgeql import auth_token_delete_expired
 from common.queries.auth.auth_token_delete_async_edgeql import auth_token_delete 
 
 logging.basicConfig(level=logging.INFO)
@@ -42,14 +46,27 @@ class AuthenticationService:
     SUBJECT_LOGIN = 'auth.login'
     SUBJECT_CHANGE_PASSWORD = 'auth.change_password'
     SUBJECT_REFRESH_TOKEN = 'auth.refresh_token'
+    SUBJECT_LOGOUT = 'auth.logout'
     STREAM_NAME = "precepto_authentication_service"
     STREAM_LISTEN_SUBJECT = ["precepto.auth.*"]
+    # Threads hashing passwords at the same time, defaults to the number of cores
+    PASSWORD_HASH_WORKERS = int(os.environ.get('AUTH_PASSWORD_HASH_WORKERS', 0)) or None
+    # Requests per subject handled at the same time, the rest wait in the subscription
+    MAX_CONCURRENT_REQUESTS = int(os.environ.get('AUTH_MAX_CONCURRENT_REQUESTS', 64))
+    # Expired refresh tokens are deleted in batches of this size, every interval
+    TOKEN_SWEEP_INTERVAL_S = float(os.environ.get('AUTH_TOKEN_SWEEP_INTERVAL_S', 3600))
+    TOKEN_SWEEP_BATCH_SIZE = int(os.environ.get('AUTH_TOKEN_SWEEP_BATCH_SIZE', 1000))
 
     def __init__(self):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.nats_client = NATSClient()
         self.db = EdgedbClient()
         self.client = self.db.client
+        self.password_hasher = PasswordHasher(max_workers=self.PASSWORD_HASH_WORKERS)
+        self.metrics = Metrics('authentication')
+        self.metrics.gauge('password_hash_queue_depth', lambda: self.password_hasher.queued)
+        self.metrics.gauge('password_hash_active', lambda: self.password_hasher.active)
+        self.metrics.gauge('password_hash_workers', lambda: self.password_hasher.max_workers)
         # Add refresh token collection initialization
         # self.refresh_tokens_collection = self.client.db.refresh_tokens
 
@@ -57,6 +74,7 @@ class AuthenticationService:
         try:
             await self.nats_client.connect()
             await self.nats_client.create_stream(self.STREAM_NAME, self.STREAM_LISTEN_SUBJECT)
+            await self.metrics.serve(self.nats_client)
             self.logger.info("Connected to NATS and set up stream.")
         except Exception as e:
             self.logger.error(f"Failed to connect and set up NATSClient: {e}")
@@ -65,12 +83,14 @@ class AuthenticationService:
     def create_access_token(self, user: User, expires_delta: timedelta = None):
         to_encode = {
             "exp": datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=self.ACCESS_TOKEN_EXPIRE_MINUTES)),
+            # Sub-second, so a token issued right after a revocation is not caught by it
+            "iat": time.time(),
             "type": "access",
             "user": {
                 "id": str(user.id),
                 "user_name": user.user_name,
                 # "templates": user.Template,
-                "last_login": user.last_login.isoformat(),
+                "last_login": user.last_login.isoformat() if user.last_login else None,
                 "created_at": user.created_at.isoformat(),
                 "updated_at": user.updated_at.isoformat(),
                 "logged_in": user.logged_in,
@@ -86,18 +106,34 @@ class AuthenticationService:
         encoded_jwt = jwt.encode(to_encode, self.JWT_SECRET, algorithm=self.JWT_ALGORITHM)
         return encoded_jwt
 
-    async def store_refresh_token(self, user_id: str, refresh_token: str):
-        expires_at = datetime.now(timezone.utc) + timedelta(days=self.REFRESH_TOKEN_EXPIRE_DAYS)
-        await auth_token_create(self.client, user_id=user_id, token=refresh_token, expires_at=expires_at)
-        # await self.refresh_tokens_collection.insert_one({
-        #     'user_id': user_id,
-        #     'token': refresh_token,
-        #     'created_at': datetime.now(timezone.utc),
-        #     'expires_at': datetime.now(timezone.utc) + timedelta(days=self.REFRESH_TOKEN_EXPIRE_DAYS)
-        # })
+    async def sweep_expired_tokens(self) -> int:
+        """Delete expired refresh tokens, one bounded batch per statement, until none are left."""
+        swept = 0
+        while True:
+            deleted = await auth_token_delete_expired(self.client, batch_size=self.TOKEN_SWEEP_BATCH_SIZE)
+            swept += deleted
+            self.metrics.increment('auth_tokens_swept', deleted)
+            if deleted < self.TOKEN_SWEEP_BATCH_SIZE:
+                return swept
+
+    async def run_token_sweeper(self):
+        while True:
+            try:
+                swept = await self.sweep_expired_tokens()
+                self.metrics.increment('auth_token_sweeps')
+                if swept:
+                    self.logger.info(f"Deleted {swept} expired refresh tokens")
+            except Exception as e:
+                self.logger.error(f"Error sweeping expired tokens: {e}")
+            await asyncio.sleep(self.TOKEN_SWEEP_INTERVAL_S)
+
+    async def revoke_tokens(self, user_id: str):
+        """Delete the user's refresh token and reject their access tokens in every service."""
+        await self.revoke_refresh_token(user_id)
+        await TokenValidator.publish_revocation(self.nats_client, user_id)
 
     async def revoke_refresh_token(self, user_id: str):
-        await auth_token_delete(self.client, id=user_id)
+        await auth_token_delete(self.client, user_id=user_id)
         # await self.refresh_tokens_collection.delete_one({'token': refresh_token})
 
     async def handle_user_registration(self, msg):
@@ -106,12 +142,11 @@ class AuthenticationService:
             user_data = msg.data.decode()
             user_info = User(**json.loads(user_data))
             username = user_info.user_name
-            password = user_info.login_pass.encode('utf-8')
 
             self.logger.info(f"Registering user: {username}")
 
-            hashed_password = bcrypt.hashpw(password, bcrypt.gensalt())
-            user_info.login_pass = hashed_password.decode('utf-8')
+            user_info.login_pass = await self.password_hasher.hash(user_info.login_pass)
+            self.metrics.increment('password_hashes')
             user_info.created_at = datetime.now(timezone.utc)
             user_info.updated_at = user_info.created_at
             user_doc = user_info.model_dump(by_alias=True)
@@ -136,42 +171,22 @@ class AuthenticationService:
             credentials = msg.data.decode()
             credentials = json.loads(credentials)
             username = credentials['username']
-            password = credentials['password'].encode('utf-8')
-            user_doc = await user_read_by_username(self.client, user_name=str(username) )
+            password = credentials['password']
+            user_doc = await user_read_for_login(self.client, user_name=str(username) )
             # user_doc = await self.users_collection.find_one({"name": username})
-            print("user doc", user_doc)
             if not user_doc:
                 response = {'status': 'error', 'message': 'Invalid username or password.'}
                 await msg.respond(json.dumps(response).encode())
                 return
 
-            stored_hashed_password = user_doc.login_pass.encode('utf-8')
-            print("stored_hashed_password", stored_hashed_password)
-            if bcrypt.checkpw(password, stored_hashed_password):
+            self.metrics.increment('password_verifications')
+            if await self.password_hasher.verify(password, user_doc.login_pass):
                 updated_at = datetime.now(timezone.utc)
-
-                print("after bcrypt")
-                # await self.users_collection.update_one(
-                #     {"name": username},
-                #     {"$set": {
-                #         "last_login": updated_at,
-                #         "logged_in": True,
-                #         "updated_at": updated_at
-                #     }}
-                # )
-                await user_update(self.client, logged_in=True,  id=user_doc.id, last_login=updated_at, category=user_doc.category)
-                print("after update")
-                # user_doc['last_login'] = updated_at
-                # user_doc['logged_in'] = True
-                # user_doc['updated_at'] = updated_at
-                # print("before user cast")
-                # user = User(**user_doc) # WORKAROUND: EdgeDB returns a dict instead of a User object
-                access_token = self.create_access_token(user_doc)
                 refresh_token = self.create_refresh_token({"sub": str(user_doc.id), "user_name": user_doc.user_name})
-                print("after tokens")
-                # Store refresh token
-                await self.store_refresh_token(user_id=user_doc.id, refresh_token=refresh_token)
-                print("after store refresh token")
+                # Sets last_login and replaces the user's refresh token in one statement
+                user = await auth_login(self.client, user_id=user_doc.id, last_login=updated_at, token=refresh_token,
+                                        expires_at=updated_at + timedelta(days=self.REFRESH_TOKEN_EXPIRE_DAYS))
+                access_token = self.create_access_token(user)
                 self.logger.info(f"User '{username}' logged in successfully.")
                 response = {
                     'status': 'success',
@@ -192,7 +207,7 @@ class AuthenticationService:
             data = msg.data.decode()
             data = json.loads(data)
             access_token = data.get('access_token')
-            new_password = data.get('new_password').encode('utf-8')
+            new_password = data.get('new_password')
 
             payload = jwt.decode(access_token, self.JWT_SECRET, algorithms=[self.JWT_ALGORITHM])
 
@@ -205,13 +220,14 @@ class AuthenticationService:
                 raise jwt.InvalidTokenError('Username not found in token')
 
             # user_doc = await self.users_collection.find_one({"name": username})
-            user_doc = await user_read_by_username(self.client, user_name=str(username) )
+            user_doc = await user_read_for_login(self.client, user_name=str(username) )
             if not user_doc:
                 response = {'status': 'error', 'message': 'User not found.'}
                 await msg.respond(json.dumps(response).encode())
                 return
 
-            hashed_password = bcrypt.hashpw(new_password, bcrypt.gensalt())
+            hashed_password = await self.password_hasher.hash(new_password)
+            self.metrics.increment('password_hashes')
             updated_at = datetime.now(timezone.utc)
             # await self.users_collection.update_one(
             #     {"name": username},
@@ -220,7 +236,8 @@ class AuthenticationService:
             #         "updated_at": updated_at
             #     }}
             # )
-            await user_update(self.client, login_pass=hashed_password.decode('utf-8'), updated_at=updated_at, id=user_doc.id,  category=user_doc.category)
+            await user_update(self.client, login_pass=hashed_password, updated_at=updated_at, id=user_doc.id,  category=user_doc.category)
+            await self.revoke_tokens(user_doc.id)
             self.logger.info(f"Password for user '{username}' changed successfully.")
             response = {'status': 'success', 'message': 'Password changed successfully.'}
             await msg.respond(json.dumps(response).encode())
@@ -235,6 +252,30 @@ class AuthenticationService:
             response = {'status': 'error', 'message': 'Password change failed.'}
             await msg.respond(json.dumps(response).encode())
 
+    async def handle_logout(self, msg):
+        try:
+            data = json.loads(msg.data.decode())
+            payload = jwt.decode(data.get('access_token'), self.JWT_SECRET, algorithms=[self.JWT_ALGORITHM])
+
+            if payload.get('type') != 'access':
+                raise jwt.InvalidTokenError('Invalid token type')
+
+            user_id = payload.get('user', {}).get('id')
+            if not user_id:
+                raise jwt.InvalidTokenError('User not found in token')
+
+            await self.revoke_tokens(user_id)
+            self.logger.info(f"User '{payload['user'].get('user_name')}' logged out.")
+            response = {'status': 'success', 'message': 'Logged out.'}
+        except jwt.ExpiredSignatureError:
+            response = {'status': 'error', 'message': 'Access token expired.'}
+        except jwt.InvalidTokenError:
+            response = {'status': 'error', 'message': 'Invalid access token.'}
+        except Exception as e:
+            self.logger.error(f"Logout error: {e}")
+            response = {'status': 'error', 'message': 'Logout failed.'}
+        await msg.respond(json.dumps(response).encode())
+
     async def handle_token_refresh(self, msg):
         print("handle_token_refresh got request", msg)
         try:
@@ -248,34 +289,21 @@ class AuthenticationService:
             if payload.get('type') != 'refresh':
                 raise jwt.InvalidTokenError('Invalid token type')
 
+            user_id = payload.get('sub')
             username = payload.get('user_name')
 
-            if not username:
-                raise jwt.InvalidTokenError('Username not found in token')
+            if not user_id or not username:
+                raise jwt.InvalidTokenError('User not found in token')
 
-            # user_doc = await self.users_collection.find_one({"name": username})
-            user_doc = await user_read_by_username(self.client, user_name=str(username) )
-            if not user_doc:
-                response = {'status': 'error', 'message': 'User not found.'}
-                await msg.respond(json.dumps(response).encode())
-                return
-
-            # Verify token exists in database
-            # stored_token = await self.refresh_tokens_collection.find_one({"token": refresh_token})
-            stored_token = await auth_token_read(self.client, id=str(user_doc.id))
-            if not stored_token:
+            # Swaps in the new refresh token only if the presented one is the stored, unexpired one
+            new_refresh_token = self.create_refresh_token({"sub": user_id, "user_name": username})
+            expires_at = datetime.now(timezone.utc) + timedelta(days=self.REFRESH_TOKEN_EXPIRE_DAYS)
+            rotated = await auth_token_rotate(self.client, user_id=user_id, token=refresh_token,
+                                              new_token=new_refresh_token, expires_at=expires_at)
+            if not rotated:
                 raise jwt.InvalidTokenError('Refresh token not found or revoked')
 
-            # Revoke old refresh token
-            await self.revoke_refresh_token(refresh_token)
-
-            # Create new tokens
-            # user = User(**user_doc)
-            access_token = self.create_access_token(user_doc)
-            new_refresh_token = self.create_refresh_token({"sub": str(user_doc.id), "user_name": user_doc.user_name})
-            
-            # Store new refresh token
-            await self.store_refresh_token(str(user_doc.id), new_refresh_token)
+            access_token = self.create_access_token(rotated.user)
 
             self.logger.info(f"Access token refreshed for user '{username}'.")
             response = {
@@ -297,14 +325,21 @@ class AuthenticationService:
 
     async def subscribe(self):
         try:
-            await self.nats_client.subscribe(self.SUBJECT_REGISTER, cb=self.handle_user_registration)
+            await self.nats_client.subscribe(self.SUBJECT_REGISTER, cb=self.handle_user_registration,
+                                             max_concurrent=self.MAX_CONCURRENT_REQUESTS)
             self.logger.info(f"Subscribed to subject '{self.SUBJECT_REGISTER}'")
-            await self.nats_client.subscribe(self.SUBJECT_LOGIN, cb=self.handle_user_login)
+            await self.nats_client.subscribe(self.SUBJECT_LOGIN, cb=self.handle_user_login,
+                                             max_concurrent=self.MAX_CONCURRENT_REQUESTS)
             self.logger.info(f"Subscribed to subject '{self.SUBJECT_LOGIN}'")
-            await self.nats_client.subscribe(self.SUBJECT_CHANGE_PASSWORD, cb=self.handle_password_change)
+            await self.nats_client.subscribe(self.SUBJECT_CHANGE_PASSWORD, cb=self.handle_password_change,
+                                             max_concurrent=self.MAX_CONCURRENT_REQUESTS)
             self.logger.info(f"Subscribed to subject '{self.SUBJECT_CHANGE_PASSWORD}'")
-            await self.nats_client.subscribe(self.SUBJECT_REFRESH_TOKEN, cb=self.handle_token_refresh)
+            await self.nats_client.subscribe(self.SUBJECT_REFRESH_TOKEN, cb=self.handle_token_refresh,
+                                             max_concurrent=self.MAX_CONCURRENT_REQUESTS)
             self.logger.info(f"Subscribed to subject '{self.SUBJECT_REFRESH_TOKEN}'")
+            await self.nats_client.subscribe(self.SUBJECT_LOGOUT, cb=self.handle_logout,
+                                             max_concurrent=self.MAX_CONCURRENT_REQUESTS)
+            self.logger.info(f"Subscribed to subject '{self.SUBJECT_LOGOUT}'")
         except Exception as e:
             self.logger.error(f"Failed to subscribe to subjects: {e}")
             raise
@@ -318,6 +353,7 @@ class AuthenticationService:
         await self.connect()
         self.logger.info("will subscribe")
         await self.subscribe()
+        sweeper = asyncio.create_task(self.run_token_sweeper())
         self.logger.info("will run is complete")
 
         try:
@@ -325,7 +361,9 @@ class AuthenticationService:
                 await asyncio.sleep(1)
         except KeyboardInterrupt:
             self.logger.info("Shutting down Authentication Service.")
+            sweeper.cancel()
             await self.nats_client.close()
+            self.password_hasher.shutdown()
             self.db.mongo_client.close()
 
 if __name__ == '__main__':
@@ -0,0 +1,55 @@
+# common/metrics.py
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Callable, Dict
+
+
+class Metrics:
+    """
+    In-process counters and gauges for a service. A snapshot is served as JSON on
+    the NATS request subject 'metrics.<service>'.
+    """
+
+    def __init__(self, service: str):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.service = service
+        self.started_at = time.time()
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.gauges: Dict[str, Callable[[], float]] = {}
+
+    @property
+    def subject(self) -> str:
+        return f"metrics.{self.service}"
+
+    @property
+    def uptime_s(self) -> float:
+        return time.time() - self.started_at
+
+    def increment(self, name: str, value: float = 1):
+        self.counters[name] += value
+
+    def gauge(self, name: str, read: Callable[[], float]):
+        """Register a gauge, read is called every time a snapshot is taken."""
+        self.gauges[name] = read
+
+    def snapshot(self) -> dict:
+        gauges = {}
+        for name, read in self.gauges.items():
+            try:
+                gauges[name] = read()
+            except Exception as e:
+                self.logger.error(f"Error reading gauge '{name}': {e}")
+        return {
+            'service': self.service,
+            'uptime_s': self.uptime_s,
+            'counters': dict(self.counters),
+            'gauges': gauges,
+        }
+
+    async def handle_request(self, msg):
+        await msg.respond(json.dumps(self.snapshot()).encode())
+
+    async def serve(self, nats_client):
+        await nats_client.subscribe(self.subject, self.handle_request)
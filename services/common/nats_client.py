@@ -2,12 +2,13 @@
 import asyncio
 import json
 from nats.aio.client import Client as NATS
+from nats.errors import TimeoutError as NATSTimeoutError
 from nats.js.errors import BucketNotFoundError, APIError, NotFoundError
-from nats.js.api import StreamConfig
+from nats.js.api import StreamConfig, ConsumerConfig, AckPolicy
 import os
 import sys
 import logging
-from typing import List, Optional
+from typing import List, Optional, Set
 
 # Adjust the parent directory for module imports
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -15,6 +16,7 @@ if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
 from common.models import User, TranscriptTemplate, TranscriptionMeta
+from common.serialization import encode, negotiate
 
 logging.basicConfig(level=logging.INFO)
 
@@ -24,6 +26,13 @@ if os.environ.get('PROD_MODE',"false") == 'false':
     load_dotenv(dotenv_path=os.path.join(os.path.pardir,".env"))
     
 class NATSClient:
+    # Work-queue stream backing the recording -> transcription -> summarization pipeline
+    PIPELINE_STREAM_NAME = 'precepto_pipeline'
+    PIPELINE_SUBJECTS = ['recording.completed', 'transcription.completed']
+    # Unacked jobs a durable consumer hands out across all instances sharing it,
+    # each instance limits its own jobs with max_in_flight
+    CONSUMER_MAX_ACK_PENDING = int(os.environ.get('NATS_CONSUMER_MAX_ACK_PENDING', 1000))
+
     def __init__(self, loop=None):
         self.loop = loop or asyncio.get_event_loop()
         self.nc = NATS()
@@ -32,6 +41,10 @@ class NATSClient:
         self.kv_templates: Optional[any] = None
         self.kv_transcriptions: Optional[any] = None
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.consumer_tasks: List[asyncio.Task] = []
+        self.handler_tasks: Set[asyncio.Task] = set()
+        # Jobs pulled by consume() that are still running
+        self.job_tasks: Set[asyncio.Task] = set()
         self.nats_url = json.loads(os.environ.get('NATS_URL', [
             #"nats://na_1:4222",
             #"nats://na_2:4223",
@@ -64,7 +77,7 @@ class NATSClient:
             self.logger.error(f"Error connecting to NATS: {e}")
             raise
 
-    async def create_stream(self, name_string: str, subjects_list: List[str]):
+    async def create_stream(self, name_string: str, subjects_list: List[str], retention: str = "limits"):
         stream_name = name_string
         subjects = subjects_list
 
@@ -78,7 +91,7 @@ class NATSClient:
                 name=stream_name,
                 subjects=subjects,
                 storage="file",  # Options: "file" or "memory"
-                retention="limits",  # Options: "limits", "interest", "workqueue"
+                retention=retention,  # Options: "limits", "interest", "workqueue"
                 max_msgs=100000,
                 max_bytes=1_000_000_000,  # 1 GB
                 max_age=72 * 3600,  # 72 hours in seconds
@@ -94,6 +107,100 @@ class NATSClient:
                 logging.error(f"Unexpected error while creating stream '{stream_name}': {e}")
                 raise
 
+    async def create_pipeline_stream(self):
+        await self.create_stream(self.PIPELINE_STREAM_NAME, self.PIPELINE_SUBJECTS, retention="workqueue")
+
+    async def consume(self, stream: str, subject: str, durable: str, cb,
+                      max_in_flight: int = 1, ack_wait: float = 60, max_deliver: int = 5,
+                      timeout: Optional[float] = None, max_ack_pending: Optional[int] = None):
+        """
+        Process a work-queue subject through a durable pull consumer. Each message is
+        handed to cb and acked when it returns, or nak'ed with backoff when it raises
+        or runs longer than timeout, so a job is redelivered until it succeeds or hits
+        max_deliver. All instances sharing the durable name split the work between them,
+        each running at most max_in_flight jobs at a time.
+        """
+        config = ConsumerConfig(
+            name=durable,
+            durable_name=durable,
+            ack_policy=AckPolicy.EXPLICIT,
+            ack_wait=ack_wait,
+            max_deliver=max_deliver,
+            max_ack_pending=max_ack_pending or self.CONSUMER_MAX_ACK_PENDING,
+            filter_subject=subject,
+        )
+        await self.ensure_consumer(stream, config)
+        sub = await self.js.pull_subscribe(subject, durable=durable, stream=stream, config=config)
+        task = asyncio.create_task(self._consume_loop(sub, cb, max_in_flight, ack_wait, timeout))
+        self.consumer_tasks.append(task)
+        self.logger.info(f"Consuming subject '{subject}' as durable '{durable}' (max in flight: {max_in_flight})")
+        return task
+
+    async def ensure_consumer(self, stream: str, config: ConsumerConfig):
+        """Create the durable consumer, or update it when its settings changed since it was created."""
+        try:
+            info = await self.js.consumer_info(stream, config.durable_name)
+        except NotFoundError:
+            await self.js.add_consumer(stream, config=config)
+            return
+
+        current = info.config
+        if (current.max_ack_pending, current.ack_wait, current.max_deliver) != \
+                (config.max_ack_pending, config.ack_wait, config.max_deliver):
+            # Creating an existing consumer with changed editable settings updates it
+            await self.js.add_consumer(stream, config=config)
+            self.logger.info(f"Updated consumer '{config.durable_name}' on stream '{stream}'")
+
+    async def _consume_loop(self, sub, cb, max_in_flight: int, ack_wait: float, timeout: Optional[float]):
+        slots = asyncio.Semaphore(max_in_flight)
+        while True:
+            # Only pull a job when there is a free slot to run it
+            await slots.acquire()
+            try:
+                msgs = await sub.fetch(1, timeout=5)
+            except NATSTimeoutError:
+                slots.release()
+                continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Error fetching from pull consumer: {e}")
+                slots.release()
+                await asyncio.sleep(1)
+                continue
+
+            for msg in msgs:
+                task = asyncio.create_task(self._process_job(msg, cb, ack_wait, slots, timeout))
+                self.job_tasks.add(task)
+                task.add_done_callback(self.job_tasks.discard)
+
+    async def _process_job(self, msg, cb, ack_wait: float, slots: asyncio.Semaphore,
+                           timeout: Optional[float] = None):
+        # Keep long running jobs from being redelivered to another worker
+        heartbeat = asyncio.create_task(self._keep_in_progress(msg, ack_wait / 2))
+        try:
+            await asyncio.wait_for(cb(msg), timeout)
+            await msg.ack()
+        except asyncio.TimeoutError:
+            deliveries = msg.metadata.num_delivered
+            self.logger.error(f"Job on '{msg.subject}' timed out after {timeout}s (delivery {deliveries})")
+            await msg.nak(delay=min(2 ** deliveries, 60))
+        except Exception as e:
+            deliveries = msg.metadata.num_delivered
+            self.logger.error(f"Job on '{msg.subject}' failed (delivery {deliveries}): {e}")
+            await msg.nak(delay=min(2 ** deliveries, 60))
+        finally:
+            heartbeat.cancel()
+            slots.release()
+
+    async def _keep_in_progress(self, msg, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await msg.in_progress()
+            except Exception as e:
+                self.logger.error(f"Failed to extend ack deadline: {e}")
+
     async def setup_kv_bucket(self, name: str):
         bucket_name = name
         kv = None
@@ -141,14 +248,56 @@ class NATSClient:
         except Exception as e:
             self.logger.error(f"Failed to delete key '{key}' from KV store: {e}")
 
-    async def subscribe(self, subject: str, cb):
+    async def subscribe(self, subject: str, cb, max_concurrent: int = 1):
+        """
+        Subscribe cb to a subject. nats-py hands a subscription's messages to its callback
+        one after the other, with max_concurrent > 1 up to that many are handled at once.
+        """
+        if max_concurrent > 1:
+            cb = self._concurrent(cb, max_concurrent)
         await self.nc.subscribe(subject, cb=cb)
         self.logger.info(f"Subscribed to subject: {subject}")
 
+    def _concurrent(self, cb, max_concurrent: int):
+        slots = asyncio.Semaphore(max_concurrent)
+
+        def done(task: asyncio.Task):
+            self.handler_tasks.discard(task)
+            slots.release()
+            if not task.cancelled() and task.exception() is not None:
+                self.logger.error(f"Error in message handler {cb.__name__}: {task.exception()}")
+
+        async def dispatch(msg):
+            # Waiting for a slot here holds back the subscription's pending queue
+            await slots.acquire()
+            task = asyncio.create_task(cb(msg))
+            self.handler_tasks.add(task)
+            task.add_done_callback(done)
+
+        return dispatch
+
     async def publish(self, subject: str, message: str, headers=None):
         await self.nc.publish(subject, message.encode(), headers=headers)
         self.logger.info(f"Published to subject: {subject}")
 
+    async def respond(self, msg, response):
+        """Reply to a request, encoded in the format asked for by its 'Accept' header."""
+        content_type = negotiate(msg.headers)
+        await self.nc.publish(msg.reply, encode(response, content_type), headers={'Content-Type': content_type})
+
+    async def js_publish(self, subject: str, message: str, headers=None):
+        """Publish to a stream subject and wait for the server to persist it."""
+        ack = await self.js.publish(subject, message.encode(), headers=headers)
+        self.logger.info(f"Published to stream '{ack.stream}' subject: {subject}")
+        return ack
+
     async def close(self):
+        for task in self.consumer_tasks:
+            task.cancel()
+        # Cancelled jobs are not acked, so the server redelivers them to another instance
+        jobs = list(self.job_tasks)
+        for task in jobs:
+            task.cancel()
+        await asyncio.gather(*self.consumer_tasks, *jobs, return_exceptions=True)
         await self.nc.close()
         self.logger.info("Disconnected from NATS")
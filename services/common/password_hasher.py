@@ -0,0 +1,61 @@
+# common/password_hasher.py
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a bounded thread pool so hashing never blocks the event loop.
+    bcrypt releases the GIL while it works, so threads scale with the cores.
+    At most max_workers calls run at a time, the rest wait on the event loop;
+    'queued' and 'active' count them for metrics.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, rounds: int = 12):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.rounds = rounds
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='bcrypt')
+        # Created on first use so it binds to the running loop
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.queued = 0
+        self.active = 0
+
+    async def _run(self, func, *args):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_workers)
+
+        self.queued += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.active += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+
+    def _hash(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    @staticmethod
+    def _verify(password: str, hashed_password: str) -> bool:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self._verify, password, hashed_password)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
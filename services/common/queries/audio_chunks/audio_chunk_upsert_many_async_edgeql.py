@@ -0,0 +1,44 @@
+# AUTOGENERATED FROM 'common/queries/audio_chunks/audio_chunk_upsert_many.edgeql' WITH:
+#     $ edgedb-py --tls-security=insecure -P 5656 -d precepto --dir ./common/queries
+
+
+from __future__ import annotations
+import edgedb
+
+
+async def audio_chunk_upsert_many(
+    executor: edgedb.AsyncIOExecutor,
+    *,
+    chunks: str,
+) -> int:
+    return await executor.query_single(
+        """\
+        # Insert or update many audio chunks in one statement and return how many were written.
+        # $chunks is a JSON array of objects with chunk_id, recording_id, start_time, end_time,
+        # status and data_path, a chunk may appear only once.
+        WITH chunks := <json>$chunks
+        SELECT count((
+            FOR c IN json_array_unpack(chunks) UNION (
+                INSERT AudioChunk {
+                    chunk_id := <str>c['chunk_id'],
+                    recording_id := <str>c['recording_id'],
+                    start_time := <float64>c['start_time'],
+                    end_time := <float64>c['end_time'],
+                    status := <str>c['status'],
+                    data_path := <str>c['data_path']
+                }
+                UNLESS CONFLICT ON (.chunk_id, .recording_id)
+                ELSE (
+                    UPDATE AudioChunk
+                    SET {
+                        start_time := <float64>c['start_time'],
+                        end_time := <float64>c['end_time'],
+                        status := <str>c['status'],
+                        data_path := <str>c['data_path']
+                    }
+                )
+            )
+        ));\
+        """,
+        chunks=chunks,
+    )
@@ -0,0 +1,90 @@
+# AUTOGENERATED FROM 'common/queries/auth/auth_login.edgeql' WITH:
+#     $ edgedb-py --tls-security=insecure -P 5656 -d precepto --dir ./common/queries
+
+
+from __future__ import annotations
+import dataclasses
+import datetime
+import edgedb
+import uuid
+
+
+class NoPydanticValidation:
+    @classmethod
+    def __get_pydantic_core_schema__(cls, _source_type, _handler):
+        # Pydantic 2.x
+        from pydantic_core.core_schema import any_schema
+        return any_schema()
+
+    @classmethod
+    def __get_validators__(cls):
+        # Pydantic 1.x
+        from pydantic.dataclasses import dataclass as pydantic_dataclass
+        _ = pydantic_dataclass(cls)
+        cls.__pydantic_model__.__get_validators__ = lambda: []
+        return []
+
+
+@dataclasses.dataclass
+class AuthLoginResult(NoPydanticValidation):
+    id: uuid.UUID
+    user_name: str
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
+    last_login: datetime.datetime | None
+    logged_in: bool | None
+    refresh_token_expires_at: datetime.datetime | None
+
+
+async def auth_login(
+    executor: edgedb.AsyncIOExecutor,
+    *,
+    user_id: uuid.UUID,
+    last_login: datetime.datetime,
+    token: str,
+    expires_at: datetime.datetime,
+) -> AuthLoginResult | None:
+    return await executor.query_single(
+        """\
+        # Mark a user as logged in and store their refresh token, replacing the previous one
+        WITH
+            logged_in_user := (
+                UPDATE User
+                FILTER .id = <uuid>$user_id
+                SET {
+                    last_login := <datetime>$last_login,
+                    logged_in := true
+                }
+            ),
+            auth_token := (
+                INSERT AuthToken {
+                    user := logged_in_user,
+                    token := <str>$token,
+                    expires_at := <datetime>$expires_at
+                }
+                UNLESS CONFLICT ON .user
+                ELSE (
+                    UPDATE AuthToken
+                    SET {
+                        token := <str>$token,
+                        expires_at := <datetime>$expires_at,
+                        updated_at := datetime_current()
+                    }
+                )
+            )
+        # Selected from the UPDATE so the shape shows the new last_login
+        SELECT logged_in_user {
+            id,
+            user_name,
+            created_at,
+            updated_at,
+            last_login,
+            logged_in,
+            refresh_token_expires_at := auth_token.expires_at
+        };\
+        """,
+        user_id=user_id,
+        last_login=last_login,
+        token=token,
+        expires_at=expires_at,
+    )
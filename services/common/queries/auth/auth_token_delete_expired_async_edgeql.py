@@ -0,0 +1,26 @@
+# AUTOGENERATED FROM 'common/queries/auth/auth_token_delete_expired.edgeql' WITH:
+#     $ edgedb-py --tls-security=insecure -P 5656 -d precepto --dir ./common/queries
+
+
+from __future__ import annotations
+import edgedb
+
+
+async def auth_token_delete_expired(
+    executor: edgedb.AsyncIOExecutor,
+    *,
+    batch_size: int,
+) -> int:
+    return await executor.query_single(
+        """\
+        # Delete up to $batch_size expired auth tokens, oldest first, and return how many were deleted
+        WITH expired := (
+            SELECT AuthToken
+            FILTER .expires_at < datetime_current()
+            ORDER BY .expires_at
+            LIMIT <int64>$batch_size
+        )
+        SELECT count((DELETE expired));\
+        """,
+        batch_size=batch_size,
+    )
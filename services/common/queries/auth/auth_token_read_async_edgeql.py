@@ -59,9 +59,10 @@ async def auth_token_read(
 ) -> list[AuthTokenReadResult]:
     return await executor.query(
         """\
-        # Read a Token by User ID
+        # Read the unexpired token of a user
         SELECT AuthToken  {**}
-        FILTER .user.id = <uuid>$user_id;\
+        FILTER .user.id = <uuid>$user_id
+            AND .expires_at > datetime_current();\
         """,
         user_id=user_id,
     )
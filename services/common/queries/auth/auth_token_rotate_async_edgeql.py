@@ -0,0 +1,83 @@
+# AUTOGENERATED FROM 'common/queries/auth/auth_token_rotate.edgeql' WITH:
+#     $ edgedb-py --tls-security=insecure -P 5656 -d precepto --dir ./common/queries
+
+
+from __future__ import annotations
+import dataclasses
+import datetime
+import edgedb
+import uuid
+
+
+class NoPydanticValidation:
+    @classmethod
+    def __get_pydantic_core_schema__(cls, _source_type, _handler):
+        # Pydantic 2.x
+        from pydantic_core.core_schema import any_schema
+        return any_schema()
+
+    @classmethod
+    def __get_validators__(cls):
+        # Pydantic 1.x
+        from pydantic.dataclasses import dataclass as pydantic_dataclass
+        _ = pydantic_dataclass(cls)
+        cls.__pydantic_model__.__get_validators__ = lambda: []
+        return []
+
+
+@dataclasses.dataclass
+class AuthTokenRotateResult(NoPydanticValidation):
+    id: uuid.UUID
+    user: AuthTokenRotateResultUser
+
+
+@dataclasses.dataclass
+class AuthTokenRotateResultUser(NoPydanticValidation):
+    id: uuid.UUID
+    user_name: str
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
+    last_login: datetime.datetime | None
+    logged_in: bool | None
+
+
+async def auth_token_rotate(
+    executor: edgedb.AsyncIOExecutor,
+    *,
+    user_id: uuid.UUID,
+    token: str,
+    new_token: str,
+    expires_at: datetime.datetime,
+) -> AuthTokenRotateResult | None:
+    return await executor.query_single(
+        """\
+        # Replace a user's refresh token, only if the presented token is the stored, unexpired one
+        WITH
+            rotated := (
+                UPDATE AuthToken
+                FILTER .user.id = <uuid>$user_id
+                    AND .token = <str>$token
+                    AND .expires_at > datetime_current()
+                SET {
+                    token := <str>$new_token,
+                    expires_at := <datetime>$expires_at,
+                    updated_at := datetime_current()
+                }
+            )
+        SELECT rotated {
+            id,
+            user: {
+                id,
+                user_name,
+                created_at,
+                updated_at,
+                last_login,
+                logged_in
+            }
+        };\
+        """,
+        user_id=user_id,
+        token=token,
+        new_token=new_token,
+        expires_at=expires_at,
+    )
@@ -71,18 +71,7 @@ class TranscriptReadAllResultAnalyticsItem(NoPydanticValidation):
 
 @dataclasses.dataclass
 class TranscriptReadAllResultCreatedBy(NoPydanticValidation):
-    updated_at: datetime.datetime
-    created_at: datetime.datetime
     id: uuid.UUID
-    category: str
-    email: str | None
-    first_name: str | None
-    image_url: str | None
-    is_admin: bool | None
-    last_login: datetime.datetime | None
-    last_name: str | None
-    logged_in: bool | None
-    login_pass: str | None
     user_name: str
 
 
@@ -132,8 +121,15 @@ async def transcript_read_all(
 ) -> list[TranscriptReadAllResult]:
     return await executor.query(
         """\
-        # Read a transcription by ID
-        SELECT Transcription {**}
+        # Read all transcriptions of a user with their template, analytics and translations.
+        # created_by only carries the id and user name, never the user's login details.
+        SELECT Transcription {
+            *,
+            template: {*},
+            analytics: {*},
+            translations: {*},
+            created_by: {id, user_name}
+        }
         FILTER .created_by.id = <uuid>$user_id;\
         """,
         user_id=user_id,
@@ -0,0 +1,91 @@
+# AUTOGENERATED FROM 'common/queries/transcriptions/transcript_read_page.edgeql' WITH:
+#     $ edgedb-py --tls-security=insecure -P 5656 -d precepto --dir ./common/queries
+
+
+from __future__ import annotations
+import dataclasses
+import datetime
+import edgedb
+import enum
+import uuid
+
+
+class NoPydanticValidation:
+    @classmethod
+    def __get_pydantic_core_schema__(cls, _source_type, _handler):
+        # Pydantic 2.x
+        from pydantic_core.core_schema import any_schema
+        return any_schema()
+
+    @classmethod
+    def __get_validators__(cls):
+        # Pydantic 1.x
+        from pydantic.dataclasses import dataclass as pydantic_dataclass
+        _ = pydantic_dataclass(cls)
+        cls.__pydantic_model__.__get_validators__ = lambda: []
+        return []
+
+
+@dataclasses.dataclass
+class TranscriptReadPageResult(NoPydanticValidation):
+    id: uuid.UUID
+    name: str
+    status: TranscriptionStatusType
+    backend_status: TranscriptionBackendStatusType
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
+    duration: float | None
+
+
+class TranscriptionBackendStatusType(enum.Enum):
+    DRAFT = "draft"
+    RECORDING_SERVICE = "recording_service"
+    TRANSCRIPTION_SERVICE = "transcription_service"
+    SUMMARIZATION_SERVICE = "summarization_service"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class TranscriptionStatusType(enum.Enum):
+    SIGNED = "signed"
+    NOT_SIGNED = "not_signed"
+    QUEUED = "queued"
+    FAILED = "failed"
+    PROCESSING = "processing"
+    DRAFT = "draft"
+
+
+async def transcript_read_page(
+    executor: edgedb.AsyncIOExecutor,
+    *,
+    cursor_created_at: datetime.datetime | None = None,
+    cursor_id: uuid.UUID | None = None,
+    user_id: uuid.UUID,
+    limit: int,
+) -> list[TranscriptReadPageResult]:
+    return await executor.query(
+        """\
+        # Read one page of a user's transcriptions, newest first, without any text bodies.
+        # Keyset pagination: pass the created_at and id of the last row of the previous page.
+        WITH
+            cursor_created_at := <optional datetime>$cursor_created_at,
+            cursor_id := <optional uuid>$cursor_id
+        SELECT Transcription {
+            id,
+            name,
+            status,
+            backend_status,
+            created_at,
+            updated_at,
+            duration
+        }
+        FILTER .created_by.id = <uuid>$user_id
+            AND ((.created_at < cursor_created_at OR (.created_at = cursor_created_at AND .id < cursor_id)) ?? true)
+        ORDER BY .created_at DESC THEN .id DESC
+        LIMIT <int64>$limit;\
+        """,
+        cursor_created_at=cursor_created_at,
+        cursor_id=cursor_id,
+        user_id=user_id,
+        limit=limit,
+    )
@@ -0,0 +1,81 @@
+# AUTOGENERATED FROM 'common/queries/transcriptions/transcript_update_summary.edgeql' WITH:
+#     $ edgedb-py --tls-security=insecure -P 5656 -d precepto --dir ./common/queries
+
+
+from __future__ import annotations
+import dataclasses
+import datetime
+import edgedb
+import enum
+import uuid
+
+
+class NoPydanticValidation:
+    @classmethod
+    def __get_pydantic_core_schema__(cls, _source_type, _handler):
+        # Pydantic 2.x
+        from pydantic_core.core_schema import any_schema
+        return any_schema()
+
+    @classmethod
+    def __get_validators__(cls):
+        # Pydantic 1.x
+        from pydantic.dataclasses import dataclass as pydantic_dataclass
+        _ = pydantic_dataclass(cls)
+        cls.__pydantic_model__.__get_validators__ = lambda: []
+        return []
+
+
+@dataclasses.dataclass
+class TranscriptUpdateSummaryResult(NoPydanticValidation):
+    id: uuid.UUID
+
+
+class TranscriptionBackendStatusType(enum.Enum):
+    DRAFT = "draft"
+    RECORDING_SERVICE = "recording_service"
+    TRANSCRIPTION_SERVICE = "transcription_service"
+    SUMMARIZATION_SERVICE = "summarization_service"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class TranscriptionStatusType(enum.Enum):
+    SIGNED = "signed"
+    NOT_SIGNED = "not_signed"
+    QUEUED = "queued"
+    FAILED = "failed"
+    PROCESSING = "processing"
+    DRAFT = "draft"
+
+
+async def transcript_update_summary(
+    executor: edgedb.AsyncIOExecutor,
+    *,
+    id: uuid.UUID,
+    summary: str,
+    status: TranscriptionStatusType,
+    backend_status: TranscriptionBackendStatusType,
+    next_backend_step: str,
+    backend_updated_at: datetime.datetime,
+) -> TranscriptUpdateSummaryResult | None:
+    return await executor.query_single(
+        """\
+        # Update a transcription's summary and status, leaving its other fields as they are
+        UPDATE Transcription
+        FILTER .id = <uuid>$id
+        SET {
+            summary := <str>$summary,
+            status := <TranscriptionStatusType>$status,
+            backend_status := <TranscriptionBackendStatusType>$backend_status,
+            next_backend_step := <str>$next_backend_step,
+            backend_updated_at := <datetime>$backend_updated_at
+        };\
+        """,
+        id=id,
+        summary=summary,
+        status=status,
+        backend_status=backend_status,
+        next_backend_step=next_backend_step,
+        backend_updated_at=backend_updated_at,
+    )
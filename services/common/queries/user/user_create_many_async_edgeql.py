@@ -0,0 +1,64 @@
+# AUTOGENERATED FROM 'common/queries/user/user_create_many.edgeql' WITH:
+#     $ edgedb-py --tls-security=insecure -P 5656 -d precepto --dir ./common/queries
+
+
+from __future__ import annotations
+import dataclasses
+import edgedb
+import uuid
+
+
+class NoPydanticValidation:
+    @classmethod
+    def __get_pydantic_core_schema__(cls, _source_type, _handler):
+        # Pydantic 2.x
+        from pydantic_core.core_schema import any_schema
+        return any_schema()
+
+    @classmethod
+    def __get_validators__(cls):
+        # Pydantic 1.x
+        from pydantic.dataclasses import dataclass as pydantic_dataclass
+        _ = pydantic_dataclass(cls)
+        cls.__pydantic_model__.__get_validators__ = lambda: []
+        return []
+
+
+@dataclasses.dataclass
+class UserCreateManyResult(NoPydanticValidation):
+    id: uuid.UUID
+    user_name: str
+
+
+async def user_create_many(
+    executor: edgedb.AsyncIOExecutor,
+    *,
+    users: str,
+) -> list[UserCreateManyResult]:
+    return await executor.query(
+        """\
+        # Insert many users in one statement, user names that already exist are skipped.
+        # $users is a JSON array of objects with user_name, login_pass (hashed) and the optional
+        # first_name, last_name, email, is_admin and category,
+        # which are left out rather than set to null.
+        WITH users := <json>$users
+        SELECT (
+            FOR u IN json_array_unpack(users) UNION (
+                INSERT User {
+                    user_name := <str>u['user_name'],
+                    first_name := <str>json_get(u, 'first_name'),
+                    last_name := <str>json_get(u, 'last_name'),
+                    email := <str>json_get(u, 'email'),
+                    login_pass := <str>u['login_pass'],
+                    is_admin := <bool>json_get(u, 'is_admin') ?? false,
+                    category := <str>json_get(u, 'category') ?? 'others'
+                }
+                UNLESS CONFLICT ON .user_name
+            )
+        ) {
+            id,
+            user_name
+        };\
+        """,
+        users=users,
+    )
@@ -0,0 +1,61 @@
+# AUTOGENERATED FROM 'common/queries/user/user_read_for_login.edgeql' WITH:
+#     $ edgedb-py --tls-security=insecure -P 5656 -d precepto --dir ./common/queries
+
+
+from __future__ import annotations
+import dataclasses
+import datetime
+import edgedb
+import uuid
+
+
+class NoPydanticValidation:
+    @classmethod
+    def __get_pydantic_core_schema__(cls, _source_type, _handler):
+        # Pydantic 2.x
+        from pydantic_core.core_schema import any_schema
+        return any_schema()
+
+    @classmethod
+    def __get_validators__(cls):
+        # Pydantic 1.x
+        from pydantic.dataclasses import dataclass as pydantic_dataclass
+        _ = pydantic_dataclass(cls)
+        cls.__pydantic_model__.__get_validators__ = lambda: []
+        return []
+
+
+@dataclasses.dataclass
+class UserReadForLoginResult(NoPydanticValidation):
+    id: uuid.UUID
+    user_name: str
+    login_pass: str | None
+    category: str
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
+    last_login: datetime.datetime | None
+    logged_in: bool | None
+
+
+async def user_read_for_login(
+    executor: edgedb.AsyncIOExecutor,
+    *,
+    user_name: str,
+) -> UserReadForLoginResult | None:
+    return await executor.query_single(
+        """\
+        # Read the fields a login needs by username, without the user's templates and transcriptions
+        SELECT User {
+            id,
+            user_name,
+            login_pass,
+            category,
+            created_at,
+            updated_at,
+            last_login,
+            logged_in
+        }
+        FILTER .user_name = <str>$user_name;\
+        """,
+        user_name=user_name,
+    )
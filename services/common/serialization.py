@@ -0,0 +1,222 @@
+# common/serialization.py
+"""
+Encoding of service responses, EdgeDB query results included.
+
+Objects returned by the generated queries expose __dataclass_fields__, one dict
+per query shape. An encoder is compiled once per shape (a generated function
+that reads every field by attribute) and reused for every row of that shape,
+instead of walking dataclasses.asdict() and JSONEncoder.default() per value.
+
+Requesters pick the format with an 'Accept' header, JSON is the default and
+'application/msgpack' is available when msgpack is installed. orjson is used
+for JSON when installed, it writes UUIDs and datetimes natively.
+"""
+import dataclasses
+import datetime
+import enum
+import json
+import keyword
+import logging
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+
+logger = logging.getLogger(__name__)
+
+
+def _identity(value):
+    return value
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+class Encoder:
+    """
+    Converts responses to plain dicts, lists and scalars. Values whose type is
+    exactly one of 'native' are passed through untouched because the output
+    library writes them itself, subclasses of those are converted.
+    """
+
+    def __init__(self, native: Tuple[type, ...] = ()):
+        self.converters: Dict[type, Callable[[Any], Any]] = {
+            str: _identity,
+            int: _identity,
+            float: _identity,
+            bool: _identity,
+            type(None): _identity,
+            uuid.UUID: str,
+            datetime.datetime: _isoformat,
+            datetime.date: _isoformat,
+            datetime.time: _isoformat,
+            list: self.convert_list,
+            tuple: self.convert_list,
+            dict: self.convert_dict,
+        }
+        for native_type in native:
+            self.converters[native_type] = _identity
+        # id(__dataclass_fields__) -> (__dataclass_fields__, compiled encoder), the dict
+        # is kept so its id can not be reused by another shape
+        self.shapes: Dict[int, Tuple[dict, Callable[[Any], dict]]] = {}
+
+    def convert(self, value: Any) -> Any:
+        converter = self.converters.get(type(value))
+        if converter is None:
+            converter = self.converter_for(value)
+        return converter(value)
+
+    def convert_list(self, values) -> list:
+        convert = self.convert
+        return [convert(value) for value in values]
+
+    def convert_dict(self, values: dict) -> dict:
+        convert = self.convert
+        return {str(key): convert(value) for key, value in values.items()}
+
+    def convert_object(self, value) -> dict:
+        fields = value.__dataclass_fields__
+        shape = self.shapes.get(id(fields))
+        if shape is None:
+            shape = self.shapes[id(fields)] = (fields, self.compile(fields))
+        return shape[1](value)
+
+    def converter_for(self, value: Any) -> Callable[[Any], Any]:
+        """Resolve and remember the converter for a type not seen before."""
+        value_type = type(value)
+        if hasattr(value, '__dataclass_fields__'):
+            # EdgeDB objects share one type across shapes, they are told apart in convert_object
+            converter = self.convert_object
+        elif isinstance(value, enum.Enum):
+            # EdgeDB enum values are enum.Enum members with str values
+            converter = self.enum_value
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            # edgedb.Set and edgedb.Array are list subclasses
+            converter = self.convert_list
+        elif isinstance(value, dict):
+            converter = self.convert_dict
+        elif isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            # Only the exact types are native, orjson rejects subclasses
+            converter = _isoformat
+        elif isinstance(value, uuid.UUID):
+            # edgedb returns ids as its own uuid.UUID subclass
+            converter = str
+        else:
+            raise TypeError(f"Object of type {value_type.__name__} is not serializable")
+        self.converters[value_type] = converter
+        return converter
+
+    def enum_value(self, value: enum.Enum) -> Any:
+        return self.convert(value.value)
+
+    def compile(self, fields: dict) -> Callable[[Any], dict]:
+        """Generate a function building the dict for one object shape."""
+        items = []
+        for name in fields:
+            if name.isidentifier() and not keyword.iskeyword(name):
+                read = f"obj.{name}"
+            else:
+                read = f"getattr(obj, {name!r})"
+            items.append(f"{name!r}: convert({read})")
+        source = "def encode(obj):\n    return {" + ", ".join(items) + "}\n"
+        namespace = {'convert': self.convert}
+        exec(source, namespace)
+        return namespace['encode']
+
+
+_json_encoder = Encoder(native=(uuid.UUID, datetime.datetime, datetime.date, datetime.time) if orjson else ())
+_msgpack_encoder = Encoder()
+
+
+def to_builtins(value: Any) -> Any:
+    """Convert a response to plain dicts, lists and scalars."""
+    return _msgpack_encoder.convert(value)
+
+
+def negotiate(headers: Optional[dict]) -> str:
+    """Content type to answer a request with, from its 'Accept' header."""
+    accept = (headers or {}).get('Accept', '')
+    if MSGPACK in accept and msgpack is not None:
+        return MSGPACK
+    return JSON
+
+
+def encode(value: Any, content_type: str = JSON) -> bytes:
+    if content_type == MSGPACK:
+        return msgpack.packb(_msgpack_encoder.convert(value), use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(_json_encoder.convert(value))
+    return json.dumps(_json_encoder.convert(value)).encode('utf-8')
+
+
+def decode(data: bytes, content_type: Optional[str] = JSON) -> Any:
+    if content_type == MSGPACK:
+        return msgpack.unpackb(data, raw=False)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+if __name__ == '__main__':
+    # Benchmark: encode a 500 row transcript_read_all result with the old
+    # DataclassEncoder and with this module.
+    # python common/serialization.py
+    import os
+    import sys
+    import timeit
+
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    from common.edgedb_client import DataclassEncoder
+    from common.queries.transcriptions import transcript_read_all_async_edgeql as q
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    def row(i: int):
+        user = q.TranscriptReadAllResultCreatedBy(id=uuid.uuid4(), user_name='ola')
+        template = q.TranscriptReadAllResultTemplate(
+            updated_at=now, created_at=now, id=uuid.uuid4(), description='Standard', image_url=None,
+            is_public=True, name='Standard', template='{"sections": []}' * 20)
+        return q.TranscriptReadAllResult(
+            words=1200, transcript='lorem ipsum dolor sit amet ' * 300, updated_at=now, created_at=now,
+            id=uuid.uuid4(), actions=['a', 'b'], audio_url=None,
+            backend_status=q.TranscriptionBackendStatusType.COMPLETED, backend_updated_at=now,
+            confidence=0.93, duration=312.5, final_transcript='lorem ipsum ' * 300, keywords=['k'],
+            language='no', marked_for_delete=False, marked_for_delete_date=None, name=f'Recording {i}',
+            next_backend_step=None, notes=None, place_in_queue=None, speaker_labels=False, speakers=1,
+            status=q.TranscriptionStatusType.NOT_SIGNED, summary='summary ' * 100, topics=[],
+            analytics=[q.TranscriptReadAllResultAnalyticsItem(
+                updated_at=now, created_at=now, id=uuid.uuid4(), backend_step='transcription_service',
+                duration=12.5, is_success=True)],
+            translations=[], template=template, created_by=user)
+
+    class EnumEncoder(DataclassEncoder):
+        # The generated enums stand in for edgedb's DerivedEnumValue here
+        def default(self, obj):
+            if isinstance(obj, enum.Enum):
+                return obj.value
+            return super().default(obj)
+
+    response = {'status': 'success', 'transcriptions': [row(i) for i in range(500)]}
+    runs = 20
+    timings = {
+        'json + DataclassEncoder': lambda: json.dumps(response, cls=EnumEncoder).encode('utf-8'),
+        f"encode json ({'orjson' if orjson else 'json'})": lambda: encode(response, JSON),
+    }
+    if msgpack is not None:
+        timings['encode msgpack'] = lambda: encode(response, MSGPACK)
+
+    for name, run in timings.items():
+        seconds = min(timeit.repeat(run, number=runs, repeat=3)) / runs
+        print(f"{name:<32} {seconds * 1000:8.2f} ms  {len(run()) / 1024:8.0f} KiB")
@@ -0,0 +1,118 @@
+# services/common/tests/test_serialization.py
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import enum
+import json
+import os
+import sys
+import uuid
+
+import pytest
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from common.serialization import JSON, MSGPACK, Encoder, decode, encode, negotiate, to_builtins
+
+
+class Status(enum.Enum):
+    DRAFT = 'draft'
+    SIGNED = 'signed'
+
+
+@dataclasses.dataclass
+class User:
+    id: uuid.UUID
+    user_name: str
+
+
+@dataclasses.dataclass
+class Transcription:
+    id: uuid.UUID
+    name: str
+    status: Status
+    created_at: datetime.datetime
+    duration: float | None
+    keywords: list[str] | None
+    created_by: User
+
+
+NOW = datetime.datetime(2024, 5, 17, 12, 30, tzinfo=datetime.timezone.utc)
+
+
+def make_transcription(name: str = 'Recording') -> Transcription:
+    return Transcription(id=uuid.UUID(int=1), name=name, status=Status.SIGNED, created_at=NOW, duration=None,
+                         keywords=['a', 'b'], created_by=User(id=uuid.UUID(int=2), user_name='ola'))
+
+
+EXPECTED = {
+    'id': '00000000-0000-0000-0000-000000000001',
+    'name': 'Recording',
+    'status': 'signed',
+    'created_at': '2024-05-17T12:30:00+00:00',
+    'duration': None,
+    'keywords': ['a', 'b'],
+    'created_by': {'id': '00000000-0000-0000-0000-000000000002', 'user_name': 'ola'},
+}
+
+
+def test_to_builtins_converts_nested_objects():
+    assert to_builtins({'transcriptions': [make_transcription()]}) == {'transcriptions': [EXPECTED]}
+
+
+def test_encode_json_round_trip():
+    data = encode({'status': 'success', 'transcription': make_transcription()})
+    assert decode(data) == {'status': 'success', 'transcription': EXPECTED}
+    assert json.loads(data) == {'status': 'success', 'transcription': EXPECTED}
+
+
+def test_one_encoder_per_shape():
+    encoder = Encoder()
+    rows = [make_transcription(f'Recording {i}') for i in range(3)]
+    assert [row['name'] for row in encoder.convert(rows)] == ['Recording 0', 'Recording 1', 'Recording 2']
+    # Transcription and User
+    assert len(encoder.shapes) == 2
+
+
+def test_subclasses_of_known_types():
+    class Items(list):
+        pass
+
+    assert to_builtins({'items': Items([uuid.UUID(int=3), (1, 2), {4}])}) == \
+        {'items': ['00000000-0000-0000-0000-000000000003', [1, 2], [4]]}
+
+
+def test_json_encodes_subclasses_of_native_types():
+    class DriverUUID(uuid.UUID):
+        pass
+
+    class DriverDatetime(datetime.datetime):
+        pass
+
+    value = {'id': DriverUUID(int=1), 'at': DriverDatetime(2024, 5, 17, 12, 30, tzinfo=datetime.timezone.utc)}
+    assert decode(encode(value, JSON)) == {'id': '00000000-0000-0000-0000-000000000001',
+                                           'at': '2024-05-17T12:30:00+00:00'}
+    # Rows of a query shape with a subclassed id
+    row = dataclasses.replace(make_transcription(), id=DriverUUID(int=1))
+    assert decode(encode([row], JSON)) == [EXPECTED]
+
+
+def test_unknown_type_raises():
+    with pytest.raises(TypeError):
+        to_builtins({'value': object()})
+
+
+def test_negotiate_defaults_to_json():
+    assert negotiate(None) == JSON
+    assert negotiate({'Accept': 'application/json'}) == JSON
+
+
+def test_msgpack_round_trip():
+    msgpack = pytest.importorskip('msgpack')
+    assert negotiate({'Accept': MSGPACK}) == MSGPACK
+    data = encode({'transcription': make_transcription()}, MSGPACK)
+    assert msgpack.unpackb(data, raw=False) == {'transcription': EXPECTED}
+    assert decode(data, MSGPACK) == {'transcription': EXPECTED}
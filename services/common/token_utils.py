@@ -1,7 +1,11 @@
 # common/token_utils.py
+import hashlib
+import json
 import os
+import time
+from collections import OrderedDict
 import jwt
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime, timezone
 import logging
 
@@ -13,24 +17,61 @@ if os.environ.get('PROD_MODE',"false") == 'false':
     from dotenv import load_dotenv
     load_dotenv(dotenv_path=os.path.join(os.path.pardir,".env"))
 class TokenValidator:
+    """
+    Validates access tokens. Decoded payloads are kept in an LRU cache keyed by the
+    token's SHA-256 digest until the token expires, so a token is only decoded
+    once per service. Tokens of a user are revoked, here and in every other
+    service, by publishing {'user_id', 'revoked_at'} on REVOCATION_SUBJECT: any
+    token of that user issued before revoked_at is rejected from then on.
+    """
+    REVOCATION_SUBJECT = 'auth.token.revoked'
+    CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+    # Revocations are kept as long as a revoked token could still be unexpired
+    REVOCATION_TTL_S = int(os.environ.get('TOKEN_REVOCATION_TTL_S', 60 * 60 * 24))
+
     def __init__(self, secret_key: str = None, algorithm: str = 'HS256'):
         self.secret_key = secret_key or os.environ.get('JWT_SECRET')
         self.algorithm = algorithm
+        # sha256(token) -> (payload, exp)
+        self.cache: 'OrderedDict[bytes, Tuple[Dict[str, Any], float]]' = OrderedDict()
+        # user id -> revoked_at
+        self.revocations: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
 
     async def validate_access_token(self, token: str) -> Dict[str, Any]:
         """
         Validates an access token and returns the decoded payload
         Raises jwt.InvalidTokenError if token is invalid
         """
+        key = hashlib.sha256(token.encode('utf-8')).digest() if isinstance(token, str) else None
+        cached = self.cache.get(key) if key is not None else None
+        if cached is not None:
+            payload, exp = cached
+            if exp > time.time() and not self.is_revoked(payload):
+                self.hits += 1
+                self.cache.move_to_end(key)
+                return payload
+            del self.cache[key]
+
+        self.misses += 1
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
-            
+
             if payload.get('type') != 'access':
                 raise jwt.InvalidTokenError('Invalid token type')
 
             if 'user' not in payload:
                 raise jwt.InvalidTokenError('User information missing from token')
 
+            if self.is_revoked(payload):
+                raise jwt.InvalidTokenError('Token has been revoked')
+
+            if 'exp' in payload:
+                self.cache[key] = (payload, float(payload['exp']))
+                if len(self.cache) > self.CACHE_SIZE:
+                    self.cache.popitem(last=False)
+
             return payload
         except jwt.ExpiredSignatureError:
             logger.warning("Access token has expired")
@@ -40,4 +81,46 @@ class TokenValidator:
             raise
         except Exception as e:
             logger.error(f"Token validation error: {e}")
-            raise jwt.InvalidTokenError(f"Token validation failed: {str(e)}")
\ No newline at end of file
+            raise jwt.InvalidTokenError(f"Token validation failed: {str(e)}")
+
+    def is_revoked(self, payload: Dict[str, Any]) -> bool:
+        revoked_at = self.revocations.get(payload['user'].get('id'))
+        # Tokens issued before 'iat' was added count as issued at 0
+        return revoked_at is not None and float(payload.get('iat', 0)) < revoked_at
+
+    def revoke(self, user_id: str, revoked_at: Optional[float] = None):
+        """Reject every token of the user issued before revoked_at."""
+        revoked_at = revoked_at or time.time()
+        self.revocations[user_id] = max(revoked_at, self.revocations.get(user_id, 0))
+        for key, (payload, _) in list(self.cache.items()):
+            if payload['user'].get('id') == user_id and self.is_revoked(payload):
+                del self.cache[key]
+
+        cutoff = time.time() - self.REVOCATION_TTL_S
+        for revoked_user_id, at in list(self.revocations.items()):
+            if at < cutoff:
+                del self.revocations[revoked_user_id]
+
+    async def handle_revocation(self, msg):
+        try:
+            data = json.loads(msg.data.decode())
+            self.revoke(data['user_id'], float(data['revoked_at']))
+            logger.info(f"Revoked tokens of user {data['user_id']}")
+        except Exception as e:
+            logger.error(f"Error handling token revocation: {e}")
+
+    async def subscribe_revocations(self, nats_client):
+        await nats_client.subscribe(self.REVOCATION_SUBJECT, self.handle_revocation)
+
+    @classmethod
+    async def publish_revocation(cls, nats_client, user_id: str, revoked_at: Optional[float] = None):
+        await nats_client.publish(cls.REVOCATION_SUBJECT, json.dumps({
+            'user_id': str(user_id),
+            'revoked_at': revoked_at or time.time(),
+        }))
+
+    def register_metrics(self, metrics):
+        """Register the cache counters as gauges of a common.metrics.Metrics."""
+        metrics.gauge('token_cache_hits', lambda: self.hits)
+        metrics.gauge('token_cache_misses', lambda: self.misses)
+        metrics.gauge('token_cache_size', lambda: len(self.cache))
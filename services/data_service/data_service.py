@@ -4,7 +4,7 @@ import json
 import os
 import sys
 import logging
-from typing import List
+from typing import List, Optional, Tuple
 
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if parent_dir not in sys.path:
@@ -14,11 +14,15 @@ from common.nats_client import NATSClient
 # from common.models import TranscriptionMeta
 from common.queries.transcriptions.transcript_read_async_edgeql import  transcript_read,TranscriptReadResult as TranscriptionMeta
 from common.queries.transcriptions.transcript_read_all_async_edgeql import transcript_read_all
+from common.queries.transcriptions.transcript_read_page_async_edgeql import transcript_read_page, TranscriptReadPageResult
+from common.queries.transcriptions.transcript_read_detail_async_edgeql import transcript_read_detail
 from common.queries.transcriptions.transcript_create_async_edgeql import transcript_create
 from common.queries.transcriptions.transcript_update_async_edgeql import transcript_update 
 from common.queries.transcriptions.transcript_delete_async_edgeql import transcript_delete 
-from common.edgedb_client import EdgedbClient, DataclassEncoder
+from common.edgedb_client import EdgedbClient
 from common.token_utils import TokenValidator
+from common.metrics import Metrics
+from pagination import page_limit, parse_cursor, split_page
 
 logging.basicConfig(level=logging.INFO)
 
@@ -33,6 +37,10 @@ class DataService:
     SUBJECT_CREATE = 'data.transcriptions.create'
     SUBJECT_UPDATE = 'data.transcriptions.update'
     SUBJECT_DELETE = 'data.transcriptions.delete'
+    SUBJECT_LIST = 'data.transcriptions.list'
+    SUBJECT_GET_ONE = 'data.transcriptions.get_one'
+    PAGE_SIZE = int(os.environ.get('DATA_SERVICE_PAGE_SIZE', 50))
+    MAX_PAGE_SIZE = 200
     STREAM_NAME = 'precepto_data_service'
     STREAM_LISTEN_SUBJECT = ["precepto.data.*"]
     
@@ -42,12 +50,16 @@ class DataService:
         self.client = self.db.client
         self.nats_client = NATSClient()
         self.token_validator = TokenValidator()
+        self.metrics = Metrics('data')
+        self.token_validator.register_metrics(self.metrics)
 
     async def connect(self):
         """Initialize connections to NATS and create necessary stream"""
         try:
             await self.nats_client.connect()
             await self.nats_client.create_stream(self.STREAM_NAME, self.STREAM_LISTEN_SUBJECT)
+            await self.token_validator.subscribe_revocations(self.nats_client)
+            await self.metrics.serve(self.nats_client)
             self.logger.info("Connected to NATS and set up stream")
         except Exception as e:
             self.logger.error(f"Failed to connect and set up NATSClient: {e}")
@@ -71,6 +83,18 @@ class DataService:
             self.logger.error(f"Error fetching transcriptions: {e}")
             raise
 
+    async def get_user_transcriptions_page(self, user_id: str, limit: int,
+                                           cursor: Optional[dict] = None) -> Tuple[List[TranscriptReadPageResult], Optional[dict]]:
+        """
+        Fetch one page of a user's transcriptions, newest first, and the cursor for the next
+        page. The cursor is the created_at and id of the last row, None on the last page.
+        """
+        cursor_created_at, cursor_id = parse_cursor(cursor)
+        # One row more than asked for tells whether there is a next page
+        transcriptions = await transcript_read_page(self.client, user_id=user_id, limit=limit + 1,
+                                                    cursor_created_at=cursor_created_at, cursor_id=cursor_id)
+        return split_page(transcriptions, limit)
+
     async def create_transcription(self, transcription_data: dict, user_id: str):
         """Create a new transcription"""
         try:
@@ -135,7 +159,7 @@ class DataService:
                 'status': 'success',
                 'transcriptions': transcriptions,
             }
-            await msg.respond(json.dumps(response, cls=DataclassEncoder).encode('utf-8'))
+            await self.nats_client.respond(msg, response)
             self.logger.info(f"Successfully returned {len(transcriptions)} transcriptions for user {user_id}")
 
         except Exception as e:
@@ -151,7 +175,65 @@ class DataService:
                     'status': 'error',
                     'message': str(e) if hasattr(e, 'message') else 'Failed to get transcriptions'
                 }
-            await msg.respond(json.dumps(response).encode('utf-8'))
+            await self.nats_client.respond(msg, response)
+
+    async def handle_list_transcriptions(self, msg):
+        """Handle a request for one page of the user's transcriptions, without any text bodies"""
+        try:
+            data = json.loads(msg.data.decode('utf-8'))
+            access_token = data.get('access_token')
+
+            payload = await self.token_validator.validate_access_token(access_token)
+            user_id = payload['user']['id']
+
+            limit = page_limit(data.get('limit'), self.PAGE_SIZE, self.MAX_PAGE_SIZE)
+            transcriptions, next_cursor = await self.get_user_transcriptions_page(user_id, limit, data.get('cursor'))
+            response = {
+                'status': 'success',
+                'transcriptions': transcriptions,
+                'next_cursor': next_cursor,
+            }
+            await self.nats_client.respond(msg, response)
+
+        except Exception as e:
+            self.logger.error(f"Error handling list transcriptions request: {e}")
+            response = {
+                'status': 'error',
+                'message': str(e)
+            }
+            await self.nats_client.respond(msg, response)
+
+    async def handle_get_transcription(self, msg):
+        """Handle a request for a single transcription with all its details"""
+        try:
+            data = json.loads(msg.data.decode('utf-8'))
+            access_token = data.get('access_token')
+            transcription_id = data.get('transcription_id')
+
+            payload = await self.token_validator.validate_access_token(access_token)
+            user_id = payload['user']['id']
+
+            # Filtered on the owner as well, so other users' transcriptions read as not found
+            transcription = await transcript_read_detail(self.client, id=transcription_id, user_id=user_id)
+            if transcription is None:
+                response = {
+                    'status': 'error',
+                    'message': 'Transcription not found'
+                }
+            else:
+                response = {
+                    'status': 'success',
+                    'transcription': transcription
+                }
+            await self.nats_client.respond(msg, response)
+
+        except Exception as e:
+            self.logger.error(f"Error handling get transcription request: {e}")
+            response = {
+                'status': 'error',
+                'message': str(e)
+            }
+            await self.nats_client.respond(msg, response)
 
     async def handle_create_transcription(self, msg):
         """Handle incoming create transcription requests"""
@@ -174,7 +256,7 @@ class DataService:
                 'status': 'success',
                 'transcription': result
             }
-            await msg.respond(json.dumps(response, cls=DataclassEncoder).encode('utf-8'))
+            await self.nats_client.respond(msg, response)
 
         except Exception as e:
             self.logger.error(f"Error handling create transcription request: {e}")
@@ -182,7 +264,7 @@ class DataService:
                 'status': 'error',
                 'message': str(e)
             }
-            await msg.respond(json.dumps(response).encode('utf-8'))
+            await self.nats_client.respond(msg, response)
 
     async def handle_update_transcription(self, msg):
         """Handle incoming update transcription requests"""
@@ -202,7 +284,7 @@ class DataService:
                 'status': 'success',
                 'transcription': result
             }
-            await msg.respond(json.dumps(response, cls=DataclassEncoder).encode('utf-8'))
+            await self.nats_client.respond(msg, response)
 
         except Exception as e:
             self.logger.error(f"Error handling update transcription request: {e}")
@@ -210,7 +292,7 @@ class DataService:
                 'status': 'error',
                 'message': str(e)
             }
-            await msg.respond(json.dumps(response).encode('utf-8'))
+            await self.nats_client.respond(msg, response)
 
     async def handle_delete_transcription(self, msg):
         """Handle incoming delete transcription requests"""
@@ -227,7 +309,7 @@ class DataService:
                 'status': 'success',
                 'deleted': True
             }
-            await msg.respond(json.dumps(response, cls=DataclassEncoder).encode('utf-8'))
+            await self.nats_client.respond(msg, response)
 
         except Exception as e:
             self.logger.error(f"Error handling delete transcription request: {e}")
@@ -235,7 +317,7 @@ class DataService:
                 'status': 'error',
                 'message': str(e)
             }
-            await msg.respond(json.dumps(response).encode('utf-8'))
+            await self.nats_client.respond(msg, response)
 
     async def subscribe(self):
         """Set up subscription to NATS subjects"""
@@ -244,6 +326,8 @@ class DataService:
             await self.nats_client.subscribe(self.SUBJECT_CREATE, cb=self.handle_create_transcription)
             await self.nats_client.subscribe(self.SUBJECT_UPDATE, cb=self.handle_update_transcription)
             await self.nats_client.subscribe(self.SUBJECT_DELETE, cb=self.handle_delete_transcription)
+            await self.nats_client.subscribe(self.SUBJECT_LIST, cb=self.handle_list_transcriptions)
+            await self.nats_client.subscribe(self.SUBJECT_GET_ONE, cb=self.handle_get_transcription)
             self.logger.info("Subscribed to all CRUD subjects")
         except Exception as e:
             self.logger.error(f"Failed to subscribe: {e}")
@@ -0,0 +1,36 @@
+# services/data_service/pagination.py
+"""
+Keyset pagination over rows ordered newest first by (created_at, id). The
+cursor handed to clients is the created_at and id of the last row of a page.
+"""
+import datetime
+import uuid
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+def page_limit(limit: Any, default: int, maximum: int) -> int:
+    """Requested page size, the default when missing and clamped to 1..maximum."""
+    return min(max(int(limit or default), 1), maximum)
+
+
+def parse_cursor(cursor: Optional[dict]) -> Tuple[Optional[datetime.datetime], Optional[uuid.UUID]]:
+    """Created_at and id to continue after, (None, None) for the first page."""
+    if not cursor:
+        return None, None
+    if not (cursor.get('created_at') and cursor.get('id')):
+        raise ValueError("cursor needs both 'created_at' and 'id'")
+    # fromisoformat on 3.9 does not accept the 'Z' suffix from JavaScript's toISOString
+    created_at = datetime.datetime.fromisoformat(cursor['created_at'].replace('Z', '+00:00'))
+    return created_at, uuid.UUID(cursor['id'])
+
+
+def split_page(rows: Sequence[Any], limit: int) -> Tuple[List[Any], Optional[dict]]:
+    """
+    Cut rows fetched with limit + 1 down to one page, with the cursor for the next
+    page, None on the last page.
+    """
+    if len(rows) <= limit:
+        return list(rows), None
+    page = list(rows[:limit])
+    last = page[-1]
+    return page, {'created_at': last.created_at.isoformat(), 'id': str(last.id)}
@@ -0,0 +1,81 @@
+# services/data_service/tests/test_pagination.py
+import dataclasses
+import datetime
+import os
+import sys
+import uuid
+
+import pytest
+
+service_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_dir not in sys.path:
+    sys.path.insert(0, service_dir)
+
+from pagination import page_limit, parse_cursor, split_page
+
+
+@dataclasses.dataclass
+class Row:
+    id: uuid.UUID
+    created_at: datetime.datetime
+
+
+def make_rows(count: int):
+    start = datetime.datetime(2024, 5, 17, 12, 0, tzinfo=datetime.timezone.utc)
+    return [Row(id=uuid.UUID(int=count - i), created_at=start - datetime.timedelta(minutes=i)) for i in range(count)]
+
+
+def test_page_limit():
+    assert page_limit(None, 50, 200) == 50
+    assert page_limit('20', 50, 200) == 20
+    assert page_limit(0, 50, 200) == 50
+    assert page_limit(-5, 50, 200) == 1
+    assert page_limit(1000, 50, 200) == 200
+
+
+def test_parse_cursor():
+    assert parse_cursor(None) == (None, None)
+    assert parse_cursor({}) == (None, None)
+
+    created_at, row_id = parse_cursor({'created_at': '2024-05-17T12:00:00.000Z',
+                                       'id': '00000000-0000-0000-0000-000000000001'})
+    assert created_at == datetime.datetime(2024, 5, 17, 12, 0, tzinfo=datetime.timezone.utc)
+    assert row_id == uuid.UUID(int=1)
+
+
+@pytest.mark.parametrize('cursor', [{'created_at': '2024-05-17T12:00:00+00:00'},
+                                    {'id': '00000000-0000-0000-0000-000000000001'},
+                                    {'created_at': 'yesterday', 'id': '00000000-0000-0000-0000-000000000001'},
+                                    {'created_at': '2024-05-17T12:00:00+00:00', 'id': 'not-a-uuid'}])
+def test_parse_cursor_rejects_bad_cursors(cursor):
+    with pytest.raises(ValueError):
+        parse_cursor(cursor)
+
+
+def test_split_page_on_the_last_page():
+    rows = make_rows(3)
+    assert split_page(rows, 3) == (rows, None)
+    assert split_page([], 3) == ([], None)
+
+
+def test_split_page_returns_the_cursor_of_the_last_row():
+    rows = make_rows(4)
+    page, cursor = split_page(rows, 3)
+    assert page == rows[:3]
+    assert cursor == {'created_at': rows[2].created_at.isoformat(), 'id': str(rows[2].id)}
+    assert parse_cursor(cursor) == (rows[2].created_at, rows[2].id)
+
+
+def test_walking_the_pages_visits_every_row_once():
+    rows = make_rows(10)
+    seen, cursor = [], None
+    while True:
+        created_at, row_id = parse_cursor(cursor)
+        # What transcript_read_page selects: rows after the cursor, newest first, limit + 1
+        remaining = [row for row in rows
+                     if created_at is None or (row.created_at, row.id) < (created_at, row_id)]
+        page, cursor = split_page(remaining[:4], 3)
+        seen.extend(page)
+        if cursor is None:
+            break
+    assert seen == rows
@@ -45,8 +45,11 @@ start_service() {
         fi
     fi
 
-    # Determine the main Python script (assumes it's the only .py file in the service directory)
-    main_script=$(find "$service_path" -maxdepth 1 -type f -name "*.py" | head -n 1)
+    # Determine the main Python script: <service_name>.py, or the only .py file in the service directory
+    main_script="${service_path%/}/${service_name}.py"
+    if [ ! -f "$main_script" ]; then
+        main_script=$(find "$service_path" -maxdepth 1 -type f -name "*.py" | head -n 1)
+    fi
 
     if [ -z "$main_script" ]; then
         echo "No Python script found in $service_path. Skipping..."
@@ -1,12 +1,17 @@
-from typing import Dict, Any, AsyncIterator, Optional, List
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, Optional, List
+from collections import OrderedDict
 from dataclasses import dataclass
+import asyncio
 from pydantic import BaseModel, Field, ValidationError
 from pydantic_ai import Agent, RunContext, ModelRetry, UnexpectedModelBehavior
 from openai import AsyncOpenAI
 from pydantic_ai.models.openai import OpenAIModel
 import json
 import ast
+import hashlib
 import logging
+import os
+import re
 from textwrap import dedent
 
 logger = logging.getLogger(__name__)
@@ -56,6 +61,53 @@ logfire.configure()
 class SummarizationDeps:
     template: Dict[str, Any]
     transcript: str
+    system_prompt: str
+
+
+@dataclass
+class PreparedTemplate:
+    template: Dict[str, Any]
+    system_prompt: str
+    extraction_prompt: str
+
+class SectionParser:
+    """
+    Picks the completed sections out of a note's JSON while it is still being
+    generated. feed takes the text so far and returns the sections that were
+    completed since the last call, parsing only what is new.
+    """
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        # Position in the text after the last completed section
+        self.position: Optional[int] = None
+        self.sections: List[Dict[str, Any]] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        if self.position is None:
+            # The note's first "content" key is the section list
+            start = text.find('"content"')
+            start = text.find('[', start) if start >= 0 else -1
+            if start < 0:
+                return []
+            self.position = start + 1
+
+        completed = []
+        while True:
+            position = self.position
+            while position < len(text) and text[position] in ' \t\r\n,':
+                position += 1
+            if position >= len(text) or text[position] != '{':
+                break
+            try:
+                section, self.position = self.decoder.raw_decode(text, position)
+            except json.JSONDecodeError:
+                # Not complete yet
+                break
+            completed.append(section)
+        self.sections.extend(completed)
+        return completed
+
 
 # agent: Agent[SummarizationDeps, Note] = Agent(
 agent = Agent(
@@ -148,7 +200,15 @@ def extract_json(response: str) -> dict:
 #         raise ModelRetry(f"Please try again and make sure to follow the instructions. the output is not a Note, {e}")
 
 class SummarizationWorkflow:
-    def __init__(self, llm_config: Dict[str, Any]):
+    TEMPLATE_CACHE_SIZE = int(os.environ.get('SUMMARIZATION_TEMPLATE_CACHE_SIZE', 256))
+    # Longer transcripts are summarized map-reduce in chunks of CHUNK_TOKENS
+    MAX_TRANSCRIPT_TOKENS = int(os.environ.get('SUMMARIZATION_MAX_TRANSCRIPT_TOKENS', 6000))
+    CHUNK_TOKENS = int(os.environ.get('SUMMARIZATION_CHUNK_TOKENS', 3000))
+    # Rough estimate for Gemma's tokenizer, saves loading it just to count
+    CHARS_PER_TOKEN = 4
+    TIMESTAMP_LINE = re.compile(r'^\s*(\d+(?:\.\d+)?)-(\d+(?:\.\d+)?):')
+
+    def __init__(self, llm_config: Dict[str, Any], max_llm_requests: Optional[int] = None):
         base_config = llm_config["config_list"][0]
         
         client = AsyncOpenAI(
@@ -162,6 +222,73 @@ class SummarizationWorkflow:
             openai_client=client
         )   
         agent.model = self.model
+        # sha256(template json) -> normalized template and its rendered prompts
+        self.template_cache: 'OrderedDict[bytes, PreparedTemplate]' = OrderedDict()
+        self.template_cache_hits = 0
+        self.template_cache_misses = 0
+        # Bounds the requests in flight to the LLM server across all jobs,
+        # created on first use so it binds to the running loop
+        self.max_llm_requests = max_llm_requests or 1
+        self.llm_semaphore: Optional[asyncio.Semaphore] = None
+        self.llm_requests_queued = 0
+        self.llm_requests_active = 0
+
+    async def run_agent(self, prompt: str, deps: SummarizationDeps,
+                        on_sections: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None) -> str:
+        """
+        Run the agent once the number of requests in flight is below max_llm_requests
+        and return its output. With on_sections the output is streamed, and
+        on_sections is called with all sections completed so far every time one
+        or more sections of the note are completed.
+        """
+        if self.llm_semaphore is None:
+            self.llm_semaphore = asyncio.Semaphore(self.max_llm_requests)
+
+        self.llm_requests_queued += 1
+        try:
+            await self.llm_semaphore.acquire()
+        finally:
+            self.llm_requests_queued -= 1
+
+        self.llm_requests_active += 1
+        try:
+            if on_sections is None:
+                result = await agent.run(prompt, deps=deps)
+                return result.data
+
+            parser = SectionParser()
+            text = ''
+            async with agent.run_stream(prompt, deps=deps) as result:
+                async for text in result.stream_text():
+                    if parser.feed(text):
+                        await on_sections(parser.sections)
+            return text
+        finally:
+            self.llm_requests_active -= 1
+            self.llm_semaphore.release()
+
+    def prepare_template(self, template: str) -> PreparedTemplate:
+        """
+        Parse, normalize and render the prompts for a template's JSON, cached by its
+        content hash. The same template always renders the same prompts, so the LLM
+        server can reuse the cached prefix across notes.
+        """
+        key = hashlib.sha256(template.encode('utf-8')).digest()
+        prepared = self.template_cache.get(key)
+        if prepared is not None:
+            self.template_cache_hits += 1
+            self.template_cache.move_to_end(key)
+            return prepared
+
+        self.template_cache_misses += 1
+        normalized_template = self._normalize_template(json.loads(template))
+        prepared = PreparedTemplate(template=normalized_template,
+                                    system_prompt=self.render_system_prompt(normalized_template),
+                                    extraction_prompt=self.render_extraction_prompt(normalized_template))
+        self.template_cache[key] = prepared
+        if len(self.template_cache) > self.TEMPLATE_CACHE_SIZE:
+            self.template_cache.popitem(last=False)
+        return prepared
 
 
 
@@ -262,9 +389,9 @@ class SummarizationWorkflow:
     #         raise ModelRetry("\n".join(issues))
 
             # - Timestamps must be "number-number" or "???"
-    @agent.system_prompt
-    async def get_system_prompt(ctx: RunContext[SummarizationDeps]) -> str:
-        r = dedent(f"""
+    @staticmethod
+    def render_system_prompt(template: Dict[str, Any]) -> str:
+        return dedent(f"""
             You are a medical transcription assistant that converts conversations into structured clinical notes.
 
             Rules:
@@ -279,13 +406,112 @@ class SummarizationWorkflow:
             - Output must be properly formatted JSON
             
             Template:
-            {ctx.deps.template}        
+            {template}        
                    """).strip()
-        
-        print("System prompt: \n")
-        print(r)
-        logger.info(f"System prompt: {r}")
-        return r
+
+    @staticmethod
+    def render_extraction_prompt(template: Dict[str, Any]) -> str:
+        sections = "\n".join(f"- {section['section']}" for section in template["content"])
+        return dedent(f"""
+            You are a medical transcription assistant that extracts facts from one part of a longer conversation for a clinical note.
+
+            Rules:
+            - Use only information from this part of the transcript
+            - List the facts under the exact section name they belong to, one per line as "- timestamp: fact"
+            - Use the timestamps from the transcript, or "???" if there are none
+            - Leave out sections with no relevant information
+            - Use professional medical terminology in Norwegian
+            - No informal dialogue or questions
+
+            Sections:
+            {sections}
+                   """).strip()
+
+    def estimate_tokens(self, text: str) -> int:
+        return len(text) // self.CHARS_PER_TOKEN
+
+    def split_transcript(self, transcript: str) -> List[str]:
+        """
+        Split a transcript into chunks of at most CHUNK_TOKENS. Timestamped
+        "start-end: text" lines are kept whole so every chunk covers a window of
+        the recording, plain text is split between sentences.
+        """
+        lines, separator = transcript.splitlines(), "\n"
+        if not any(self.TIMESTAMP_LINE.match(line) for line in lines):
+            lines, separator = re.split(r'(?<=[.!?])\s+', transcript), " "
+        return self.split_lines(lines, separator)
+
+    def split_lines(self, lines: List[str], separator: str) -> List[str]:
+        """
+        Group lines into chunks of at most CHUNK_TOKENS. A line longer than that on
+        its own, such as a transcript without punctuation, is cut between words.
+        """
+        max_chars = self.CHUNK_TOKENS * self.CHARS_PER_TOKEN
+        chunks, current, current_chars = [], [], 0
+        for line in (piece for line in lines for piece in self.split_long_line(line, max_chars)):
+            if current and current_chars + len(line) > max_chars:
+                chunks.append(separator.join(current))
+                current, current_chars = [], 0
+            current.append(line)
+            current_chars += len(line) + 1
+        if current:
+            chunks.append(separator.join(current))
+        return chunks
+
+    @staticmethod
+    def split_long_line(line: str, max_chars: int) -> List[str]:
+        if len(line) <= max_chars:
+            return [line]
+        pieces, current = [], ''
+        for word in line.split():
+            # A single word longer than a chunk is cut anywhere
+            while len(word) > max_chars:
+                if current:
+                    pieces.append(current)
+                    current = ''
+                pieces.append(word[:max_chars])
+                word = word[max_chars:]
+            if current and len(current) + 1 + len(word) > max_chars:
+                pieces.append(current)
+                current = ''
+            current = f"{current} {word}" if current else word
+        if current:
+            pieces.append(current)
+        return pieces
+
+    async def extract_facts(self, chunks: List[str], prepared: PreparedTemplate,
+                            instruction: str = "Extract the facts from this part of a medical transcript") -> str:
+        """Map step: extract the facts per section from every chunk, all at once."""
+        deps = [SummarizationDeps(template=prepared.template, transcript=chunk,
+                                  system_prompt=prepared.extraction_prompt) for chunk in chunks]
+        results = await asyncio.gather(*(
+            self.run_agent(f"{instruction}:\n\n{chunk}", chunk_deps)
+            for chunk, chunk_deps in zip(chunks, deps)
+        ))
+        return "\n\n".join(f"Part {i} of {len(chunks)}:\n{result}" for i, result in enumerate(results, 1))
+
+    async def reduce_facts(self, facts: str, prepared: PreparedTemplate) -> str:
+        """
+        Condense the extracted facts in chunks until they fit in MAX_TRANSCRIPT_TOKENS,
+        so the final reduce step always gets a prompt the model can take. Stops early
+        when a round no longer makes them shorter.
+        """
+        while self.estimate_tokens(facts) > self.MAX_TRANSCRIPT_TOKENS:
+            chunks = self.split_lines(facts.splitlines(), "\n")
+            logger.info(f"Facts of ~{self.estimate_tokens(facts)} tokens, condensing in {len(chunks)} chunks")
+            condensed = await self.extract_facts(
+                chunks, prepared,
+                "Merge these facts, extracted from consecutive parts of a medical transcript, "
+                "keeping every fact under its section")
+            if self.estimate_tokens(condensed) >= self.estimate_tokens(facts):
+                logger.warning("Condensing the facts did not shorten them, reducing them as they are")
+                break
+            facts = condensed
+        return facts
+
+    @agent.system_prompt
+    async def get_system_prompt(ctx: RunContext[SummarizationDeps]) -> str:
+        return ctx.deps.system_prompt
     
             # Transcript:
             # {ctx.deps.transcript}       
@@ -294,28 +520,45 @@ class SummarizationWorkflow:
             # {ctx.deps.transcript}   
         
     
-    async def run(self, transcript: str, template: Dict[str, Any]) -> AsyncIterator[str]:
-        """Generate a clinical note from the transcript using the template structure."""
-        normalized_template = self._normalize_template(template)
-        print("Normalized template: \n")
-        print(normalized_template)
-        deps = SummarizationDeps(template=normalized_template, transcript=transcript)
+    async def run(self, transcript: str, template: str,
+                  on_sections: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None) -> AsyncIterator[str]:
+        """
+        Generate a clinical note from the transcript using the template's JSON structure.
+        With on_sections the note is streamed and on_sections is called as its sections
+        are completed, see run_agent.
+        """
+        prepared = self.prepare_template(template)
+        deps = SummarizationDeps(template=prepared.template, transcript=transcript,
+                                 system_prompt=prepared.system_prompt)
 # Template structure with 
 
         #  f"These are the template sections:\n{json.dumps(normalized_template, indent=2)}\n\n"
         #         f"Convert this medical transcript to a structured clinical note:\n\n{transcript}",
         # a = self.get_system_prompt(normalized_template,transcript)
         try:
-            print("Running agent \n")
-            result = await agent.run(
-                # f' "Convert the transcript to a structured clinical note" {a}',
-                # f"These are the template sections:\n{json.dumps(normalized_template, indent=2)}\n\n"
-                f"Convert this medical transcript to a structured clinical note:\n\n{transcript}",
-                deps=deps,
-            )
+            if self.estimate_tokens(transcript) <= self.MAX_TRANSCRIPT_TOKENS:
+                result = await self.run_agent(
+                    # f' "Convert the transcript to a structured clinical note" {a}',
+                    # f"These are the template sections:\n{json.dumps(normalized_template, indent=2)}\n\n"
+                    f"Convert this medical transcript to a structured clinical note:\n\n{transcript}",
+                    deps,
+                    on_sections,
+                )
+            else:
+                chunks = self.split_transcript(transcript)
+                logger.info(f"Transcript of ~{self.estimate_tokens(transcript)} tokens, "
+                            f"summarizing in {len(chunks)} chunks")
+                facts = await self.reduce_facts(await self.extract_facts(chunks, prepared), prepared)
+                # Reduce step: merge the facts of all parts into the template's sections
+                result = await self.run_agent(
+                    "Convert these facts, extracted from consecutive parts of a medical transcript, "
+                    f"to a structured clinical note:\n\n{facts}",
+                    deps,
+                    on_sections,
+                )
             print("Agent result: \n")
             print(result)
-            yield result.data
+            yield result
             # if isinstance(result.data, Note):
             # if isinstance(result.data, BaseModel):
             #     # return result.data.note.model_dump()
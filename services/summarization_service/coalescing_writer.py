@@ -0,0 +1,64 @@
+# services/summarization_service/coalescing_writer.py
+import asyncio
+import logging
+from typing import Optional
+
+
+class CoalescingWriter:
+    """
+    Calls write with the latest submitted value at most once per interval_s,
+    one write at a time. Values submitted while a write is pending replace it,
+    so only the newest is written. close drops a pending write and waits for
+    one that is already running, so nothing is written after close returns.
+    """
+
+    def __init__(self, write, interval_s: float):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.write = write
+        self.interval_s = interval_s
+        self.last_write_at = 0.0
+        self.pending = None
+        self.task: Optional[asyncio.Task] = None
+        self.writing = False
+        self.closed = False
+        self.writes = 0
+
+    def submit(self, value):
+        if self.closed:
+            return
+        self.pending = value
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self.pending is not None:
+                await asyncio.sleep(max(self.last_write_at + self.interval_s - loop.time(), 0))
+                value, self.pending = self.pending, None
+                self.last_write_at = loop.time()
+                self.writes += 1
+                self.writing = True
+                try:
+                    await self.write(value)
+                except Exception as e:
+                    self.logger.error(f"Error in coalesced write: {e}")
+                finally:
+                    self.writing = False
+        finally:
+            self.task = None
+
+    async def close(self):
+        self.closed = True
+        self.pending = None
+        task = self.task
+        if task is None:
+            return
+        if not self.writing:
+            task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        # A task cancelled before it started never reaches its finally
+        self.task = None
@@ -19,16 +19,33 @@ if (parent_dir not in sys.path):
 from common.nats_client import NATSClient
 from common.edgedb_client import EdgedbClient, DataclassEncoder
 from common.queries.transcriptions.transcript_read_async_edgeql import transcript_read, TranscriptReadResult as TranscriptionMeta
-from common.queries.transcriptions.transcript_update_async_edgeql import transcript_update
+from common.queries.transcriptions.transcript_update_summary_async_edgeql import transcript_update_summary
 from agent_py_team4_x import SummarizationWorkflow
+from coalescing_writer import CoalescingWriter
 from common.token_utils import TokenValidator  # Add this import
+from common.metrics import Metrics
 
 # from common.models import TranscriptTemplate, TranscriptionMeta
 
 logging.basicConfig(level=
         logging.INFO)
 
+
 class SummarizationService:
+    DURABLE_NAME = 'summarization_service'
+    # Jobs this instance runs at once, the rest stay queued on the server
+    MAX_JOBS = int(os.environ.get('SUMMARIZATION_MAX_JOBS', 4))
+    # Jobs handed out but not yet acked across all instances sharing the durable
+    MAX_ACK_PENDING = int(os.environ.get('SUMMARIZATION_MAX_ACK_PENDING', 0)) or None
+    # Requests in flight to the LLM server, match it to the server's batch size
+    MAX_LLM_REQUESTS = int(os.environ.get('SUMMARIZATION_MAX_LLM_REQUESTS', 4))
+    JOB_ACK_WAIT_S = float(os.environ.get('SUMMARIZATION_JOB_ACK_WAIT_S', 120))
+    JOB_TIMEOUT_S = float(os.environ.get('SUMMARIZATION_JOB_TIMEOUT_S', 900))
+    # Stream the note, saving and announcing sections as they are generated
+    STREAM = os.environ.get('SUMMARIZATION_STREAM', 'true') == 'true'
+    PARTIAL_WRITE_INTERVAL_S = float(os.environ.get('SUMMARIZATION_PARTIAL_WRITE_INTERVAL_MS', 1000)) / 1000
+    SUBJECT_PROGRESS = 'summarization.progress'
+
     def __init__(self):
         self.db = EdgedbClient()
         self.client = self.db.client
@@ -45,8 +62,16 @@ class SummarizationService:
                 "max_tokens": 8192,
             }]
         }
-        self.workflow = SummarizationWorkflow(llm_config=self.llm_config)
+        self.workflow = SummarizationWorkflow(llm_config=self.llm_config, max_llm_requests=self.MAX_LLM_REQUESTS)
         self.token_validator = TokenValidator()  # Add this line
+        self.jobs_active = 0
+        self.metrics = Metrics('summarization')
+        self.token_validator.register_metrics(self.metrics)
+        self.metrics.gauge('jobs_active', lambda: self.jobs_active)
+        self.metrics.gauge('llm_requests_active', lambda: self.workflow.llm_requests_active)
+        self.metrics.gauge('llm_requests_queued', lambda: self.workflow.llm_requests_queued)
+        self.metrics.gauge('template_cache_hits', lambda: self.workflow.template_cache_hits)
+        self.metrics.gauge('template_cache_misses', lambda: self.workflow.template_cache_misses)
         
     
 
@@ -128,6 +153,8 @@ class SummarizationService:
     async def connect(self):
         try:
             await self.nats_client.connect()
+            await self.nats_client.create_pipeline_stream()
+            await self.token_validator.subscribe_revocations(self.nats_client)
             self.nats_client.kv_templates = await self.nats_client.setup_kv_bucket('templates')
             self.nats_client.kv_transcriptions = await self.nats_client.setup_kv_bucket('transcriptions')
             self.logger.info("Connected to NATS and KV stores 'templates' and 'transcriptions'")
@@ -136,6 +163,7 @@ class SummarizationService:
             raise
 
     async def handle_completed_transcription(self, msg):
+        self.jobs_active += 1
         try:
             data = json.loads(msg.data.decode())
             transcription_id = data.get('transcription_id')
@@ -150,23 +178,38 @@ class SummarizationService:
             if not transcription:
                 raise ValueError(f"Transcription {transcription_id} not found")
 
-            # Parse template
-            temp = json.loads(transcription.template.template)
-            self.logger.debug(f"Parsed template: {json.dumps(temp, indent=2)}")
+            partial_writer = CoalescingWriter(
+                lambda summary: self.save_partial_summary(transcription_id, summary),
+                self.PARTIAL_WRITE_INTERVAL_S)
+
+            async def on_sections(sections):
+                partial_writer.submit(json.dumps({"title": "Clinical Note", "content": sections}, ensure_ascii=False))
+                await self.nats_client.publish(self.SUBJECT_PROGRESS, json.dumps({
+                    "transcription_id": transcription_id,
+                    "sections_completed": len(sections),
+                    "section": sections[-1].get("section"),
+                }))
 
-            async for result in self.workflow.run(transcription, temp):
+            try:
+                # The workflow parses the template once per distinct template
+                results = [result async for result in self.workflow.run(
+                    transcription.transcript or '', transcription.template.template,
+                    on_sections=on_sections if self.STREAM else None)]
+            finally:
+                # A partial write must not land after the full summary
+                await partial_writer.close()
+                self.metrics.increment('partial_summary_writes', partial_writer.writes)
+
+            for result in results:
                 print("REsults ",result)
             # Update transcription with summary
-                await transcript_update(
+                await transcript_update_summary(
                     self.client,
                     id=transcription_id,
-                    name=transcription.name,
-                    # summary=summary,
                     summary=result,
                     status='not_signed',
                     backend_status='summarization_service',
                     next_backend_step='llm_service',
-                    template_id=transcription.template.id,
                     backend_updated_at=datetime.datetime.now(timezone.utc)
                 )
 
@@ -175,11 +218,30 @@ class SummarizationService:
                     json.dumps({"transcription_id": transcription_id}))
                 
                 self.logger.info(f"Summarization completed for transcription ID: {transcription_id}")
+                self.metrics.increment('jobs_completed')
 
+        except asyncio.CancelledError:
+            # Cancelled by the job timeout, the consumer naks it for redelivery
+            self.metrics.increment('jobs_timed_out')
+            raise
         except Exception as e:
             self.logger.error(f"Error processing summarization for transcription {data.get('transcription_id', 'unknown')}: {e}")
+            self.metrics.increment('jobs_failed')
             raise
+        finally:
+            self.jobs_active -= 1
+
 
+    async def save_partial_summary(self, transcription_id: str, summary: str):
+        await transcript_update_summary(
+            self.client,
+            id=transcription_id,
+            summary=summary,
+            status='processing',
+            backend_status='summarization_service',
+            next_backend_step='summarization_service',
+            backend_updated_at=datetime.datetime.now(timezone.utc)
+        )
 
     def construct_template_string1(self, template_list):
         """
@@ -207,7 +269,11 @@ class SummarizationService:
 
     async def subscribe(self):
         try:
-            await self.nats_client.subscribe('transcription.completed', self.handle_completed_transcription)
+            await self.nats_client.consume(self.nats_client.PIPELINE_STREAM_NAME, 'transcription.completed',
+                                           self.DURABLE_NAME, self.handle_completed_transcription,
+                                           max_in_flight=self.MAX_JOBS, ack_wait=self.JOB_ACK_WAIT_S,
+                                           timeout=self.JOB_TIMEOUT_S, max_ack_pending=self.MAX_ACK_PENDING)
+            await self.metrics.serve(self.nats_client)
             self.logger.info("Subscribed to 'transcription.completed' subject")
         except Exception as e:
             self.logger.error(f"Subscription error: {e}")
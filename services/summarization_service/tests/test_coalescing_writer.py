@@ -0,0 +1,111 @@
+# services/summarization_service/tests/test_coalescing_writer.py
+import asyncio
+import os
+import sys
+
+service_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_dir not in sys.path:
+    sys.path.insert(0, service_dir)
+
+from coalescing_writer import CoalescingWriter
+
+
+class Recorder:
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.values = []
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, value):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError('write failed')
+            self.values.append(value)
+        finally:
+            self.running -= 1
+
+
+def test_values_submitted_within_an_interval_are_coalesced():
+    async def main():
+        write = Recorder()
+        writer = CoalescingWriter(write, interval_s=0.05)
+        for i in range(5):
+            writer.submit(i)
+        await asyncio.sleep(0.01)
+        for i in range(5, 10):
+            writer.submit(i)
+        await asyncio.sleep(0.1)
+        return write.values, writer.writes
+
+    values, writes = asyncio.run(main())
+    assert values == [4, 9]
+    assert writes == 2
+
+
+def test_one_write_at_a_time():
+    async def main():
+        write = Recorder(delay=0.03)
+        writer = CoalescingWriter(write, interval_s=0)
+        for i in range(10):
+            writer.submit(i)
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.1)
+        return write
+
+    write = asyncio.run(main())
+    assert write.max_running == 1
+    assert write.values[-1] == 9
+
+
+def test_close_drops_a_pending_write():
+    async def main():
+        write = Recorder()
+        writer = CoalescingWriter(write, interval_s=10)
+        writer.submit('first')
+        await asyncio.sleep(0.01)
+        writer.submit('second')
+        await writer.close()
+        writer.submit('third')
+        await asyncio.sleep(0.01)
+        return write.values, writer.task
+
+    values, task = asyncio.run(main())
+    assert values == ['first']
+    assert task is None
+
+
+def test_close_waits_for_a_running_write():
+    async def main():
+        write = Recorder(delay=0.05)
+        writer = CoalescingWriter(write, interval_s=0)
+        writer.submit('partial')
+        await asyncio.sleep(0.01)
+        assert write.running == 1
+        await writer.close()
+        # The final write happens after close, it must not race the partial one
+        values_at_close = list(write.values)
+        await write('final')
+        return values_at_close, write.values
+
+    values_at_close, values = asyncio.run(main())
+    assert values_at_close == ['partial']
+    assert values == ['partial', 'final']
+
+
+def test_failed_write_does_not_stop_later_writes():
+    async def main():
+        write = Recorder(fail=True)
+        writer = CoalescingWriter(write, interval_s=0)
+        writer.submit(1)
+        await asyncio.sleep(0.01)
+        write.fail = False
+        writer.submit(2)
+        await asyncio.sleep(0.01)
+        return write.values
+
+    assert asyncio.run(main()) == [2]
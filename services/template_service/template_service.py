@@ -4,7 +4,8 @@ import os
 import sys
 import logging
 import uuid
-from typing import List
+from collections import OrderedDict
+from typing import Dict, List
 
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if parent_dir not in sys.path:
@@ -12,8 +13,9 @@ if parent_dir not in sys.path:
 
 from common.nats_client import NATSClient
 # from common.models import JSONEncoder, TranscriptTemplate
-from common.edgedb_client import EdgedbClient, DataclassEncoder
+from common.edgedb_client import EdgedbClient
 from common.token_utils import TokenValidator
+from common.metrics import Metrics
 
 from common.queries.templates.template_create_async_edgeql import template_create, TemplateCreateResult as TranscriptTemplate 
 from common.queries.templates.template_read_async_edgeql import template_read
@@ -39,6 +41,10 @@ class TemplateService:
     SUBJECT_SHARE = 'template.share'
     STREAM_NAME = 'precepto_template_service'
     STREAM_LISTEN_SUBJECT = ["precepto.template.*"]
+    # Broadcast after a write so every replica drops the user's cached template list
+    SUBJECT_CHANGED = 'template.changed'
+    CACHE_SIZE = int(os.environ.get('TEMPLATE_CACHE_SIZE', 1000))
+    DEFAULT_TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), 'default_template.json')
 
     def __init__(self):
         self.logger = logging.getLogger(self.__class__.__name__)
@@ -49,11 +55,25 @@ class TemplateService:
             secret_key=os.environ.get('JWT_SECRET'),
             algorithm='HS256'
         )
+        self.metrics = Metrics('template')
+        self.token_validator.register_metrics(self.metrics)
+        # user id -> template_read_all result, least recently used first
+        self.template_cache: 'OrderedDict[str, list]' = OrderedDict()
+        # Bumped on every invalidation, so a read that raced with a write is not cached
+        self.cache_generation: Dict[str, int] = {}
+        self.metrics.gauge('template_cache_size', lambda: len(self.template_cache))
+        # Read and validated once, it only changes with a deploy
+        with open(self.DEFAULT_TEMPLATE_PATH, 'r', encoding='utf-8') as file:
+            self.default_template = file.read()
+        json.loads(self.default_template)
 
     async def connect(self):
         try:
             await self.nats_client.connect()
             await self.nats_client.create_stream(self.STREAM_NAME, self.STREAM_LISTEN_SUBJECT)
+            await self.token_validator.subscribe_revocations(self.nats_client)
+            await self.metrics.serve(self.nats_client)
+            await self.nats_client.subscribe(self.SUBJECT_CHANGED, self.handle_templates_changed)
             self.logger.info("Connected to NATS and created stream")
         except Exception as e:
             self.logger.error(f"Failed to set up NATSClient: {e}")
@@ -78,6 +98,7 @@ class TemplateService:
             del template_data['id']
 
             result = await template_create(self.client, **template_data, user_id=user_id)
+            await self.templates_changed(user_id)
             # template.id = result.inserted_id
             print("template after create",result)
             response = {
@@ -85,13 +106,13 @@ class TemplateService:
                 # 'template': template.model_dump(by_alias=True)
                 'template': result
             }
-            await msg.respond(json.dumps(response, cls=DataclassEncoder).encode())
+            await self.nats_client.respond(msg, response)
             self.logger.info(f"Template created by user '{user_id}'")
 
         except Exception as e:
             self.logger.error(f"Create template error: {e}")
             response = {'status': 'error', 'message': str(e)}
-            await msg.respond(json.dumps(response).encode())
+            await self.nats_client.respond(msg, response)
 
     async def handle_get_template(self, msg):
         try:
@@ -114,17 +135,48 @@ class TemplateService:
                 'status': 'success',
                 'template': template_doc, #template.model_dump(by_alias=True)
             }
-            await msg.respond(json.dumps(response).encode())
+            await self.nats_client.respond(msg, response)
 
         except Exception as e:
             self.logger.error(f"Get template error: {e}")
             response = {'status': 'error', 'message': str(e)}
-            await msg.respond(json.dumps(response).encode())
+            await self.nats_client.respond(msg, response)
 
     async def load_default_template(self) -> str:
-        template_path = os.path.join(os.path.dirname(__file__), 'default_template.json')
-        with open(template_path, 'r', encoding='utf-8') as file:
-            return file.read()
+        return self.default_template
+
+    async def get_user_templates(self, user_id: str) -> list:
+        """The user's templates, from the cache when no write happened since they were read."""
+        templates = self.template_cache.get(user_id)
+        if templates is not None:
+            self.metrics.increment('template_cache_hits')
+            self.template_cache.move_to_end(user_id)
+            return templates
+
+        self.metrics.increment('template_cache_misses')
+        generation = self.cache_generation.get(user_id, 0)
+        templates = await template_read_all(self.client, user_id=user_id)
+        if self.cache_generation.get(user_id, 0) == generation:
+            self.template_cache[user_id] = templates
+            if len(self.template_cache) > self.CACHE_SIZE:
+                self.template_cache.popitem(last=False)
+        return templates
+
+    def invalidate_user_templates(self, user_id: str):
+        self.template_cache.pop(user_id, None)
+        self.cache_generation[user_id] = self.cache_generation.get(user_id, 0) + 1
+
+    async def templates_changed(self, user_id: str):
+        """Drop the user's cached templates here and, through NATS, in every other replica."""
+        self.invalidate_user_templates(user_id)
+        await self.nats_client.publish(self.SUBJECT_CHANGED, json.dumps({'user_id': user_id}))
+
+    async def handle_templates_changed(self, msg):
+        try:
+            data = json.loads(msg.data.decode())
+            self.invalidate_user_templates(data['user_id'])
+        except Exception as e:
+            self.logger.error(f"Template change notification error: {e}")
 
 
 
@@ -142,12 +194,12 @@ class TemplateService:
                     serialized_templates.append(template_dict)
                 
                 response = {'status': 'success', 'templates': serialized_templates}
-                await msg.respond(json.dumps(response).encode())
+                await self.nats_client.respond(msg, response)
                 
             except Exception as e:
                 self.logger.error(f"Get all templates error: {str(e)}")
                 error_response = {'status': 'error', 'message': str(e)}
-                await msg.respond(json.dumps(error_response).encode())
+                await self.nats_client.respond(msg, error_response)
 
     async def handle_get_all_template(self, msg):
         try:
@@ -167,7 +219,7 @@ class TemplateService:
             # async for doc in self.db.templates_collection.find(query):
             #     template = TranscriptTemplate(**doc)
             #     templates.append(template.model_dump(by_alias=True))
-            templates = await template_read_all(self.client, user_id=user_id)
+            templates = await self.get_user_templates(user_id)
             if not templates:
                 # Create default template without id (MongoDB will generate it)
                 default_template_data = {
@@ -182,8 +234,8 @@ class TemplateService:
                 result = await template_create(self.client, **default_template_data, user_id=user_id)
                 # default_template_data["_id"] = result.inserted_id
                 # templates.append(TranscriptTemplate(**default_template_data).model_dump(by_alias=True))
-            templates = await template_read_all(self.client, user_id=user_id)
-            print("templates pre serilizase")
+                await self.templates_changed(user_id)
+                templates = await self.get_user_templates(user_id)
             # serialized_templates = []
             # for template in templates:
             #     try:
@@ -201,13 +253,13 @@ class TemplateService:
             #     template_dict = self.db.serialize_edgedb_to_json_dict(t)
             response = {'status': 'success', 'templates': templates}
             # await msg.respond(json.dumps(response, cls=JSONEncoder).encode())
-            await msg.respond(json.dumps(response,  cls=DataclassEncoder).encode())
+            await self.nats_client.respond(msg, response)
 
         except Exception as e:
             self.logger.error(f"Get all templates error: {e}")
             response = {'status': 'error', 'message': str(e)}
             # await msg.respond(json.dumps(response, cls=JSONEncoder).encode())
-            await msg.respond(json.dumps(response).encode())
+            await self.nats_client.respond(msg, response)
 
     async def handle_update_template(self, msg):
         try:
@@ -239,18 +291,19 @@ class TemplateService:
             del template_data['shared_with']
             del template_data['id']
             await template_update(self.client, **template_data, id=template_doc.id)
+            await self.templates_changed(user_id)
             template_new = await template_read(self.client, id=template_doc.id)
             response = {
                 'status': 'success',
                 'template': template_new,
                 # 'template': updated_template.model_dump(by_alias=True)
             }
-            await msg.respond(json.dumps(response, cls=DataclassEncoder).encode())
+            await self.nats_client.respond(msg, response)
 
         except Exception as e:
             self.logger.error(f"Update template error: {e}")
             response = {'status': 'error', 'message': str(e)}
-            await msg.respond(json.dumps(response).encode())
+            await self.nats_client.respond(msg, response)
 
     async def handle_delete_template(self, msg):
         try:
@@ -270,13 +323,14 @@ class TemplateService:
 
             # await self.db.templates_collection.delete_one({"_id": template_id})
             await template_delete(self.client, id= template_id)
+            await self.templates_changed(user_id)
             response = {'status': 'success', 'message': 'Template deleted successfully'}
-            await msg.respond(json.dumps(response).encode())
+            await self.nats_client.respond(msg, response)
 
         except Exception as e:
             self.logger.error(f"Delete template error: {e}")
             response = {'status': 'error', 'message': str(e)}
-            await msg.respond(json.dumps(response).encode())
+            await self.nats_client.respond(msg, response)
 
     # async def handle_share_template(self, msg):
     #     try:
@@ -0,0 +1,302 @@
+# services/transcription_service/inference.py
+
+import asyncio
+import logging
+import multiprocessing
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+
+
+def decode_audio(data: bytes, sampling_rate: int = SAMPLING_RATE) -> np.ndarray:
+    """Decode any ffmpeg readable audio to mono float32 PCM through stdin/stdout, without touching disk."""
+    process = subprocess.run(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error',
+         '-i', 'pipe:0',
+         '-f', 'f32le', '-ac', '1', '-ar', str(sampling_rate),
+         'pipe:1'],
+        input=data,
+        capture_output=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Failed to decode audio: {process.stderr.decode(errors='replace')}")
+    return np.frombuffer(process.stdout, dtype=np.float32)
+
+
+async def decode_windows(data: bytes, window_samples: int, step: int,
+                         sampling_rate: int = SAMPLING_RATE) -> AsyncIterator[Tuple[int, np.ndarray]]:
+    """
+    Decode audio through ffmpeg and yield (start sample, window) for overlapping windows
+    of window_samples every step samples, while ffmpeg is still decoding. Only the
+    current window is held, not the PCM of the whole recording. The last window is
+    shorter when it reaches the end of the audio.
+    """
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-f', 'f32le', '-ac', '1', '-ar', str(sampling_rate),
+        'pipe:1',
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+
+    async def feed():
+        try:
+            process.stdin.write(data)
+            await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg gave up on the input, its exit code reports why
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = asyncio.create_task(feed())
+    stderr = asyncio.create_task(process.stderr.read())
+    try:
+        overlap_bytes = (window_samples - step) * 4
+        buffer, start = b'', 0
+        while True:
+            try:
+                buffer += await process.stdout.readexactly(window_samples * 4 - len(buffer))
+                last = False
+            except asyncio.IncompleteReadError as e:
+                buffer += e.partial
+                last = True
+            # After the first window, only yield when there is audio past the previous window
+            if start == 0 or len(buffer) > overlap_bytes:
+                yield start, np.frombuffer(buffer[:len(buffer) - len(buffer) % 4], dtype=np.float32)
+            if last:
+                break
+            buffer, start = buffer[step * 4:], start + step
+
+        await feeder
+        if await process.wait() != 0:
+            raise RuntimeError(f"Failed to decode audio: {(await stderr).decode(errors='replace')}")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        feeder.cancel()
+        stderr.cancel()
+
+
+class TransformersTranscriber:
+    """Hugging Face transformers pipeline backend."""
+
+    def __init__(self, model: str, device: Optional[str] = None):
+        from transformers import pipeline
+        self.pipeline = pipeline("automatic-speech-recognition", model=model, device=device)
+
+    def __call__(self, audio: Any, **kwargs) -> dict:
+        return self.pipeline(audio, **kwargs)
+
+    def transcribe_batch(self, windows: List[np.ndarray], **kwargs) -> List[dict]:
+        inputs = [{'raw': window, 'sampling_rate': SAMPLING_RATE} for window in windows]
+        return self.pipeline(inputs, batch_size=len(inputs), **kwargs)
+
+
+class FasterWhisperTranscriber:
+    """
+    CTranslate2 backend through faster-whisper. Uses BatchedInferencePipeline,
+    which splits the audio on voice activity and decodes the segments in batches.
+    Returns the same {'text', 'chunks': [{'timestamp', 'text'}]} shape as the
+    transformers pipeline, so callers do not care which backend is loaded.
+    """
+
+    def __init__(self, model: str, device: Optional[str] = None, compute_type: str = 'int8',
+                 batch_size: int = 8, cpu_threads: int = 0):
+        from faster_whisper import BatchedInferencePipeline, WhisperModel
+        self.model = WhisperModel(model, device=device or 'cpu', compute_type=compute_type, cpu_threads=cpu_threads)
+        self.pipeline = BatchedInferencePipeline(model=self.model)
+        self.batch_size = batch_size
+
+    def __call__(self, audio: Any, generate_kwargs: Optional[dict] = None, **kwargs) -> dict:
+        generate_kwargs = generate_kwargs or {}
+        if isinstance(audio, dict):
+            # faster-whisper expects 16 kHz samples, which is what the service decodes to
+            audio = audio['raw']
+
+        segments, _ = self.pipeline.transcribe(
+            audio,
+            language=generate_kwargs.get('language'),
+            task=generate_kwargs.get('task', 'transcribe'),
+            beam_size=generate_kwargs.get('num_beams', 5),
+            batch_size=self.batch_size,
+            vad_filter=True,
+        )
+        chunks = [{'timestamp': (segment.start, segment.end), 'text': segment.text} for segment in segments]
+        return {'text': ''.join(chunk['text'] for chunk in chunks).strip(), 'chunks': chunks}
+
+    def transcribe_batch(self, windows: List[np.ndarray], **kwargs) -> List[dict]:
+        # BatchedInferencePipeline batches the VAD segments of one input, so the
+        # windows of a scheduler batch are decoded one after the other here
+        return [self(window, **kwargs) for window in windows]
+
+
+TRANSCRIBER_BACKENDS = {
+    'transformers': TransformersTranscriber,
+    'faster_whisper': FasterWhisperTranscriber,
+}
+
+# Loaded once per worker process by the pool initializer
+_transcriber = None
+
+
+def _load_transcriber(backend: str, model: str, options: dict):
+    global _transcriber
+    _transcriber = TRANSCRIBER_BACKENDS[backend](model, **options)
+
+
+def _transcribe(audio: Any, kwargs: dict) -> dict:
+    if isinstance(audio, (bytes, bytearray)):
+        # Decoding in the worker keeps the (much larger) PCM out of the pickle to the pool
+        audio = {'raw': decode_audio(audio), 'sampling_rate': SAMPLING_RATE}
+    return _transcriber(audio, **kwargs)
+
+
+def _transcribe_batch(windows: List[np.ndarray], kwargs: dict) -> List[dict]:
+    return _transcriber.transcribe_batch(windows, **kwargs)
+
+
+class InferenceExecutor:
+    """
+    Runs the Whisper pipeline in a pool of worker processes so inference never
+    blocks the service's event loop. Each worker loads the model once at start-up.
+    At most max_in_flight jobs are handed to the pool at a time, the rest wait
+    on the event loop without holding any worker.
+    """
+
+    def __init__(self, backend: str, model: str, options: Optional[dict] = None,
+                 workers: int = 1, max_in_flight: Optional[int] = None):
+        if backend not in TRANSCRIBER_BACKENDS:
+            raise ValueError(f"Unknown transcriber backend '{backend}', expected one of {list(TRANSCRIBER_BACKENDS)}")
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.workers = workers
+        self.max_in_flight = max_in_flight or workers * 2
+        # Created on first use so it binds to the running loop
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        # spawn, forking a process with torch threads running is not safe
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_load_transcriber,
+            initargs=(backend, model, options or {})
+        )
+
+    async def transcribe(self, audio: Any, **kwargs) -> dict:
+        """Transcribe encoded audio bytes or a {'raw', 'sampling_rate'} PCM input in a worker process."""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, _transcribe, audio, kwargs)
+
+    async def transcribe_batch(self, windows: List[np.ndarray], **kwargs) -> List[dict]:
+        """Transcribe several PCM windows in one forward pass of a worker."""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, _transcribe_batch, windows, kwargs)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class BatchScheduler:
+    """
+    Collects PCM windows from any number of recordings and sends them to the
+    executor as one batch, as soon as max_batch_size windows are waiting or the
+    oldest waiting window has waited max_wait_s. Each caller gets back the result
+    for its own window. Stopping cancels the batches in flight and the windows
+    still waiting, so no caller is left waiting on them.
+    """
+
+    def __init__(self, executor: InferenceExecutor, max_batch_size: int = 8, max_wait_s: float = 0.5, **kwargs):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_s
+        self.kwargs = kwargs
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        # Batches handed to the executor, kept so they are not garbage collected and can be cancelled
+        self.batch_tasks: Set[asyncio.Task] = set()
+        self.windows = 0
+        self.batches = 0
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = list(self.batch_tasks)
+        if self.task is not None:
+            tasks.append(self.task)
+            self.task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Windows submitted but not collected into a batch yet
+        while self.queue is not None and not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            future.cancel()
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.windows / self.batches if self.batches else 0.0
+
+    async def submit(self, window: np.ndarray) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((window, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch: List[Tuple[np.ndarray, asyncio.Future]] = []
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                deadline = loop.time() + self.max_wait_s
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                # The executor bounds how many batches run at once, keep collecting meanwhile
+                task = asyncio.create_task(self._run_batch(batch))
+                self.batch_tasks.add(task)
+                task.add_done_callback(self.batch_tasks.discard)
+                batch = []
+        except asyncio.CancelledError:
+            # The batch being collected when stopped
+            for _, future in batch:
+                future.cancel()
+            raise
+
+    async def _run_batch(self, batch: List[Tuple[np.ndarray, asyncio.Future]]):
+        self.windows += len(batch)
+        self.batches += 1
+        try:
+            results = await self.executor.transcribe_batch([window for window, _ in batch], **self.kwargs)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            self.logger.error(f"Error transcribing batch of {len(batch)} windows: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
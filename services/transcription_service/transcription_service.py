@@ -6,9 +6,11 @@ from datetime import timezone
 import json
 import logging
 import os
+import base64
 import sys
-import subprocess
-from faster_whisper import BatchedInferencePipeline, WhisperModel
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 # Adjust the path to include the parent directory for imports
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if parent_dir not in sys.path:
@@ -18,24 +20,83 @@ from common.nats_client import NATSClient
 from common.edgedb_client import EdgedbClient, DataclassEncoder
 from common.queries.transcriptions.transcript_read_async_edgeql import transcript_read, TranscriptReadResult as TranscriptionMeta
 from common.queries.transcriptions.transcript_update_async_edgeql import  transcript_update
+from common.token_utils import TokenValidator
+from common.metrics import Metrics
+from inference import BatchScheduler, InferenceExecutor, SAMPLING_RATE, decode_audio, decode_windows
 # from common.models import TranscriptionMeta
 
 
-from transformers import pipeline
-
 logging.basicConfig(level=logging.INFO)
 
 logging.getLogger("faster_whisper").setLevel(logging.DEBUG)
 
+class LiveTranscriptionSession:
+    """Rolling PCM buffer and the transcript committed so far for a recording in progress."""
+
+    def __init__(self, recording_id: str):
+        self.recording_id = recording_id
+        self.buffer = np.zeros(0, dtype=np.float32)
+        # Recording time of buffer[0] in seconds
+        self.buffer_offset = 0.0
+        # Committed chunks with absolute timestamps, same shape as the pipeline output
+        self.chunks: List[dict] = []
+        self.chunk_ids = set()
+        self.transcription = None
+        self.invalidated = False
+        self.lock = asyncio.Lock()
+        self.last_activity = time.monotonic()
+
+    @property
+    def text(self) -> str:
+        return ''.join(chunk['text'] for chunk in self.chunks).strip()
+
+    def invalidate(self):
+        self.invalidated = True
+        self.buffer = np.zeros(0, dtype=np.float32)
+
+
 class TranscriptionService:
     TRANSCRIPTIONS_PATH = 'transcriptions'
-    AUDIO_CHUNKS_PATH = 'audio_chunks'
+    SAMPLING_RATE = SAMPLING_RATE
+    GENERATE_KWARGS = {'num_beams': 5, 'task': 'transcribe', 'language': 'no'}
+    # Live mode transcribes audio.chunks while the recording is still running. Every
+    # instance receives every chunk, so only enable it on a single instance
+    LIVE_MODE = os.environ.get('TRANSCRIPTION_LIVE_MODE', 'false') == 'true'
+    LIVE_WINDOW_S = float(os.environ.get('TRANSCRIPTION_LIVE_WINDOW_S', 28))
+    LIVE_OVERLAP_S = float(os.environ.get('TRANSCRIPTION_LIVE_OVERLAP_S', 4))
+    LIVE_FINALIZE_TIMEOUT_S = float(os.environ.get('TRANSCRIPTION_LIVE_FINALIZE_TIMEOUT_S', 10))
+    LIVE_SESSION_TTL_S = float(os.environ.get('TRANSCRIPTION_LIVE_SESSION_TTL_S', 3600))
+    # 'transformers' or 'faster_whisper' (CTranslate2, int8 on CPU by default)
+    BACKEND = os.environ.get('TRANSCRIPTION_BACKEND', 'transformers')
+    DEFAULT_MODELS = {
+        'transformers': 'NbAiLab/nb-whisper-large-distil-turbo-beta',
+        'faster_whisper': 'deepdml/faster-whisper-large-v3-turbo-ct2',
+    }
+    MODEL = os.environ.get('TRANSCRIPTION_MODEL') or DEFAULT_MODELS.get(BACKEND)
+    DEVICE = os.environ.get('TRANSCRIPTION_DEVICE') or None
+    COMPUTE_TYPE = os.environ.get('TRANSCRIPTION_COMPUTE_TYPE', 'int8')
+    BATCH_SIZE = int(os.environ.get('TRANSCRIPTION_BATCH_SIZE', 8))
+    CPU_THREADS = int(os.environ.get('TRANSCRIPTION_CPU_THREADS', 0))
+    # Worker processes, each holding its own copy of the model
+    WORKERS = int(os.environ.get('TRANSCRIPTION_WORKERS', 1))
+    MAX_IN_FLIGHT = int(os.environ.get('TRANSCRIPTION_MAX_IN_FLIGHT', 0)) or None
+    # Recordings this instance pulls from the work queue at the same time
+    MAX_JOBS = int(os.environ.get('TRANSCRIPTION_MAX_JOBS', WORKERS))
+    JOB_ACK_WAIT_S = float(os.environ.get('TRANSCRIPTION_JOB_ACK_WAIT_S', 120))
+    DURABLE_NAME = 'transcription_service'
+    # Full-file pass, recordings are cut into overlapping windows of Whisper's input length
+    WINDOW_S = float(os.environ.get('TRANSCRIPTION_WINDOW_S', 28))
+    WINDOW_OVERLAP_S = float(os.environ.get('TRANSCRIPTION_WINDOW_OVERLAP_S', 4))
+    # Windows of all pending recordings are batched together, up to this size or wait
+    SCHEDULER_BATCH_SIZE = int(os.environ.get('TRANSCRIPTION_SCHEDULER_BATCH_SIZE', 8))
+    SCHEDULER_MAX_WAIT_S = float(os.environ.get('TRANSCRIPTION_SCHEDULER_MAX_WAIT_MS', 500)) / 1000
 
     def __init__(self):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.nats_client = NATSClient()
         self.db = EdgedbClient()
         self.client = self.db.client
+        self.token_validator = TokenValidator()
         # self.transcriber = pipeline('automatic-speech-recognition', model='openai/whisper-base')
         # WhisperModel("deepdml/faster-whisper-large-v3-turbo-ct2", device="cuda", compute_type="float16")
         # model_path = os.path.join('models', 'whisper', 'models', 'whisper-large-v3-ct2', 'model.bin')
@@ -45,17 +106,42 @@ class TranscriptionService:
         # self.model =  WhisperModel("NbAiLab/nb-whisper-large-distil-turbo-beta", device="cuda", compute_type="float16")
         # self.transcriber = BatchedInferencePipeline(model=self.model)
         # self.transcriber = pipeline("automatic-speech-recognition", "NbAiLabBeta/nb-whisper-medium", device="cuda")
-        self.transcriber = pipeline("automatic-speech-recognition", model="NbAiLab/nb-whisper-large-distil-turbo-beta")
+        # self.transcriber = pipeline("automatic-speech-recognition", model="NbAiLab/nb-whisper-large-distil-turbo-beta")
+        self.inference = InferenceExecutor(self.BACKEND, self.MODEL, options=self.backend_options(),
+                                           workers=self.WORKERS, max_in_flight=self.MAX_IN_FLIGHT)
+        self.scheduler = BatchScheduler(self.inference, max_batch_size=self.SCHEDULER_BATCH_SIZE,
+                                        max_wait_s=self.SCHEDULER_MAX_WAIT_S,
+                                        return_timestamps=True, generate_kwargs=self.GENERATE_KWARGS)
         self.object_store = None
+        self.live_sessions: Dict[str, LiveTranscriptionSession] = {}
+        self.metrics = Metrics('transcription')
+        self.token_validator.register_metrics(self.metrics)
+        self.metrics.gauge('recordings_per_hour', self.recordings_per_hour)
+        self.metrics.gauge('scheduler_windows', lambda: self.scheduler.windows)
+        self.metrics.gauge('scheduler_batches', lambda: self.scheduler.batches)
+        self.metrics.gauge('scheduler_average_batch_size', lambda: self.scheduler.average_batch_size)
 
         if not os.path.exists(self.TRANSCRIPTIONS_PATH):
             os.makedirs(self.TRANSCRIPTIONS_PATH)
-        if not os.path.exists(self.AUDIO_CHUNKS_PATH):
-            os.makedirs(self.AUDIO_CHUNKS_PATH)
+
+    def backend_options(self) -> dict:
+        if self.BACKEND == 'faster_whisper':
+            return {
+                'device': self.DEVICE,
+                'compute_type': self.COMPUTE_TYPE,
+                'batch_size': self.BATCH_SIZE,
+                'cpu_threads': self.CPU_THREADS,
+            }
+        return {'device': self.DEVICE}
+
+    def recordings_per_hour(self) -> float:
+        return self.metrics.counters['recordings_completed'] * 3600 / max(self.metrics.uptime_s, 1)
 
     async def connect(self):
         try:
             await self.nats_client.connect()
+            await self.nats_client.create_pipeline_stream()
+            await self.token_validator.subscribe_revocations(self.nats_client)
             # Initialize object store
             js = self.nats_client.nc.jetstream()
             try:
@@ -67,25 +153,8 @@ class TranscriptionService:
             self.logger.error(f"Failed to connect to NATS: {e}")
             raise
 
-    def convert_to_wav(self, input_path, output_path):
-        command = ['ffmpeg', '-y', '-i', input_path, '-ar', '16000', '-ac', '1', output_path]
-        try:
-            subprocess.run(command, check=True)
-            self.logger.info(f"Converted {input_path} to {output_path}")
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"Failed to convert audio file: {e}")
-            raise
-
-    def convert_to_mp3(self, input_path, output_path):
-        command = ['ffmpeg', '-y', '-i', input_path, '-codec:a', 'libmp3lame', '-qscale:a', '2', output_path]
-        try:
-            subprocess.run(command, check=True)
-            self.logger.info(f"Converted {input_path} to {output_path}")
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"Failed to convert audio file to MP3: {e}")
-            raise
-
     async def handle_completed_recording(self, msg):
+        recording_id = None
         try:
             data = json.loads(msg.data.decode())
             transcription_id = data.get('transcription_id')
@@ -93,75 +162,257 @@ class TranscriptionService:
             recording_id = transcription_id
             self.logger.info(f"Processing transcription for recording ID: {recording_id}")
 
-            # Get audio from object store
-            try:
-                obj = await self.object_store.get(f"{recording_id}/combined.mp3")
-                if not obj:
-                    self.logger.error(f"Audio file not found in object store for recording {recording_id}")
+            session = self.live_sessions.pop(recording_id, None)
+            if session is not None and await self.finalize_live_session(session, data.get('chunks')):
+                self.logger.info(f"Using live transcript for recording ID: {recording_id}")
+                result_mp3 = {'text': session.text, 'chunks': session.chunks}
+            else:
+                result_mp3 = await self.transcribe_recording(recording_id)
+                if result_mp3 is None:
                     return
-                
-                # Save temporarily
-                temp_mp3_path = os.path.join(self.AUDIO_CHUNKS_PATH, f"{recording_id}_combined.mp3")
-                with open(temp_mp3_path, 'wb') as f:
-                    f.write(obj.data)
-
-                # Transcribe audio
-                result_mp3 = self.transcriber(temp_mp3_path, chunk_length_s=28, return_timestamps=True, 
-                                          generate_kwargs={'num_beams': 5, 'task': 'transcribe', 'language': 'no'})
-                transcription_text = result_mp3['text']
-                self.save_transcription_mp3(recording_id, result_mp3)
-                # Clean up temporary file
-                # os.remove(temp_mp3_path)
-
-                # Update transcription in database
-                await transcript_update(self.client, 
-                                     id=transcription_id, 
-                                     name=transcription.name,
-                                     transcript=transcription_text, 
-                                     status='not_signed',  
-                                     backend_status='transcription_service', 
-                                     next_backend_step='summarization_service',
-                                     template_id=transcription.template.id,
-                                     backend_updated_at=datetime.datetime.now(timezone.utc))
-
-                # Notify summarization service
-                await self.nats_client.publish('transcription.completed', 
-                                            json.dumps({"transcription_id":transcription_id}))
-                # await self.nats_client.publish('transcription.completed', 
-                #                             json.dumps({"transcription_id":transcription_id}).encode())
-                self.logger.info(f"Transcription completed for recording ID: {recording_id}")
-
-            except Exception as e:
-                self.logger.error(f"Error accessing object store: {e}")
-                raise
+
+            transcription_text = result_mp3['text']
+            self.save_transcription_mp3(recording_id, result_mp3)
+
+            # Update transcription in database
+            await transcript_update(self.client, 
+                                 id=transcription_id, 
+                                 name=transcription.name,
+                                 transcript=transcription_text, 
+                                 status='not_signed',  
+                                 backend_status='transcription_service', 
+                                 next_backend_step='summarization_service',
+                                 template_id=transcription.template.id,
+                                 backend_updated_at=datetime.datetime.now(timezone.utc))
+
+            # Notify summarization service
+            await self.nats_client.js_publish('transcription.completed', 
+                                           json.dumps({"transcription_id":transcription_id}))
+            self.metrics.increment('recordings_completed')
+            # await self.nats_client.publish('transcription.completed', 
+            #                             json.dumps({"transcription_id":transcription_id}).encode())
+            self.logger.info(f"Transcription completed for recording ID: {recording_id}")
 
         except Exception as e:
             self.logger.error(f"Error processing recording {recording_id}: {e}")
             raise
 
+    async def transcribe_recording(self, recording_id: str) -> Optional[dict]:
+        """Full-file pass over the combined recording in the object store."""
+        # Get audio from object store
+        try:
+            obj = await self.object_store.get(f"{recording_id}/combined.mp3")
+            if not obj:
+                self.logger.error(f"Audio file not found in object store for recording {recording_id}")
+                return None
+
+            return await self.transcribe_windows(obj.data)
+
+        except Exception as e:
+            self.logger.error(f"Error accessing object store: {e}")
+            raise
+
+    async def decode_audio(self, data: bytes) -> np.ndarray:
+        return await asyncio.to_thread(decode_audio, data, self.SAMPLING_RATE)
+
+    async def transcribe_audio(self, audio: np.ndarray) -> dict:
+        """Transcribe one window through the batch scheduler."""
+        return await self.scheduler.submit(audio)
+
+    async def transcribe_windows(self, data: bytes) -> dict:
+        """
+        Decode a whole recording into overlapping windows as ffmpeg streams them out,
+        transcribe them through the batch scheduler (where they share batches with
+        other recordings' windows) and stitch the results. At most a scheduler batch
+        of windows per recording is decoded ahead of the transcription. In the overlap,
+        a chunk belongs to the window whose half of the overlap its midpoint falls in.
+        """
+        window_samples = int(self.WINDOW_S * self.SAMPLING_RATE)
+        step = int((self.WINDOW_S - self.WINDOW_OVERLAP_S) * self.SAMPLING_RATE)
+        slots = asyncio.Semaphore(self.SCHEDULER_BATCH_SIZE)
+
+        async def transcribe(window: np.ndarray) -> dict:
+            try:
+                return await self.transcribe_audio(window)
+            finally:
+                slots.release()
+
+        windows: List[Tuple[int, int]] = []
+        tasks: List[asyncio.Task] = []
+        try:
+            async for start, window in decode_windows(data, window_samples, step, self.SAMPLING_RATE):
+                if len(window) == 0:
+                    break
+                await slots.acquire()
+                windows.append((start, len(window)))
+                tasks.append(asyncio.create_task(transcribe(window)))
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if not windows:
+            return {'text': '', 'chunks': []}
+        self.metrics.increment('audio_seconds', (windows[-1][0] + windows[-1][1]) / self.SAMPLING_RATE)
+
+        chunks = []
+        half_overlap = self.WINDOW_OVERLAP_S / 2
+        for i, ((start, length), result) in enumerate(zip(windows, results)):
+            offset = start / self.SAMPLING_RATE
+            window_length = length / self.SAMPLING_RATE
+            owns_from = offset + half_overlap if i > 0 else float('-inf')
+            owns_to = offset + window_length - half_overlap if i < len(windows) - 1 else float('inf')
+            for chunk in result.get('chunks', []):
+                chunk_start, chunk_end = chunk['timestamp']
+                chunk_end = window_length if chunk_end is None else chunk_end
+                if owns_from <= offset + (chunk_start + chunk_end) / 2 < owns_to:
+                    chunks.append({'timestamp': (offset + chunk_start, offset + chunk_end), 'text': chunk['text']})
+
+        return {'text': ''.join(chunk['text'] for chunk in chunks).strip(), 'chunks': chunks}
+
+    async def handle_audio_chunk(self, msg):
+        """Feed a chunk of a recording in progress into its live transcription session."""
+        session = None
+        try:
+            recording_id = msg.headers.get('Recording-ID') if msg.headers else None
+            chunk_id = msg.headers.get('Chunk-ID') if msg.headers else None
+            if not recording_id or not chunk_id:
+                return
+
+            session = self.live_sessions.get(recording_id)
+            if session is None:
+                session = LiveTranscriptionSession(recording_id)
+                self.live_sessions[recording_id] = session
+
+            async with session.lock:
+                if session.invalidated or chunk_id in session.chunk_ids:
+                    return
+                session.chunk_ids.add(chunk_id)
+                session.last_activity = time.monotonic()
+
+                audio = await self.decode_audio(msg.data)
+                session.buffer = np.concatenate([session.buffer, audio])
+                while len(session.buffer) >= self.LIVE_WINDOW_S * self.SAMPLING_RATE:
+                    await self.transcribe_live_window(session)
+                    await self.persist_live_transcript(session)
+
+        except Exception as e:
+            # A gap in the live transcript is worse than a slower full-file pass
+            self.logger.error(f"Error in live transcription, falling back to full pass: {e}")
+            if session is not None:
+                session.invalidate()
+
+    async def handle_recording_edited(self, msg):
+        """Edits and deletes change the audio under a live session, so the full-file pass has to run."""
+        try:
+            data = json.loads(msg.data.decode())
+            session = self.live_sessions.get(data.get('recording_id'))
+            if session is not None:
+                self.logger.info(f"Recording {session.recording_id} edited, dropping live transcript")
+                session.invalidate()
+        except Exception as e:
+            self.logger.error(f"Error handling recording edit: {e}")
+
+    async def transcribe_live_window(self, session: LiveTranscriptionSession, final: bool = False):
+        """
+        Transcribe the head of the buffer and commit everything that ended before the
+        overlap zone. The uncommitted tail is transcribed again with the next window,
+        so words cut at the window edge are stitched from the run that saw them whole.
+        """
+        window_samples = int(self.LIVE_WINDOW_S * self.SAMPLING_RATE)
+        window = session.buffer if final else session.buffer[:window_samples]
+        if len(window) == 0:
+            return
+
+        window_length = len(window) / self.SAMPLING_RATE
+        result = await self.transcribe_audio(window)
+        committed, commit_point = self.stitch_window(result.get('chunks', []), window_length, final)
+
+        for chunk in committed:
+            start, end = chunk['timestamp']
+            end = window_length if end is None else end
+            session.chunks.append({
+                'timestamp': (session.buffer_offset + start, session.buffer_offset + end),
+                'text': chunk['text']
+            })
+
+        session.buffer = session.buffer[int(commit_point * self.SAMPLING_RATE):]
+        session.buffer_offset += commit_point
+
+    def stitch_window(self, chunks: List[dict], window_length: float, final: bool) -> Tuple[List[dict], float]:
+        """Pick the chunks to commit from a window and the window time to advance the buffer to."""
+        if final:
+            return chunks, window_length
+
+        limit = window_length - self.LIVE_OVERLAP_S
+        committed = [
+            chunk for chunk in chunks
+            if chunk['timestamp'][1] is not None and chunk['timestamp'][1] <= limit
+        ]
+        if committed:
+            return committed, committed[-1]['timestamp'][1]
+
+        # Nothing ended before the overlap zone (silence or one long segment),
+        # commit whatever started before it so the buffer always advances
+        committed = [chunk for chunk in chunks if chunk['timestamp'][0] < limit]
+        commit_point = max(
+            (window_length if chunk['timestamp'][1] is None else chunk['timestamp'][1] for chunk in committed),
+            default=limit
+        )
+        return committed, commit_point if commit_point > 0 else limit
+
+    async def persist_live_transcript(self, session: LiveTranscriptionSession):
+        if session.transcription is None:
+            session.transcription = await transcript_read(self.client, id=session.recording_id)
+            if session.transcription is None:
+                return
+
+        await transcript_update(self.client,
+                             id=session.recording_id,
+                             name=session.transcription.name,
+                             transcript=session.text,
+                             status='processing',
+                             backend_status='transcription_service',
+                             next_backend_step='transcription_service',
+                             template_id=session.transcription.template.id,
+                             backend_updated_at=datetime.datetime.now(timezone.utc))
+
+    async def finalize_live_session(self, session: LiveTranscriptionSession, expected_chunks: Optional[int]) -> bool:
+        """Transcribe the tail of a live session. Returns False if the session can not be trusted."""
+        deadline = time.monotonic() + self.LIVE_FINALIZE_TIMEOUT_S
+        while expected_chunks is not None and len(session.chunk_ids) < expected_chunks and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        async with session.lock:
+            if session.invalidated:
+                return False
+            if expected_chunks is not None and len(session.chunk_ids) != expected_chunks:
+                self.logger.warning(
+                    f"Live session {session.recording_id} saw {len(session.chunk_ids)} of {expected_chunks} chunks")
+                return False
+            await self.transcribe_live_window(session, final=True)
+            return True
+
+    def prune_live_sessions(self):
+        now = time.monotonic()
+        for recording_id, session in list(self.live_sessions.items()):
+            if now - session.last_activity > self.LIVE_SESSION_TTL_S:
+                self.logger.info(f"Dropping idle live session for recording {recording_id}")
+                del self.live_sessions[recording_id]
+
     async def handle_transcribe(self, msg):
         try:
             data = json.loads(msg.data.decode())
             payload = await self.token_validator.validate_access_token(data.get('access_token'))
             user_id = payload['user']['id']
             audio_data = data.get('audio_data')
-            
-            # Save temporary audio file
-            temp_audio_path = os.path.join(self.AUDIO_CHUNKS_PATH, f"temp_{user_id}.webm")
-            with open(temp_audio_path, 'wb') as f:
-                f.write(audio_data)
-
-            # Convert to MP3
-            temp_mp3_path = os.path.join(self.AUDIO_CHUNKS_PATH, f"temp_{user_id}.mp3")
-            self.convert_to_mp3(temp_audio_path, temp_mp3_path)
-
-            # Transcribe
-            result = self.transcriber(temp_mp3_path, chunk_length_s=28, return_timestamps=True, 
-                                    generate_kwargs={'num_beams': 5, 'task': 'transcribe', 'language': 'no'})
-            
-            # Clean up temporary files
-            os.remove(temp_audio_path)
-            os.remove(temp_mp3_path)
+            # JSON can not carry raw bytes, accept base64 or a list of byte values
+            if isinstance(audio_data, str):
+                audio_data = base64.b64decode(audio_data)
+            else:
+                audio_data = bytes(audio_data)
+
+            result = await self.transcribe_windows(audio_data)
 
             # Send response
             await msg.respond(json.dumps({
@@ -205,9 +456,18 @@ class TranscriptionService:
                 f.write(f"{start_time}-{end_time}: {transcribed_text}\n")
     async def subscribe(self):
         try:
-            await self.nats_client.subscribe('recording.completed', self.handle_completed_recording)
+            self.scheduler.start()
+            await self.metrics.serve(self.nats_client)
+            await self.nats_client.consume(self.nats_client.PIPELINE_STREAM_NAME, 'recording.completed',
+                                           self.DURABLE_NAME, self.handle_completed_recording,
+                                           max_in_flight=self.MAX_JOBS, ack_wait=self.JOB_ACK_WAIT_S)
             await self.nats_client.subscribe('transcribe', self.handle_transcribe)
             self.logger.info("Subscribed to 'recording.completed' and 'transcribe' subjects")
+            if self.LIVE_MODE:
+                await self.nats_client.subscribe('audio.chunks', self.handle_audio_chunk)
+                await self.nats_client.subscribe('audio.chunks.edit', self.handle_recording_edited)
+                await self.nats_client.subscribe('audio.chunks.delete', self.handle_recording_edited)
+                self.logger.info("Live transcription enabled, subscribed to 'audio.chunks'")
         except Exception as e:
             self.logger.error(f"Subscription error: {e}")
             raise
@@ -220,12 +480,15 @@ class TranscriptionService:
             self.logger.info("TranscriptionService is running.")
             while True:
                 await asyncio.sleep(1)
+                self.prune_live_sessions()
         except KeyboardInterrupt:
             self.logger.info("Shutting down TranscriptionService...")
             await self.close()
 
     async def close(self):
+        await self.scheduler.stop()
         await self.nats_client.close()
+        self.inference.shutdown()
         self.logger.info("TranscriptionService has been shut down.")
 
 if __name__ == '__main__':